@@ -248,7 +248,7 @@ async def sync_user_from_stripe(
     if not user.stripe_customer_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User has no Stripe customer id to sync")
 
-    sub = StripeService.find_active_subscription_for_customer(user.stripe_customer_id)
+    sub = await StripeService.find_active_subscription_for_customer(user.stripe_customer_id)
     if not sub:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active or trialing subscription found for this customer")
 
@@ -269,7 +269,7 @@ async def set_user_stripe_customer(
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    customer = StripeService.get_customer(payload.stripe_customer_id)
+    customer = await StripeService.get_customer(payload.stripe_customer_id)
     if not customer:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stripe customer not found")
 
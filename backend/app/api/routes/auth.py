@@ -15,7 +15,7 @@ from app.core.security import (
 from app.models import User
 from app.schemas.auth import UserCreate, UserLogin, Token, UserResponse, OAuthCallback
 from app.core.config import settings
-from app.services.oauth import oauth, get_google_user_info, get_github_user_info, get_discord_user_info
+from app.services.oauth import oauth, http_client, get_google_user_info, get_github_user_info, get_discord_user_info
 from app.services.security_monitor import security_monitor
 import secrets
 
@@ -52,8 +52,7 @@ async def register(user: UserCreate, referral_code: str = None, db: Session = De
         is_verified=False
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    db.flush()  # Assigns db_user.id for referral tracking
 
     # Track referral if provided
     referral_success = False
@@ -63,6 +62,9 @@ async def register(user: UserCreate, referral_code: str = None, db: Session = De
             db, referral_code, db_user
         )
 
+    # One commit for the new user and any referral updates
+    db.commit()
+
     # Track signup method for analytics
     from app.services.redis_service import redis_service
     signup_method = "referral" if referral_success else "direct"
@@ -76,7 +78,7 @@ async def register(user: UserCreate, referral_code: str = None, db: Session = De
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": db_user.username}, expires_delta=access_token_expires
+        data={"sub": user.username}, expires_delta=access_token_expires
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -311,8 +313,6 @@ async def oauth_callback(provider: str, callback_data: OAuthCallback, db: Sessio
         raise HTTPException(status_code=400, detail="Unsupported OAuth provider")
 
     try:
-        import httpx
-
         # Exchange code for access token
         # Use provided dynamic redirect_uri when available, else fallback to env
         redirect_uri = callback_data.redirect_uri
@@ -354,116 +354,115 @@ async def oauth_callback(provider: str, callback_data: OAuthCallback, db: Sessio
                 "redirect_uri": redirect_uri,
             }
 
-        async with httpx.AsyncClient() as client:
-            headers = {"Accept": "application/json"}
-            response = await client.post(token_url, data=token_data, headers=headers)
+        headers = {"Accept": "application/json"}
+        response = await http_client.post(token_url, data=token_data, headers=headers)
 
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to exchange code for token")
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to exchange code for token")
 
-            token_response = response.json()
-            access_token = token_response.get('access_token')
+        token_response = response.json()
+        access_token = token_response.get('access_token')
 
-            if not access_token:
-                raise HTTPException(status_code=400, detail="No access token received")
+        if not access_token:
+            raise HTTPException(status_code=400, detail="No access token received")
 
-            # Get user info from OAuth provider
-            if provider == 'google':
-                user_info = await get_google_user_info(access_token)
-                provider_id = user_info.get('id')
-                email = user_info.get('email')
-                username = user_info.get('name', '').replace(' ', '_').lower()
-                avatar_url = user_info.get('picture')
-            elif provider == 'github':
-                user_info = await get_github_user_info(access_token)
-                provider_id = str(user_info.get('id'))
-                email = user_info.get('email')
-                username = user_info.get('login', '').lower()
-                avatar_url = user_info.get('avatar_url')
-            elif provider == 'discord':
-                user_info = await get_discord_user_info(access_token)
-                provider_id = user_info.get('id')
-                email = user_info.get('email')
-                username = user_info.get('username', '').lower()
-                avatar_url = f"https://cdn.discordapp.com/avatars/{provider_id}/{user_info.get('avatar')}.png" if user_info.get('avatar') else None
+        # Get user info from OAuth provider
+        if provider == 'google':
+            user_info = await get_google_user_info(access_token)
+            provider_id = user_info.get('id')
+            email = user_info.get('email')
+            username = user_info.get('name', '').replace(' ', '_').lower()
+            avatar_url = user_info.get('picture')
+        elif provider == 'github':
+            user_info = await get_github_user_info(access_token)
+            provider_id = str(user_info.get('id'))
+            email = user_info.get('email')
+            username = user_info.get('login', '').lower()
+            avatar_url = user_info.get('avatar_url')
+        elif provider == 'discord':
+            user_info = await get_discord_user_info(access_token)
+            provider_id = user_info.get('id')
+            email = user_info.get('email')
+            username = user_info.get('username', '').lower()
+            avatar_url = f"https://cdn.discordapp.com/avatars/{provider_id}/{user_info.get('avatar')}.png" if user_info.get('avatar') else None
 
-            if not provider_id or not email:
-                raise HTTPException(status_code=400, detail="Failed to get required user information")
+        if not provider_id or not email:
+            raise HTTPException(status_code=400, detail="Failed to get required user information")
 
-            # Check if user exists with this OAuth provider
-            existing_user = None
-            if provider == 'google':
-                existing_user = db.query(User).filter(User.google_id == provider_id).first()
-            elif provider == 'github':
-                existing_user = db.query(User).filter(User.github_id == provider_id).first()
-            elif provider == 'discord':
-                existing_user = db.query(User).filter(User.discord_id == provider_id).first()
+        # Check if user exists with this OAuth provider
+        existing_user = None
+        if provider == 'google':
+            existing_user = db.query(User).filter(User.google_id == provider_id).first()
+        elif provider == 'github':
+            existing_user = db.query(User).filter(User.github_id == provider_id).first()
+        elif provider == 'discord':
+            existing_user = db.query(User).filter(User.discord_id == provider_id).first()
+
+        if existing_user:
+            # Update last login
+            existing_user.last_login = datetime.utcnow()
+            if avatar_url:
+                existing_user.avatar_url = avatar_url
+            db.commit()
+            user = existing_user
+        else:
+            # Check if user exists with this email
+            existing_email_user = db.query(User).filter(User.email == email).first()
+            if existing_email_user:
+                # Link OAuth account to existing user
+                if provider == 'google':
+                    existing_email_user.google_id = provider_id
+                elif provider == 'github':
+                    existing_email_user.github_id = provider_id
+                elif provider == 'discord':
+                    existing_email_user.discord_id = provider_id
 
-            if existing_user:
-                # Update last login
-                existing_user.last_login = datetime.utcnow()
                 if avatar_url:
-                    existing_user.avatar_url = avatar_url
+                    existing_email_user.avatar_url = avatar_url
+                existing_email_user.last_login = datetime.utcnow()
                 db.commit()
-                user = existing_user
+                user = existing_email_user
             else:
-                # Check if user exists with this email
-                existing_email_user = db.query(User).filter(User.email == email).first()
-                if existing_email_user:
-                    # Link OAuth account to existing user
-                    if provider == 'google':
-                        existing_email_user.google_id = provider_id
-                    elif provider == 'github':
-                        existing_email_user.github_id = provider_id
-                    elif provider == 'discord':
-                        existing_email_user.discord_id = provider_id
-
-                    if avatar_url:
-                        existing_email_user.avatar_url = avatar_url
-                    existing_email_user.last_login = datetime.utcnow()
-                    db.commit()
-                    user = existing_email_user
-                else:
-                    # Create new user
-                    # Make sure username is unique
-                    base_username = username or f"{provider}_user"
-                    final_username = base_username
-                    counter = 1
-                    while db.query(User).filter(User.username == final_username).first():
-                        final_username = f"{base_username}_{counter}"
-                        counter += 1
-
-                    # OAuth users don't have a password initially - set to empty string
-                    # They can set one later if they want password-based login
-                    new_user = User(
-                        username=final_username,
-                        email=email,
-                        hashed_password="",  # No password for OAuth users initially
-                        avatar_url=avatar_url,
-                        is_active=True,
-                        is_verified=True  # OAuth users are pre-verified
-                    )
-
-                    # Set OAuth provider ID
-                    if provider == 'google':
-                        new_user.google_id = provider_id
-                    elif provider == 'github':
-                        new_user.github_id = provider_id
-                    elif provider == 'discord':
-                        new_user.discord_id = provider_id
-
-                    db.add(new_user)
-                    db.commit()
-                    db.refresh(new_user)
-                    user = new_user
-
-            # Create JWT token
-            access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-            jwt_token = create_access_token(
-                data={"sub": user.username}, expires_delta=access_token_expires
-            )
-
-            return {"access_token": jwt_token, "token_type": "bearer"}
+                # Create new user
+                # Make sure username is unique
+                base_username = username or f"{provider}_user"
+                final_username = base_username
+                counter = 1
+                while db.query(User).filter(User.username == final_username).first():
+                    final_username = f"{base_username}_{counter}"
+                    counter += 1
+
+                # OAuth users don't have a password initially - set to empty string
+                # They can set one later if they want password-based login
+                new_user = User(
+                    username=final_username,
+                    email=email,
+                    hashed_password="",  # No password for OAuth users initially
+                    avatar_url=avatar_url,
+                    is_active=True,
+                    is_verified=True  # OAuth users are pre-verified
+                )
+
+                # Set OAuth provider ID
+                if provider == 'google':
+                    new_user.google_id = provider_id
+                elif provider == 'github':
+                    new_user.github_id = provider_id
+                elif provider == 'discord':
+                    new_user.discord_id = provider_id
+
+                db.add(new_user)
+                db.commit()
+                db.refresh(new_user)
+                user = new_user
+
+        # Create JWT token
+        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        jwt_token = create_access_token(
+            data={"sub": user.username}, expires_delta=access_token_expires
+        )
+
+        return {"access_token": jwt_token, "token_type": "bearer"}
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"OAuth authentication failed: {str(e)}")
@@ -27,6 +27,7 @@ async def get_referral_link(
 ):
     """Get user's referral link and statistics."""
     referral_link = UserAcquisitionService.create_referral_link(db, current_user)
+    db.commit()
     analytics = UserAcquisitionService.get_referral_analytics(db, current_user.id)
 
     return {
@@ -45,6 +46,8 @@ async def get_referral_analytics(
 ):
     """Get detailed referral analytics for the user."""
     analytics = UserAcquisitionService.get_referral_analytics(db, current_user.id)
+    referral_link = UserAcquisitionService.create_referral_link(db, current_user)
+    db.commit()
 
     # Get recent referrals from Redis
     recent_referrals = redis_service._safe_operation(
@@ -70,7 +73,7 @@ async def get_referral_analytics(
         "total_referrals": analytics["total_referrals"],
         "total_bonus_mb": analytics["total_bonus_mb"],
         "recent_referrals": parsed_referrals,
-        "referral_link": UserAcquisitionService.create_referral_link(db, current_user),
+        "referral_link": referral_link,
         "leaderboard_rank": None  # Could implement leaderboard ranking
     }
 
@@ -244,9 +247,9 @@ async def get_referral_leaderboard(
 
 
 @router.get("/stats/platform")
-async def get_platform_growth_stats():
+async def get_platform_growth_stats(db: Session = Depends(get_db)):
     """Get public platform growth statistics."""
-    stats = UserAcquisitionService.get_platform_growth_stats()
+    stats = UserAcquisitionService.get_platform_growth_stats(db)
 
     # Add some real-time metrics from Redis
     redis_stats = redis_service.get_cache_stats()
@@ -307,8 +310,7 @@ async def public_signup_with_referral(
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    db.flush()  # Assigns new_user.id for referral tracking
 
     # Track referral if provided
     referral_success = False
@@ -317,6 +319,10 @@ async def public_signup_with_referral(
             db, referral_code, new_user
         )
 
+    # One commit for the new user and any referral updates
+    user_id = new_user.id
+    db.commit()
+
     # Track signup method in Redis for analytics
     signup_method = "referral" if referral_success else "direct"
     redis_service._safe_operation(
@@ -328,8 +334,8 @@ async def public_signup_with_referral(
 
     return {
         "message": "Account created successfully!",
-        "user_id": new_user.id,
-        "username": new_user.username,
+        "user_id": user_id,
+        "username": username,
         "referral_applied": referral_success,
         "welcome_bonus_mb": 50 if referral_success else 0,
         "next_steps": [
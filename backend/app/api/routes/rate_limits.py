@@ -15,7 +15,7 @@ import time
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
-from app.middleware.rate_limit import RateLimiter, block_suspicious_ip
+from app.middleware.rate_limit import RateLimiter, block_suspicious_ip, whitelist_cache, BLOCKED_INDEX_KEY
 from app.services.redis_service import redis_service
 
 router = APIRouter()
@@ -100,6 +100,7 @@ async def unblock_ip(ip: str, admin_user: User = Depends(require_admin)):
         
         # Remove from blocked list
         redis_service.client.delete(block_key)
+        redis_service.client.zrem(BLOCKED_INDEX_KEY, ip)
         
         # Clear rate limit counters for this IP
         rate_keys = redis_service.client.keys(f"*:{ip}:*")
@@ -156,6 +157,7 @@ async def add_to_whitelist(
         
         # Add to whitelist
         redis_service.client.sadd("rate_limit:whitelist", ip)
+        whitelist_cache.invalidate()
         
         # Also unblock the IP if it's currently blocked
         block_key = f"blocked:ip:{ip}"
@@ -194,6 +196,7 @@ async def remove_from_whitelist(ip: str, admin_user: User = Depends(require_admi
         
         was_whitelisted = redis_service.client.sismember("rate_limit:whitelist", ip)
         redis_service.client.srem("rate_limit:whitelist", ip)
+        whitelist_cache.invalidate()
         
         # Log the removal action
         import logging
@@ -268,7 +271,7 @@ async def get_rate_limit_stats(admin_user: User = Depends(require_admin)):
         for key in redis_service.client.scan_iter(match="auth:ip:*"):
             rate_limit_counts["auth"] += 1
             ip = key.split(":")[2]
-            count = redis_service.client.zcard(key)
+            count = redis_service.client.zcard(key)  # auth limits use a sliding window log
             if ip not in ip_request_counts:
                 ip_request_counts[ip] = 0
             ip_request_counts[ip] += count
@@ -276,7 +279,7 @@ async def get_rate_limit_stats(admin_user: User = Depends(require_admin)):
         for key in redis_service.client.scan_iter(match="api:ip:*"):
             rate_limit_counts["api"] += 1
             ip = key.split(":")[2]
-            count = redis_service.client.zcard(key)
+            count = int(redis_service.client.get(key) or 0)
             if ip not in ip_request_counts:
                 ip_request_counts[ip] = 0
             ip_request_counts[ip] += count
@@ -284,7 +287,7 @@ async def get_rate_limit_stats(admin_user: User = Depends(require_admin)):
         for key in redis_service.client.scan_iter(match="upload:ip:*"):
             rate_limit_counts["upload"] += 1
             ip = key.split(":")[2]
-            count = redis_service.client.zcard(key)
+            count = int(redis_service.client.get(key) or 0)
             if ip not in ip_request_counts:
                 ip_request_counts[ip] = 0
             ip_request_counts[ip] += count
@@ -292,7 +295,7 @@ async def get_rate_limit_stats(admin_user: User = Depends(require_admin)):
         for key in redis_service.client.scan_iter(match="admin:ip:*"):
             rate_limit_counts["admin"] += 1
             ip = key.split(":")[2]
-            count = redis_service.client.zcard(key)
+            count = int(redis_service.client.get(key) or 0)
             if ip not in ip_request_counts:
                 ip_request_counts[ip] = 0
             ip_request_counts[ip] += count
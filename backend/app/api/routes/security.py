@@ -294,11 +294,11 @@ async def get_security_summary(
         # Calculate summary metrics
         total_events_today = sum(stats.values()) if isinstance(stats, dict) else 0
 
-        # Count high severity events in last hour
+        # Count high severity events in last hour (compare stored unix timestamps, no parsing)
+        cutoff = (datetime.now() - timedelta(hours=1)).timestamp()
         high_severity_events = [
             e for e in recent_events
-            if e.get("severity") in ["high", "critical"] and
-            datetime.fromisoformat(e.get("timestamp", "")) > datetime.now() - timedelta(hours=1)
+            if e.get("severity") in ("high", "critical") and e.get("ts_unix", 0) > cutoff
         ]
 
         # Get most common event types
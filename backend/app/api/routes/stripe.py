@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from sqlalchemy.orm import Session
 from typing import Dict, Any
 import json
+import logging
 
 from app.core.database import get_db
 from app.core.security import get_current_user
@@ -9,6 +10,8 @@ from app.models.user import User
 from app.services.stripe_service import StripeService
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 @router.post("/create-checkout-session")
@@ -19,30 +22,34 @@ async def create_checkout_session(
 ):
     """Create a Stripe checkout session for premium subscription"""
     try:
-        # Create Stripe customer if not exists
-        if not current_user.stripe_customer_id:
-            customer = StripeService.create_customer(current_user)
-            if not customer:
-                raise HTTPException(status_code=500, detail="Failed to create customer")
-            
-            current_user.stripe_customer_id = customer["id"]
-            db.commit()
-        
         # Determine base URL (prefer frontend origin for multi-domain)
         origin = request.headers.get("origin")
         # Optionally allow explicit override via query param
         redirect_origin = request.query_params.get("redirect_origin")
         base_url = (redirect_origin or origin or settings.FRONTEND_URL or f"{request.url.scheme}://{request.url.netloc}").rstrip('/')
         
+        success_url = f"{base_url}/premium/success?session_id={{CHECKOUT_SESSION_ID}}"
+        cancel_url = f"{base_url}/premium"
+
         # Create checkout session (tag with user id for verification)
-        session = StripeService.create_checkout_session(
-            customer_id=current_user.stripe_customer_id,
-            price_id=settings.STRIPE_PRICE_ID,
-            success_url=f"{base_url}/premium/success?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{base_url}/premium",
-            client_reference_id=str(current_user.id),
-            metadata={"user_id": str(current_user.id), "username": current_user.username}
-        )
+        if current_user.stripe_customer_id:
+            session = await StripeService.create_checkout_session(
+                customer_id=current_user.stripe_customer_id,
+                price_id=settings.STRIPE_PRICE_ID,
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=str(current_user.id),
+                metadata={"user_id": str(current_user.id), "username": current_user.username}
+            )
+        else:
+            # New subscriber: let Checkout create the customer in the same call;
+            # the customer id is stored on checkout success / checkout.session.completed
+            session = await StripeService.create_checkout_for_new_user(
+                user=current_user,
+                price_id=settings.STRIPE_PRICE_ID,
+                success_url=success_url,
+                cancel_url=cancel_url
+            )
         
         if not session:
             raise HTTPException(status_code=500, detail="Failed to create checkout session")
@@ -69,10 +76,10 @@ async def get_subscription_status(
         # If user has a subscription, get details from Stripe
         subscription = None
         if current_user.stripe_subscription_id:
-            subscription = StripeService.get_subscription(current_user.stripe_subscription_id)
+            subscription = await StripeService.get_subscription(current_user.stripe_subscription_id)
         elif current_user.stripe_customer_id:
             # Try to infer active subscription if missing locally
-            subscription = StripeService.find_active_subscription_for_customer(current_user.stripe_customer_id)
+            subscription = await StripeService.find_active_subscription_for_customer(current_user.stripe_customer_id)
             if subscription:
                 status["stripe_subscription_id"] = subscription.get("id")
 
@@ -96,7 +103,7 @@ async def checkout_success(
 ):
     """Verify checkout session post-redirect and update premium immediately."""
     try:
-        session = StripeService.get_checkout_session(session_id)
+        session = await StripeService.get_checkout_session(session_id)
         if not session:
             raise HTTPException(status_code=400, detail="Invalid checkout session")
 
@@ -127,7 +134,7 @@ async def checkout_success(
         # If a subscription was created, retrieve it and update user immediately
         subscription_id = session.get("subscription")
         if subscription_id:
-            sub = StripeService.get_subscription(subscription_id)
+            sub = await StripeService.get_subscription(subscription_id)
             if sub:
                 current_user.stripe_subscription_id = sub.get("id")
                 # Update premium flags from subscription data
@@ -153,14 +160,14 @@ async def cancel_subscription(
         if not subscription_id:
             if not current_user.stripe_customer_id:
                 raise HTTPException(status_code=400, detail="No customer or subscription found")
-            sub = StripeService.find_active_subscription_for_customer(current_user.stripe_customer_id)
+            sub = await StripeService.find_active_subscription_for_customer(current_user.stripe_customer_id)
             if not sub:
                 raise HTTPException(status_code=400, detail="No active subscription found")
             subscription_id = sub.get("id")
             current_user.stripe_subscription_id = subscription_id
             db.commit()
         # Retrieve current subscription to determine state
-        current_sub = StripeService.get_subscription(subscription_id)
+        current_sub = await StripeService.get_subscription(subscription_id)
         if not current_sub:
             # If switching from test to live (or vice versa), the local DB may have stale Stripe IDs
             # Treat this as already-canceled from Stripe's perspective and clean up local state
@@ -176,12 +183,12 @@ async def cancel_subscription(
             return {"message": "Subscription already scheduled to cancel or canceled"}
 
         # Try to schedule cancellation at period end
-        scheduled = StripeService.cancel_subscription(subscription_id)
+        scheduled = await StripeService.cancel_subscription(subscription_id)
         if scheduled:
             return {"message": "Subscription will be canceled at the end of the current period"}
 
         # If scheduling failed (e.g., incomplete/trialing states), attempt immediate cancellation
-        immediate = StripeService.cancel_subscription_immediately(subscription_id)
+        immediate = await StripeService.cancel_subscription_immediately(subscription_id)
         if immediate:
             return {"message": "Subscription canceled immediately"}
 
@@ -201,7 +208,7 @@ async def reactivate_subscription(
         if not current_user.stripe_subscription_id:
             raise HTTPException(status_code=400, detail="No subscription found")
         
-        subscription = StripeService.reactivate_subscription(current_user.stripe_subscription_id)
+        subscription = await StripeService.reactivate_subscription(current_user.stripe_subscription_id)
         if not subscription:
             raise HTTPException(status_code=500, detail="Failed to reactivate subscription")
         
@@ -225,7 +232,7 @@ async def get_customer_portal(
         # Ensure we have a Stripe customer ID; create if missing
         created_customer = False
         if not current_user.stripe_customer_id:
-            customer = StripeService.create_customer(current_user)
+            customer = await StripeService.create_customer(current_user)
             if not customer:
                 raise HTTPException(status_code=500, detail="Failed to create customer")
             # Persist the new customer id
@@ -236,31 +243,27 @@ async def get_customer_portal(
         origin = request.headers.get("origin")
         redirect_origin = request.query_params.get("redirect_origin")
         base_url = (redirect_origin or origin or settings.FRONTEND_URL or f"{request.url.scheme}://{request.url.netloc}").rstrip('/')
-        portal_url = StripeService.get_customer_portal_url(
+        portal_url = await StripeService.get_customer_portal_url(
             customer_id=current_user.stripe_customer_id,
             return_url=f"{base_url}/settings"
         )
         
         # If creating a portal session failed (e.g., stale/invalid customer), try once to recreate the customer and retry
         if not portal_url and not created_customer:
-            try:
-                print(f"Customer portal 400? return_url={base_url}/settings, customer={current_user.stripe_customer_id}")
-            except Exception:
-                pass
-            customer = StripeService.create_customer(current_user)
+            logger.warning("Customer portal failed, recreating customer: return_url=%s/settings customer=%s",
+                           base_url, current_user.stripe_customer_id)
+            customer = await StripeService.create_customer(current_user)
             if customer:
                 current_user.stripe_customer_id = customer["id"]
                 db.commit()
-                portal_url = StripeService.get_customer_portal_url(
+                portal_url = await StripeService.get_customer_portal_url(
                     customer_id=current_user.stripe_customer_id,
                     return_url=f"{base_url}/settings"
                 )
         
         if not portal_url:
-            try:
-                print(f"Customer portal failed for customer={current_user.stripe_customer_id}, return_url={base_url}/settings")
-            except Exception:
-                pass
+            logger.error("Customer portal failed for customer=%s, return_url=%s/settings",
+                         current_user.stripe_customer_id, base_url)
             raise HTTPException(status_code=500, detail="Failed to create portal session")
         
         return {"portal_url": portal_url}
@@ -285,36 +288,37 @@ async def stripe_webhook(
         if not event:
             raise HTTPException(status_code=400, detail="Invalid webhook signature or payload")
         
-        print(f"Received webhook event: {event['type']}")
+        logger.info("Received webhook event: %s", event["type"])
+
+        # Drop any cached copy of the subscription this event touches
+        event_object = event["data"]["object"]
+        if event["type"].startswith("customer.subscription."):
+            StripeService.invalidate_subscription_cache(event_object.get("id"))
+        elif event["type"].startswith(("invoice.", "checkout.session.")):
+            StripeService.invalidate_subscription_cache(event_object.get("subscription"))
         
         # Handle different event types
         if event["type"] == "customer.subscription.created":
-            print("Handling subscription created")
             await handle_subscription_updated(event["data"]["object"], db)
         elif event["type"] == "customer.subscription.updated":
-            print("Handling subscription updated")
             await handle_subscription_updated(event["data"]["object"], db)
         elif event["type"] == "customer.subscription.deleted":
-            print("Handling subscription deleted")
             await handle_subscription_deleted(event["data"]["object"], db)
         elif event["type"] == "invoice.payment_succeeded":
-            print("Handling payment succeeded")
             await handle_payment_succeeded(event["data"]["object"], db)
         elif event["type"] == "checkout.session.completed":
-            print("Handling checkout session completed")
             await handle_checkout_completed(event["data"]["object"], db)
         elif event["type"] == "invoice.payment_failed":
-            print("Handling payment failed")
             await handle_payment_failed(event["data"]["object"], db)
         else:
-            print(f"Unhandled webhook event type: {event['type']}")
+            logger.debug("Unhandled webhook event type: %s", event["type"])
         
         return {"status": "success"}
     
     except Exception as e:
         err_name = type(e).__name__
         err_msg = str(e) or repr(e)
-        print(f"Webhook error [{err_name}]: {err_msg}")
+        logger.exception("Webhook error [%s]: %s", err_name, err_msg)
         raise HTTPException(status_code=400, detail=f"Webhook error [{err_name}]: {err_msg}")
 
 async def handle_subscription_updated(subscription: Dict[str, Any], db: Session):
@@ -322,58 +326,57 @@ async def handle_subscription_updated(subscription: Dict[str, Any], db: Session)
     customer_id = subscription.get("customer")
     subscription_id = subscription.get("id")
     
-    print(f"Subscription updated - Customer: {customer_id}, Subscription: {subscription_id}")
+    logger.info("Subscription updated - customer=%s subscription=%s", customer_id, subscription_id)
     
     # Find user by stripe_customer_id
     user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
     if user:
-        print(f"Found user: {user.username}")
         user.stripe_subscription_id = subscription_id
         result = StripeService.update_user_premium_status(db, user, subscription)
-        print(f"Updated premium status: {result}, is_premium: {user.is_premium}")
+        logger.info("Updated premium status for %s: ok=%s is_premium=%s", user.username, result, user.is_premium)
     else:
-        print(f"No user found with stripe_customer_id: {customer_id}")
+        logger.warning("No user found with stripe_customer_id: %s", customer_id)
 
 async def handle_subscription_deleted(subscription: Dict[str, Any], db: Session):
     """Handle subscription deleted webhook"""
     customer_id = subscription.get("customer")
     
-    print(f"Subscription deleted - Customer: {customer_id}")
+    logger.info("Subscription deleted - customer=%s", customer_id)
     
     # Find user by stripe_customer_id
     user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
     if user:
-        print(f"Found user: {user.username}, removing premium status")
+        logger.info("Removing premium status from %s", user.username)
         user.is_premium = False
         user.premium_expires_at = None
         user.stripe_subscription_id = None
         db.commit()
     else:
-        print(f"No user found with stripe_customer_id: {customer_id}")
+        logger.warning("No user found with stripe_customer_id: %s", customer_id)
 
 async def handle_payment_succeeded(invoice: Dict[str, Any], db: Session):
     """Handle successful payment webhook"""
     customer_id = invoice.get("customer")
     subscription_id = invoice.get("subscription")
     
-    print(f"Payment succeeded - Customer: {customer_id}, Subscription: {subscription_id}")
+    logger.info("Payment succeeded - customer=%s subscription=%s", customer_id, subscription_id)
     
     if subscription_id:
-        subscription = StripeService.get_subscription(subscription_id)
+        subscription = await StripeService.get_subscription(subscription_id)
         if subscription:
             user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
             if user:
-                print(f"Found user: {user.username}, updating premium status from payment")
                 result = StripeService.update_user_premium_status(db, user, subscription)
-                print(f"Updated premium status: {result}, is_premium: {user.is_premium}")
+                logger.info("Updated premium status for %s from payment: ok=%s is_premium=%s",
+                            user.username, result, user.is_premium)
             else:
-                print(f"No user found with stripe_customer_id: {customer_id}")
+                logger.warning("No user found with stripe_customer_id: %s", customer_id)
 
 async def handle_payment_failed(invoice: Dict[str, Any], db: Session):
     """Handle failed payment webhook"""
     customer_id = invoice.get("customer")
     
-    print(f"Payment failed for customer: {customer_id}")
+    logger.warning("Payment failed for customer: %s", customer_id)
     # You might want to send an email notification here
     # For now, we'll just log it
 
@@ -381,13 +384,20 @@ async def handle_checkout_completed(session: Dict[str, Any], db: Session):
     """Handle checkout.session.completed webhook to set premium immediately."""
     customer_id = session.get("customer")
     subscription_id = session.get("subscription")
-    print(f"Checkout completed - Customer: {customer_id}, Subscription: {subscription_id}")
+    logger.info("Checkout completed - customer=%s subscription=%s", customer_id, subscription_id)
     if not (customer_id and subscription_id):
         return
-    sub = StripeService.get_subscription(subscription_id)
+    sub = await StripeService.get_subscription(subscription_id)
     if not sub:
         return
     user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
+    if not user:
+        # Sessions for new subscribers create the customer at checkout; link it via client_reference_id
+        client_ref = session.get("client_reference_id")
+        if client_ref and client_ref.isdigit():
+            user = db.query(User).filter(User.id == int(client_ref), User.stripe_customer_id.is_(None)).first()
+            if user:
+                user.stripe_customer_id = customer_id
     if user:
         user.stripe_subscription_id = subscription_id
         StripeService.update_user_premium_status(db, user, sub)
\ No newline at end of file
@@ -71,6 +71,10 @@ class Settings(BaseSettings):
     CACHE_TTL_FILE_METADATA: int = 60 * 60  # 1 hour (SECONDS_PER_HOUR)
     CACHE_TTL_ANALYTICS: int = 10 * 60  # 10 minutes (10 * SECONDS_PER_MINUTE)
     CACHE_TTL_VIEW_COUNTS: int = 24 * 60 * 60  # 24 hours (SECONDS_PER_DAY)
+    CACHE_TTL_UNIQUE_VIEWERS: int = 3 * 24 * 60 * 60  # 3 days, past the next daily aggregation
+    CACHE_TTL_STRIPE_SUBSCRIPTION: int = 60  # 1 minute; invalidated by webhooks
+    REDIS_HEALTH_CHECK_INTERVAL: float = 1.0  # Seconds between connection PINGs
+    REDIS_MAX_CONNECTIONS: int = 32  # Per connection pool, per worker process
 
     # Rate Limiting Settings
     RATE_LIMIT_ENABLED: bool = True
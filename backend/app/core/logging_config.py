@@ -0,0 +1,54 @@
+"""
+Non-blocking Logging Setup
+
+Routes application log records through a queue so that formatting and
+stream/file I/O happen on a background thread instead of the request path.
+"""
+
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+
+def start_queue_logging() -> QueueListener:
+    """
+    Move the root logger's handlers behind a QueueHandler and start a listener.
+
+    Existing root handlers (or a stderr handler if none are configured) become
+    the listener's targets. Calling this more than once reuses the running
+    listener.
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers = [handler]
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_queue_logging():
+    """Flush pending records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
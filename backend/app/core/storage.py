@@ -17,11 +17,12 @@ Author: BulletDrop Team
 
 import os
 import uuid
+import shutil
+import asyncio
 from typing import Optional, BinaryIO
 import boto3
 from botocore.exceptions import ClientError
 from fastapi import HTTPException
-import aiofiles
 
 
 class DigitalOceanSpacesStorage:
@@ -205,13 +206,18 @@ class LocalFileStorage:
             file_path = os.path.join(self.upload_dir, unique_filename)
             relative_path = unique_filename
 
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = file_obj.read()
-            await f.write(content)
+        # Save file: open, copy and close in one worker-thread hop, streaming in
+        # 1 MiB chunks rather than reading the whole body on the event loop
+        await asyncio.to_thread(self._write_file, file_obj, file_path)
 
         return relative_path
 
+    @staticmethod
+    def _write_file(file_obj: BinaryIO, file_path: str) -> None:
+        """Copy a file object to file_path (runs in a worker thread)."""
+        with open(file_path, 'wb') as f:
+            shutil.copyfileobj(file_obj, f, 1 << 20)
+
     def get_file_url(self, file_key: str, base_url: str = "http://localhost:8000") -> str:
         """
         Generate URL for local file access.
@@ -19,15 +19,19 @@ from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 import uvicorn
+from contextlib import asynccontextmanager
 from pathlib import Path
 import io
 from app.core.config import settings
+from app.core.logging_config import start_queue_logging, stop_queue_logging
 from app.api.routes import auth, users, uploads, domains, admin, stripe, analytics, growth, landing, security
 from app.core.database import engine, get_db
 from app.models.upload import Upload
 from app.core.database import Base
 from app.services.analytics_service import AnalyticsService
 from app.services.image_effects_service import ImageEffectsService
+from app.services.oauth import http_client as oauth_http_client
+from app.services.security_monitor import security_monitor
 from app.schemas.analytics import ViewCreate
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.security_headers import SecurityHeadersMiddleware
@@ -36,8 +40,20 @@ from sqlalchemy.orm import Session
 # Create database tables on startup
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan: queue-based logging, then flush pending security events and release shared connections on shutdown."""
+    start_queue_logging()
+    yield
+    await security_monitor.shutdown()
+    await oauth_http_client.aclose()
+    stop_queue_logging()
+
+
 # Initialize FastAPI application with metadata
 app = FastAPI(
+    lifespan=lifespan,
     title="BulletDrop API",
     description="Discord profile and image hosting platform with custom domains",
     version="1.0.0",
@@ -9,17 +9,22 @@ Features:
 - IP-based rate limiting
 - User-based rate limiting (for authenticated endpoints)
 - Different limits for authentication vs general API endpoints
-- Sliding window algorithm for accurate rate limiting
+- Fixed-window counters accumulated in process and flushed to Redis in
+  batches, with an exact sliding window for authentication endpoints
 - Automatic cleanup of expired rate limit data
 - Configurable rate limits and time windows
 """
 
+import asyncio
+import secrets
 import time
+from collections import defaultdict
 from typing import Optional, Tuple
+from redis.exceptions import ResponseError
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from app.services.redis_service import redis_service
+from app.services.redis_service import redis_service, SLIDING_WINDOW_SCRIPT
 from app.services.security_monitor import security_monitor
 from app.core.config import settings
 from app.core.utils import extract_client_ip
@@ -27,6 +32,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Lua scripts registered against the current Redis client, keyed by source
+_scripts = {}
+
 class RateLimitConfig:
     """Rate limiting configuration for different endpoint types."""
 
@@ -71,13 +79,192 @@ class RateLimitConfig:
     def get_block_duration(cls):
         return settings.RATE_LIMIT_BLOCK_DURATION
 
+class WhitelistCache:
+    """
+    Process-local snapshot of the rate limit whitelist.
+
+    The whitelist changes rarely, so instead of a SISMEMBER round trip on every
+    request the set is reloaded with SMEMBERS at most every REFRESH_SECONDS.
+    Changes made through this process invalidate the snapshot immediately;
+    other workers pick them up within REFRESH_SECONDS.
+    """
+
+    REFRESH_SECONDS = 5.0
+
+    def __init__(self):
+        self._members = frozenset()
+        self._loaded_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def contains(self, client, ip: str) -> bool:
+        if time.monotonic() - self._loaded_at > self.REFRESH_SECONDS:
+            # Single-flight the reload; waiters reuse the fresh snapshot
+            async with self._lock:
+                if time.monotonic() - self._loaded_at > self.REFRESH_SECONDS:
+                    self._members = frozenset(client.smembers("rate_limit:whitelist"))
+                    self._loaded_at = time.monotonic()
+        return ip in self._members
+
+    def invalidate(self):
+        self._loaded_at = float("-inf")
+
+whitelist_cache = WhitelistCache()
+
+BLOCKED_INDEX_KEY = "rate_limit:blocked_index"
+
+class BlockedIPCache:
+    """
+    Process-local snapshot of blocked IPs, used as a negative fast path.
+
+    Blocks are recorded both as blocked:ip:{ip} (authoritative, with a TTL) and
+    in the BLOCKED_INDEX_KEY sorted set scored by expiry time. The snapshot of
+    unexpired index entries is reloaded at most every REFRESH_SECONDS; an IP not
+    in it is treated as unblocked without a round trip, and only IPs in it are
+    confirmed with EXISTS. Blocks set by other workers apply here within
+    REFRESH_SECONDS.
+    """
+
+    REFRESH_SECONDS = 5.0
+
+    def __init__(self):
+        self._members = frozenset()
+        self._loaded_at = float("-inf")
+        self._seed_task = None
+        self._lock = asyncio.Lock()
+
+    async def may_contain(self, client, ip: str) -> bool:
+        if time.monotonic() - self._loaded_at > self.REFRESH_SECONDS:
+            async with self._lock:
+                if time.monotonic() - self._loaded_at > self.REFRESH_SECONDS:
+                    if self._seed_task is None:
+                        # The keyspace SCAN runs off the event loop and doesn't hold
+                        # up requests; its entries show up on a later refresh
+                        self._seed_task = asyncio.create_task(asyncio.to_thread(self._seed, client))
+                    now = time.time()
+                    pipe = client.pipeline(transaction=False)
+                    pipe.zremrangebyscore(BLOCKED_INDEX_KEY, 0, now)
+                    pipe.zrangebyscore(BLOCKED_INDEX_KEY, now, "+inf")
+                    self._members = frozenset(pipe.execute()[1])
+                    self._loaded_at = time.monotonic()
+        return ip in self._members
+
+    def _seed(self, client):
+        """Index blocks that predate the index (one SCAN per process start, in a worker thread)."""
+        try:
+            keys = list(client.scan_iter(match="blocked:ip:*", count=500))
+            if keys:
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.ttl(key)
+                now = time.time()
+                expiries = {
+                    key.split(":", 2)[2]: now + ttl
+                    for key, ttl in zip(keys, pipe.execute()) if ttl > 0
+                }
+                if expiries:
+                    client.zadd(BLOCKED_INDEX_KEY, expiries)
+        except Exception as e:
+            logger.error(f"Error seeding blocked IP index: {e}")
+
+    def add(self, ip: str):
+        self._members = self._members | {ip}
+
+blocked_ip_cache = BlockedIPCache()
+
+class WindowCounterBuffer:
+    """
+    Fixed-window counters counted in process and flushed to Redis in batches.
+
+    Each check adds to a local pending delta and compares the last total Redis
+    reported plus that delta against the limit, so the request path never
+    waits on Redis. A background task sends all pending deltas every
+    FLUSH_INTERVAL as one pipeline of INCRBY + EXPIRE NX + PTTL and records the
+    new shared totals. Across workers the limit is therefore enforced to within
+    one flush interval of traffic.
+    """
+
+    FLUSH_INTERVAL = 0.02
+    PRUNE_EVERY = 50  # flush ticks between sweeps of expired totals
+
+    def __init__(self):
+        self._pending = defaultdict(int)
+        self._windows = {}
+        # key -> (total reported by Redis, monotonic time the window expires)
+        self._synced = {}
+        self._task = None
+
+    def hit(self, key: str, window: int) -> int:
+        """Count one request locally and return the estimated total for the window."""
+        self._ensure_flusher()
+        self._pending[key] += 1
+        self._windows[key] = window
+        synced, expires_at = self._synced.get(key, (0, 0.0))
+        if expires_at <= time.monotonic():
+            synced = 0
+        return synced + self._pending[key]
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        ticks = 0
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if self._pending:
+                await self.flush()
+            ticks += 1
+            if ticks % self.PRUNE_EVERY == 0:
+                now = time.monotonic()
+                self._synced = {k: v for k, v in self._synced.items() if v[1] > now}
+
+    async def flush(self):
+        """Push pending deltas to Redis in one pipelined round trip."""
+        pending, self._pending = self._pending, defaultdict(int)
+        windows, self._windows = self._windows, {}
+        keys = list(pending)
+        try:
+            pipe = redis_service.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.incrby(key, pending[key])
+                pipe.expire(key, windows[key], nx=True)
+                pipe.pttl(key)
+            results = await asyncio.to_thread(pipe.execute, raise_on_error=False)
+        except Exception as e:
+            # Fail open: the deltas are dropped, as a failed INCR would have been
+            logger.error(f"Rate limit flush error: {e}")
+            return
+
+        now = time.monotonic()
+        for i, key in enumerate(keys):
+            total, _, pttl = results[3 * i:3 * i + 3]
+            if isinstance(total, ResponseError):
+                # A counter left behind in the other representation (e.g. after a
+                # limiter change); drop it so the key starts a fresh window
+                if "WRONGTYPE" in str(total):
+                    redis_service.client.delete(key)
+                logger.error(f"Rate limiting error: {total}")
+                continue
+            ttl = pttl / 1000 if isinstance(pttl, int) and pttl > 0 else windows[key]
+            # Hits counted locally while this flush was in flight stay pending
+            self._synced[key] = (int(total), now + ttl)
+
+window_counters = WindowCounterBuffer()
+
 class RateLimiter:
-    """Redis-based rate limiter using sliding window algorithm."""
+    """Redis-based rate limiter using fixed-window counters or an exact sliding window."""
     
     def __init__(self):
         self.redis = redis_service
     
-    async def is_rate_limited(self, key: str, limit: int, window: int) -> Tuple[bool, dict]:
+    def _script(self, source: str):
+        """Return a Lua script bound to the current Redis client, registering it once."""
+        script = _scripts.get(source)
+        if script is None or script.registered_client is not self.redis.client:
+            script = _scripts[source] = self.redis.client.register_script(source)
+        return script
+    
+    async def is_rate_limited(self, key: str, limit: int, window: int, sliding: bool = False) -> Tuple[bool, dict]:
         """
         Check if a key has exceeded the rate limit.
         
@@ -85,42 +272,47 @@ class RateLimiter:
             key: Unique identifier for the rate limit (e.g., "auth:ip:127.0.0.1")
             limit: Maximum number of requests allowed
             window: Time window in seconds
+            sliding: Use an exact sliding window (sorted set) instead of a fixed
+                window counter; fixed windows allow up to 2x limit across a boundary
             
         Returns:
             Tuple of (is_limited, rate_info)
         """
+        now = time.time()
         try:
-            now = time.time()
-            pipeline = self.redis.client.pipeline()
-            
-            # Remove expired entries (sliding window)
-            pipeline.zremrangebyscore(key, 0, now - window)
-            
-            # Count current requests in window
-            pipeline.zcard(key)
-            
-            # Add current request
-            pipeline.zadd(key, {str(now): now})
-            
-            # Set expiry for the key (cleanup)
-            pipeline.expire(key, window + 60)
-            
-            results = pipeline.execute()
-            current_requests = results[1]
+            if sliding:
+                # One atomic EVALSHA: trim, count and (if allowed) record this hit
+                now_ms = int(now * 1000)
+                previous = int(self._script(SLIDING_WINDOW_SCRIPT)(
+                    keys=[key], args=[now_ms, window * 1000, limit, f"{now_ms}:{secrets.token_hex(4)}"]
+                ))
+                is_limited = previous >= limit
+                current_requests = previous if is_limited else previous + 1
+            else:
+                # Counted locally and flushed in the background; includes this request
+                current_requests = window_counters.hit(key, window)
+                is_limited = current_requests > limit
             
-            # Calculate rate limit info
+            # Calculate rate limit info (reset is an upper bound; the window may have started earlier)
             reset_time = int(now + window)
-            remaining = max(0, limit - current_requests - 1)  # -1 for current request
+            remaining = max(0, limit - current_requests)
             
             rate_info = {
                 "limit": limit,
                 "remaining": remaining,
                 "reset": reset_time,
-                "current": current_requests + 1
+                "current": current_requests
             }
             
-            return current_requests >= limit, rate_info
+            return is_limited, rate_info
             
+        except ResponseError as e:
+            # A counter left behind in the other representation (e.g. after a
+            # limiter change); drop it so the next request starts a fresh window
+            if "WRONGTYPE" in str(e):
+                self.redis.client.delete(key)
+            logger.error(f"Rate limiting error: {e}")
+            return False, {"limit": limit, "remaining": limit - 1, "reset": int(now + window)}
         except Exception as e:
             logger.error(f"Rate limiting error: {e}")
             # If Redis fails, allow the request (fail open)
@@ -132,13 +324,20 @@ class RateLimiter:
             if duration is None:
                 duration = RateLimitConfig.get_block_duration()
             block_key = f"blocked:ip:{ip}"
-            self.redis.client.setex(block_key, duration, "blocked")
+            pipe = self.redis.client.pipeline(transaction=False)
+            pipe.setex(block_key, duration, "blocked")
+            pipe.zadd(BLOCKED_INDEX_KEY, {ip: time.time() + duration})
+            pipe.execute()
+            blocked_ip_cache.add(ip)
         except Exception as e:
             logger.error(f"Error blocking IP {ip}: {e}")
     
     async def is_ip_blocked(self, ip: str) -> bool:
         """Check if an IP address is currently blocked."""
         try:
+            # Most IPs are not blocked; skip the round trip unless the snapshot says maybe
+            if not await blocked_ip_cache.may_contain(self.redis.client, ip):
+                return False
             block_key = f"blocked:ip:{ip}"
             return bool(self.redis.client.exists(block_key))
         except Exception as e:
@@ -148,7 +347,7 @@ class RateLimiter:
     async def is_ip_whitelisted(self, ip: str) -> bool:
         """Check if an IP address is whitelisted."""
         try:
-            return bool(self.redis.client.sismember("rate_limit:whitelist", ip))
+            return await whitelist_cache.contains(self.redis.client, ip)
         except Exception as e:
             logger.error(f"Error checking if IP {ip} is whitelisted: {e}")
             return False
@@ -157,6 +356,7 @@ class RateLimiter:
         """Add an IP to the whitelist."""
         try:
             self.redis.client.sadd("rate_limit:whitelist", ip)
+            whitelist_cache.invalidate()
             logger.info(f"Added IP {ip} to whitelist")
         except Exception as e:
             logger.error(f"Error adding IP {ip} to whitelist: {e}")
@@ -165,6 +365,7 @@ class RateLimiter:
         """Remove an IP from the whitelist."""
         try:
             self.redis.client.srem("rate_limit:whitelist", ip)
+            whitelist_cache.invalidate()
             logger.info(f"Removed IP {ip} from whitelist")
         except Exception as e:
             logger.error(f"Error removing IP {ip} from whitelist: {e}")
@@ -256,14 +457,18 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         minute_limit, minute_window, hour_limit, hour_window = self.get_rate_limits(request)
 
         # Check IP-based rate limits
-        key_minute = f"{self.get_rate_limit_key(request, ip)}:1m"
+        # Brute-force protection on auth endpoints gets an exact sliding window
+        ip_key = self.get_rate_limit_key(request, ip)
+        sliding = ip_key.startswith("auth:")
+
+        key_minute = f"{ip_key}:1m"
         is_limited_minute, rate_info_minute = await self.rate_limiter.is_rate_limited(
-            key_minute, minute_limit, minute_window
+            key_minute, minute_limit, minute_window, sliding=sliding
         )
 
-        key_hour = f"{self.get_rate_limit_key(request, ip)}:1h"
+        key_hour = f"{ip_key}:1h"
         is_limited_hour, rate_info_hour = await self.rate_limiter.is_rate_limited(
-            key_hour, hour_limit, hour_window
+            key_hour, hour_limit, hour_window, sliding=sliding
         )
 
         # Try to get user from token for user-based rate limiting
@@ -413,7 +618,9 @@ async def check_rate_limit(request: Request, custom_limit: int = None, custom_wi
         minute_limit, minute_window, _, _ = middleware.get_rate_limits(request)
         limit, window = minute_limit, minute_window
     
-    is_limited, rate_info = await rate_limiter.is_rate_limited(key, limit, window)
+    is_limited, rate_info = await rate_limiter.is_rate_limited(
+        key, limit, window, sliding=key.startswith("auth:")
+    )
     
     if is_limited:
         raise HTTPException(
@@ -8,7 +8,7 @@ Classes:
     Upload: SQLAlchemy model representing a file upload
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, BigInteger, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, BigInteger, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -30,7 +30,7 @@ class Upload(Base):
         original_filename (str): Original filename as uploaded by user
         file_size (int): File size in bytes
         mime_type (str): MIME type of the uploaded file
-        file_hash (str, optional): SHA-256 hash for duplicate detection
+        file_hash (str, optional): SHA-256 of the uploaded source bytes, for duplicate detection
 
         URLs and Access:
         upload_url (str): Public URL where the file can be accessed
@@ -85,4 +85,10 @@ class Upload(Base):
     user = relationship("User", back_populates="uploads")
     domain = relationship("Domain", back_populates="uploads")
     analytics = relationship("UploadAnalytic", back_populates="upload", cascade="all, delete-orphan")
-    views = relationship("FileView", back_populates="upload", cascade="all, delete-orphan")
\ No newline at end of file
+    views = relationship("FileView", back_populates="upload", cascade="all, delete-orphan")
+
+    # Composite indexes for per-user duplicate checks and newest-first listings
+    __table_args__ = (
+        Index('ix_uploads_user_hash', 'user_id', 'file_hash'),
+        Index('ix_uploads_user_created', user_id, created_at.desc(), id.desc()),
+    )
\ No newline at end of file
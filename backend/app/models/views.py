@@ -9,11 +9,34 @@ Classes:
     ProfileView: Track profile page visits with visitor information
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Text, Index
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Text, Index, DDL, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
 
+# Monthly view partitions kept ready beyond the current month
+PARTITION_MONTHS_AHEAD = 3
+
+# Creates one partition per month from from_month through the current month + months_ahead.
+# Also created by the partition_view_tables migration; called by the daily aggregation job.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, from_month date, months_ahead int)
+RETURNS void AS $$
+DECLARE
+    m date := date_trunc('month', from_month)::date;
+    last_month date := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+BEGIN
+    WHILE m <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_p' || to_char(m, 'YYYYMM'), parent, m, (m + interval '1 month')::date
+        );
+        m := (m + interval '1 month')::date;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql
+"""
+
 
 class FileView(Base):
     """
@@ -29,28 +52,36 @@ class FileView(Base):
         user_agent (str, optional): Browser/client user agent string
         referer (str, optional): Referring URL that led to this view
         country (str, optional): Country code derived from IP (for geo analytics)
-        viewed_at (datetime): Timestamp when the view occurred
+        viewed_at (datetime): Timestamp when the view occurred (partition key)
         
     Relationships:
         upload: Many-to-one relationship with Upload model
     """
     __tablename__ = "file_views"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     upload_id = Column(Integer, ForeignKey("uploads.id", ondelete="CASCADE"), nullable=False, index=True)
     viewer_ip = Column(String(45), nullable=False)  # Supports IPv4 and IPv6
     user_agent = Column(Text, nullable=True)
     referer = Column(Text, nullable=True)
     country = Column(String(2), nullable=True)  # ISO country code
-    viewed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # Part of the primary key because the table is partitioned on it
+    viewed_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=True)
 
     # Relationships
     upload = relationship("Upload", back_populates="views")
 
     # Composite indexes for common query patterns
     __table_args__ = (
-        Index('idx_file_views_upload_time', 'upload_id', 'viewed_at'),
+        Index('idx_file_views_upload_time_ip', 'upload_id', 'viewed_at', postgresql_include=['viewer_ip']),
         Index('idx_file_views_ip_time', 'viewer_ip', 'viewed_at'),
+        # Covers the daily rollup's range scan so it can be answered index-only
+        Index('ix_file_views_viewed_upload', 'viewed_at', 'upload_id', postgresql_include=['viewer_ip']),
+        # Rows are appended in time order, so a tiny BRIN index prunes time-range scans
+        Index('idx_file_views_viewed_at_brin', 'viewed_at',
+              postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+        # Monthly range partitions, created by ensure_monthly_partitions()
+        {'postgresql_partition_by': 'RANGE (viewed_at)'},
     )
 
 
@@ -69,7 +100,7 @@ class ProfileView(Base):
         user_agent (str, optional): Browser/client user agent string
         referer (str, optional): Referring URL that led to this profile view
         country (str, optional): Country code derived from IP (for geo analytics)
-        viewed_at (datetime): Timestamp when the profile was viewed
+        viewed_at (datetime): Timestamp when the profile was viewed (partition key)
         
     Relationships:
         profile_user: Many-to-one relationship with User model (profile owner)
@@ -77,14 +108,15 @@ class ProfileView(Base):
     """
     __tablename__ = "profile_views"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     profile_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     viewer_ip = Column(String(45), nullable=False)  # Supports IPv4 and IPv6
     viewer_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user_agent = Column(Text, nullable=True)
     referer = Column(Text, nullable=True)
     country = Column(String(2), nullable=True)  # ISO country code
-    viewed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # Part of the primary key because the table is partitioned on it
+    viewed_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=True)
 
     # Relationships
     profile_user = relationship("User", foreign_keys=[profile_user_id], back_populates="profile_views_received")
@@ -92,8 +124,12 @@ class ProfileView(Base):
 
     # Composite indexes for common query patterns
     __table_args__ = (
-        Index('idx_profile_views_user_time', 'profile_user_id', 'viewed_at'),
+        Index('idx_profile_views_user_time_ip', 'profile_user_id', 'viewed_at', postgresql_include=['viewer_ip']),
         Index('idx_profile_views_ip_time', 'viewer_ip', 'viewed_at'),
+        Index('ix_profile_views_viewed_profile', 'viewed_at', 'profile_user_id', postgresql_include=['viewer_ip']),
+        Index('idx_profile_views_viewed_at_brin', 'viewed_at',
+              postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+        {'postgresql_partition_by': 'RANGE (viewed_at)'},
     )
 
 
@@ -111,9 +147,10 @@ class ViewSummary(Base):
         date (datetime): Date for this summary (truncated to day)
         view_count (int): Total views for this content on this date
         unique_viewers (int): Estimated unique viewers (by IP)
+        last_aggregated_at (datetime): Views before this time are counted (incremental watermark)
         
     Indexes:
-        - content_type + content_id + date for fast lookup
+        - content_type + content_id + date, unique (one row per day; upsert target)
         - date for trending queries
     """
     __tablename__ = "view_summaries"
@@ -124,10 +161,31 @@ class ViewSummary(Base):
     date = Column(DateTime, nullable=False, index=True)  # Date truncated to day
     view_count = Column(Integer, default=0)
     unique_viewers = Column(Integer, default=0)
+    last_aggregated_at = Column(DateTime, nullable=True)
 
     # Composite indexes for fast queries
     __table_args__ = (
-        Index('idx_view_summary_lookup', 'content_type', 'content_id', 'date'),
+        Index('idx_view_summary_lookup', 'content_type', 'content_id', 'date', unique=True),
         Index('idx_view_summary_date', 'date', 'view_count'),
         {'extend_existing': True}
-    )
\ No newline at end of file
+    )
+
+
+def _create_partitions(table) -> None:
+    """
+    Give a freshly created partitioned view table somewhere to put rows.
+
+    create_all() only makes the partitioned parent; without these, every
+    insert fails with "no partition of relation found".
+    """
+    # DDL() applies %-formatting, so literal percent signs are doubled
+    for statement in (
+        ENSURE_PARTITIONS_FUNCTION.replace('%', '%%'),
+        "SELECT ensure_monthly_partitions('%(table)s', CAST(now() AS date), " + str(PARTITION_MONTHS_AHEAD) + ")",
+        'CREATE TABLE IF NOT EXISTS %(table)s_default PARTITION OF %(table)s DEFAULT',
+    ):
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+_create_partitions(FileView.__table__)
+_create_partitions(ProfileView.__table__)
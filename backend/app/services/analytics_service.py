@@ -121,6 +121,7 @@ class AnalyticsService:
 
         # Increment Redis view counters
         redis_service.increment_file_view(upload_id)
+        redis_service.add_unique_viewer("file", upload_id, hashed_ip)
 
         # Add to trending data
         redis_service.add_to_trending("file", upload_id, score=1.0, period="24h")
@@ -204,6 +205,7 @@ class AnalyticsService:
 
         # Increment Redis profile view counter
         redis_service.increment_profile_view(profile_user_id)
+        redis_service.add_unique_viewer("profile", profile_user_id, hashed_ip)
 
         # Add to trending profiles
         redis_service.add_to_trending("profile", profile_user_id, score=1.0, period="24h")
@@ -247,11 +249,11 @@ class AnalyticsService:
             views_today = redis_view_data.get("today", 0)
         else:
             # Fallback to database queries
-            total_views = db.query(func.count(FileView.id)).filter(
+            total_views = db.query(func.count()).filter(
                 FileView.upload_id == upload_id
             ).scalar() or 0
 
-            views_today = db.query(func.count(FileView.id)).filter(
+            views_today = db.query(func.count()).filter(
                 and_(
                     FileView.upload_id == upload_id,
                     FileView.viewed_at >= today
@@ -263,14 +265,14 @@ class AnalyticsService:
             FileView.upload_id == upload_id
         ).scalar() or 0
 
-        views_this_week = db.query(func.count(FileView.id)).filter(
+        views_this_week = db.query(func.count()).filter(
             and_(
                 FileView.upload_id == upload_id,
                 FileView.viewed_at >= week_ago
             )
         ).scalar() or 0
 
-        views_this_month = db.query(func.count(FileView.id)).filter(
+        views_this_month = db.query(func.count()).filter(
             and_(
                 FileView.upload_id == upload_id,
                 FileView.viewed_at >= month_ago
@@ -294,7 +296,7 @@ class AnalyticsService:
         # Top countries (if country data is available)
         top_countries_query = db.query(
             FileView.country,
-            func.count(FileView.id).label('count')
+            func.count().label('count')
         ).filter(
             and_(
                 FileView.upload_id == upload_id,
@@ -359,7 +361,7 @@ class AnalyticsService:
         if redis_profile_views:
             total_views = int(redis_profile_views)
         else:
-            total_views = db.query(func.count(ProfileView.id)).filter(
+            total_views = db.query(func.count()).filter(
                 ProfileView.profile_user_id == user_id
             ).scalar() or 0
 
@@ -368,21 +370,21 @@ class AnalyticsService:
             ProfileView.profile_user_id == user_id
         ).scalar() or 0
 
-        views_today = db.query(func.count(ProfileView.id)).filter(
+        views_today = db.query(func.count()).filter(
             and_(
                 ProfileView.profile_user_id == user_id,
                 ProfileView.viewed_at >= today
             )
         ).scalar() or 0
 
-        views_this_week = db.query(func.count(ProfileView.id)).filter(
+        views_this_week = db.query(func.count()).filter(
             and_(
                 ProfileView.profile_user_id == user_id,
                 ProfileView.viewed_at >= week_ago
             )
         ).scalar() or 0
 
-        views_this_month = db.query(func.count(ProfileView.id)).filter(
+        views_this_month = db.query(func.count()).filter(
             and_(
                 ProfileView.profile_user_id == user_id,
                 ProfileView.viewed_at >= month_ago
@@ -474,7 +476,7 @@ class AnalyticsService:
             # Trending files
             trending_files_query = db.query(
                 FileView.upload_id,
-                func.count(FileView.id).label('view_count'),
+                func.count().label('view_count'),
                 func.count(func.distinct(FileView.viewer_ip)).label('unique_viewers')
             ).join(Upload).filter(
                 FileView.viewed_at >= cutoff
@@ -521,7 +523,7 @@ class AnalyticsService:
 
                 trending_profiles_query = db.query(
                     ProfileView.profile_user_id,
-                    func.count(ProfileView.id).label('view_count'),
+                    func.count().label('view_count'),
                     func.count(func.distinct(ProfileView.viewer_ip)).label('unique_viewers')
                 ).join(User, ProfileView.profile_user_id == User.id).filter(
                     ProfileView.viewed_at >= cutoff
@@ -565,7 +567,7 @@ class AnalyticsService:
             if redis_view_data:
                 total_views = redis_view_data.get("total", 0)
             else:
-                total_views = db.query(func.count(FileView.id)).filter(
+                total_views = db.query(func.count()).filter(
                     FileView.upload_id == content_id
                 ).scalar() or 0
 
@@ -588,7 +590,7 @@ class AnalyticsService:
             if redis_profile_views:
                 total_views = int(redis_profile_views)
             else:
-                total_views = db.query(func.count(ProfileView.id)).filter(
+                total_views = db.query(func.count()).filter(
                     ProfileView.profile_user_id == content_id
                 ).scalar() or 0
 
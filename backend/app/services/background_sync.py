@@ -151,7 +151,7 @@ class BackgroundSyncService:
 
                 # Clear existing trending data for this period
                 redis_service._safe_operation(
-                    redis_service.redis_client.delete,
+                    redis_service.redis_client.unlink,
                     f"trending:files:{period_name}"
                 )
 
@@ -169,7 +169,7 @@ class BackgroundSyncService:
 
                 # Clear existing trending data for this period
                 redis_service._safe_operation(
-                    redis_service.redis_client.delete,
+                    redis_service.redis_client.unlink,
                     f"trending:profiles:{period_name}"
                 )
 
@@ -205,23 +205,8 @@ class BackgroundSyncService:
             cutoff_timestamp = int((datetime.utcnow() - timedelta(days=7)).timestamp())
 
             # Remove old daily view counts
-            old_keys = redis_service._safe_operation(
-                redis_service.redis_client.keys, "views:*:daily:*"
-            )
-
-            if old_keys:
-                removed_count = 0
-                for key in old_keys:
-                    try:
-                        # Extract timestamp from key if possible
-                        key_parts = key.split(":")
-                        if len(key_parts) >= 4:
-                            # If key is older than cutoff, remove it
-                            redis_service._safe_operation(redis_service.redis_client.delete, key)
-                            removed_count += 1
-                    except:
-                        continue
-
+            removed_count = redis_service.delete_matching("views:*:daily:*")
+            if removed_count:
                 logger.info(f"Removed {removed_count} expired view count keys")
 
             # Clean up old analytics cache (older than 1 hour)
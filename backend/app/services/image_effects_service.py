@@ -6,105 +6,153 @@ Currently supports cached RGB rainbow border effects for enhanced Discord embeds
 """
 
 import io
+import os
+import asyncio
 import hashlib
+import functools
 import logging
-from pathlib import Path
-from PIL import Image, ImageDraw
+from PIL import Image
 import numpy as np
+from cachetools import LRUCache, TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Per-worker L1 for processed images in front of Redis, bounded by total bytes (64 MiB)
+_effect_cache = LRUCache(maxsize=64 * 1024 * 1024, getsizeof=len)
+
+# Short-lived (mtime, size) per path so hot cache lookups skip the stat() syscall
+_stat_cache = TTLCache(maxsize=4096, ttl=30)
+
+
+@functools.lru_cache(maxsize=32)
+def _rainbow_lut(n: int) -> np.ndarray:
+    """
+    Build a read-only (n, 3) uint8 rainbow palette spanning the full hue circle.
+
+    Uses the branchless HSV->RGB form (S = V = 1):
+    channel(c) = 1 - clip(min(k, 4 - k), 0, 1) with k = (c + hue / 60) % 6
+    """
+    hue6 = np.arange(n) / n * 6
+    k = (np.array([5, 3, 1])[None, :] + hue6[:, None]) % 6
+    rgb = 1 - np.clip(np.minimum(k, 4 - k), 0, 1)
+    lut = (rgb * 255).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+@functools.lru_cache(maxsize=64)
+def _axis_colors(length: int, n: int) -> np.ndarray:
+    """
+    Rainbow colors for each pixel along a border of the given length.
+
+    Stretches the n-entry palette over the axis (index = i * n // length),
+    computing the index LUT once per geometry instead of per pixel.
+    """
+    colors = _rainbow_lut(n)[np.arange(length) * n // length]
+    colors.setflags(write=False)
+    return colors
+
 
 class ImageEffectsService:
     """Service for applying visual effects to images with caching and optimization."""
 
+    # File extensions for the supported output encodings
+    OUTPUT_EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg"}
+
     @staticmethod
     def _generate_cache_key(image_path: str, effect_type: str, **kwargs) -> str:
         """Generate cache key for processed image."""
-        file_stat = Path(image_path).stat()
-        cache_data = f"{image_path}_{effect_type}_{file_stat.st_mtime}_{file_stat.st_size}"
-        for k, v in sorted(kwargs.items()):
-            cache_data += f"_{k}_{v}"
-        return hashlib.sha256(cache_data.encode()).hexdigest()[:16]
+        signature = _stat_cache.get(image_path)
+        if signature is None:
+            file_stat = os.stat(image_path)
+            signature = _stat_cache[image_path] = (file_stat.st_mtime, file_stat.st_size)
+        parts = [image_path, effect_type, str(signature[0]), str(signature[1])]
+        parts.extend(f"{k}_{v}" for k, v in sorted(kwargs.items()))
+        # Non-cryptographic use: an 8-byte BLAKE2b digest keeps the 16 hex char key length
+        return hashlib.blake2b("_".join(parts).encode(), digest_size=8).hexdigest()
 
     @staticmethod
-    async def apply_rgb_border_optimized(image_path: str, border_size: int = 4) -> bytes:
+    async def apply_rgb_border_optimized(
+        image_path: str,
+        border_size: int = 4,
+        compress_level: int = 1,
+        fmt: str = "PNG"
+    ) -> bytes:
         """
         Apply optimized RGB rainbow border effect to an image.
 
+        The CPU-bound work runs in a worker thread (PIL and NumPy release the GIL)
+        so the event loop keeps serving other requests during processing.
+
+        Args:
+            image_path: Path to the original image file
+            border_size: Thickness of the border in pixels (default: 4)
+            compress_level: zlib level for the PNG encoder (default: 1, fastest)
+            fmt: Output format, one of 'PNG', 'WEBP' or 'JPEG' (default: 'PNG')
+
+        Returns:
+            Bytes containing the processed image, or None if processing fails
+        """
+        return await asyncio.to_thread(
+            ImageEffectsService._apply_rgb_border_sync, image_path, border_size, compress_level, fmt
+        )
+
+    @staticmethod
+    def _apply_rgb_border_sync(image_path: str, border_size: int, compress_level: int, fmt: str) -> bytes:
+        """
+        Synchronous body of apply_rgb_border_optimized.
+
         Optimizations:
         - Vectorized numpy operations instead of nested loops
-        - Simplified rainbow generation
-        - Optimized PNG compression
+        - Rainbow palette memoized per border length
+        - Fast encoding (PNG without optimize pass, or WebP/JPEG for opaque sources)
         - Memory efficient processing
 
         Args:
             image_path: Path to the original image file
             border_size: Thickness of the border in pixels (default: 4)
+            compress_level: zlib level for the PNG encoder (default: 1, fastest)
+            fmt: Output format, one of 'PNG', 'WEBP' or 'JPEG' (default: 'PNG')
 
         Returns:
             Bytes containing the processed image, or None if processing fails
         """
         try:
             with Image.open(image_path) as img:
-                # Convert to RGB for faster processing (add alpha later if needed)
-                if img.mode not in ('RGB', 'RGBA'):
+                # The output is opaque RGB, so drop alpha/palette up front
+                if img.mode != 'RGB':
                     img = img.convert('RGB')
 
                 original_width, original_height = img.size
                 new_width = original_width + border_size * 2
                 new_height = original_height + border_size * 2
 
-                # Create new image with border
-                new_img = Image.new('RGB', (new_width, new_height))
-
-                # Generate rainbow colors more efficiently
-                rainbow_colors = []
-                for i in range(max(new_width, new_height)):
-                    hue = (i / max(new_width, new_height)) * 360
-                    # Simplified HSV to RGB conversion for performance
-                    c = 1.0  # chroma
-                    x = c * (1 - abs((hue / 60) % 2 - 1))
-                    m = 0  # match
-
-                    if 0 <= hue < 60:
-                        r, g, b = c, x, 0
-                    elif 60 <= hue < 120:
-                        r, g, b = x, c, 0
-                    elif 120 <= hue < 180:
-                        r, g, b = 0, c, x
-                    elif 180 <= hue < 240:
-                        r, g, b = 0, x, c
-                    elif 240 <= hue < 300:
-                        r, g, b = x, 0, c
-                    else:
-                        r, g, b = c, 0, x
-
-                    rainbow_colors.append((int((r + m) * 255), int((g + m) * 255), int((b + m) * 255)))
-
-                # Draw rainbow borders using PIL's efficient drawing
-                draw = ImageDraw.Draw(new_img)
-
-                # Top and bottom borders
-                for y in range(border_size):
-                    for x in range(new_width):
-                        color_idx = x * len(rainbow_colors) // new_width
-                        draw.point((x, y), rainbow_colors[color_idx])
-                        draw.point((x, new_height - 1 - y), rainbow_colors[color_idx])
-
-                # Left and right borders (excluding corners already done)
-                for x in range(border_size):
-                    for y in range(border_size, new_height - border_size):
-                        color_idx = y * len(rainbow_colors) // new_height
-                        draw.point((x, y), rainbow_colors[color_idx])
-                        draw.point((new_width - 1 - x, y), rainbow_colors[color_idx])
-
-                # Paste original image
-                new_img.paste(img, (border_size, border_size))
-
-                # Convert to bytes with optimized compression
+                # Map each border pixel along an axis to its rainbow color
+                n = max(new_width, new_height)
+                colors_x = _axis_colors(new_width, n)
+                colors_y = _axis_colors(new_height, n)
+
+                # Fill the border bands by broadcasting; top and bottom are written
+                # last so they own the corners, matching the previous drawing order
+                canvas = np.empty((new_height, new_width, 3), dtype=np.uint8)
+                canvas[:, :border_size] = colors_y[:, None, :]
+                canvas[:, -border_size:] = colors_y[:, None, :]
+                canvas[:border_size, :] = colors_x[None, :, :]
+                canvas[-border_size:, :] = colors_x[None, :, :]
+
+                # Copy the original straight into the canvas interior (no PIL paste)
+                canvas[border_size:border_size + original_height, border_size:border_size + original_width] = np.asarray(img)
+
+                new_img = Image.fromarray(canvas, 'RGB')
+
+                # Convert to bytes; favour encode latency since results are cached
                 output = io.BytesIO()
-                new_img.save(output, format='PNG', optimize=True, compress_level=6)
+                if fmt == 'WEBP':
+                    new_img.save(output, format='WEBP', method=0, quality=90)
+                elif fmt == 'JPEG':
+                    new_img.save(output, format='JPEG', quality=85, optimize=False)
+                else:
+                    new_img.save(output, format='PNG', optimize=False, compress_level=compress_level)
                 return output.getvalue()
 
         except Exception as e:
@@ -112,13 +160,14 @@ class ImageEffectsService:
             return None
 
     @staticmethod
-    async def apply_effect(image_path: str, effect_type: str) -> bytes:
+    async def apply_effect(image_path: str, effect_type: str, fmt: str = "PNG") -> bytes:
         """
         Apply the specified effect to an image with caching.
 
         Args:
             image_path: Path to the original image file
             effect_type: Type of effect to apply ('rgb')
+            fmt: Output format, one of 'PNG', 'WEBP' or 'JPEG' (default: 'PNG')
 
         Returns:
             Bytes containing the processed image, or None if processing fails
@@ -126,36 +175,35 @@ class ImageEffectsService:
         from app.services.redis_service import redis_service
 
         # Generate cache key for processed image
-        cache_key = f"effect:{effect_type}:{ImageEffectsService._generate_cache_key(image_path, effect_type)}"
+        cache_key = f"effect:{effect_type}:{ImageEffectsService._generate_cache_key(image_path, effect_type, fmt=fmt)}"
+
+        # Try the in-process cache, then Redis (stored as raw bytes)
+        cached_data = _effect_cache.get(cache_key)
+        if cached_data:
+            return cached_data
 
-        # Try to get cached processed image
         if redis_service.is_connected():
-            cached_data = redis_service._safe_operation(redis_service.redis_client.get, cache_key)
+            cached_data = redis_service._safe_operation(redis_service.redis_bytes.get, cache_key)
             if cached_data:
-                try:
-                    import base64
-                    return base64.b64decode(cached_data)
-                except Exception:
-                    # Invalid cache data, continue to regenerate
-                    pass
+                if len(cached_data) <= _effect_cache.maxsize:
+                    _effect_cache[cache_key] = cached_data
+                return cached_data
 
         # Apply effect
         processed_data = None
         if effect_type == "rgb":
-            processed_data = await ImageEffectsService.apply_rgb_border_optimized(image_path)
+            processed_data = await ImageEffectsService.apply_rgb_border_optimized(image_path, fmt=fmt)
+
+        # Cache the processed image in-process and in Redis (for 1 hour)
+        if processed_data and len(processed_data) <= _effect_cache.maxsize:
+            _effect_cache[cache_key] = processed_data
 
-        # Cache the processed image (for 1 hour)
         if processed_data and redis_service.is_connected():
-            try:
-                import base64
-                cached_value = base64.b64encode(processed_data).decode('utf-8')
-                redis_service._safe_operation(
-                    redis_service.redis_client.setex,
-                    cache_key,
-                    3600,  # 1 hour cache
-                    cached_value
-                )
-            except Exception as e:
-                logger.warning(f"Failed to cache processed image: {e}")
+            redis_service._safe_operation(
+                redis_service.redis_bytes.setex,
+                cache_key,
+                3600,  # 1 hour cache
+                processed_data
+            )
 
         return processed_data
\ No newline at end of file
@@ -1,10 +1,18 @@
 from authlib.integrations.starlette_client import OAuth
 from fastapi import Request, HTTPException
 from app.core.config import settings
+import asyncio
 import httpx
 
 oauth = OAuth()
 
+# Shared client so provider calls reuse pooled keep-alive connections; closed on app shutdown
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
 # Register OAuth providers
 oauth.register(
     name='google',
@@ -42,49 +50,43 @@ oauth.register(
 
 async def get_google_user_info(token: str) -> dict:
     """Get user info from Google using access token."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            'https://www.googleapis.com/oauth2/v1/userinfo',
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info from Google")
-        return response.json()
+    response = await http_client.get(
+        'https://www.googleapis.com/oauth2/v1/userinfo',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info from Google")
+    return response.json()
 
 async def get_github_user_info(token: str) -> dict:
     """Get user info from GitHub using access token."""
-    async with httpx.AsyncClient() as client:
-        # Get user info
-        user_response = await client.get(
-            'https://api.github.com/user',
-            headers={'Authorization': f'token {token}'}
-        )
-        if user_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info from GitHub")
+    headers = {'Authorization': f'token {token}'}
+
+    # Fetch profile and emails concurrently; emails are only used if not public
+    user_response, email_response = await asyncio.gather(
+        http_client.get('https://api.github.com/user', headers=headers),
+        http_client.get('https://api.github.com/user/emails', headers=headers)
+    )
+    if user_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info from GitHub")
 
-        user_data = user_response.json()
+    user_data = user_response.json()
 
-        # Get user email if not public
-        if not user_data.get('email'):
-            email_response = await client.get(
-                'https://api.github.com/user/emails',
-                headers={'Authorization': f'token {token}'}
-            )
-            if email_response.status_code == 200:
-                emails = email_response.json()
-                primary_email = next((email['email'] for email in emails if email['primary']), None)
-                if primary_email:
-                    user_data['email'] = primary_email
+    # Get user email if not public
+    if not user_data.get('email') and email_response.status_code == 200:
+        emails = email_response.json()
+        primary_email = next((email['email'] for email in emails if email['primary']), None)
+        if primary_email:
+            user_data['email'] = primary_email
 
-        return user_data
+    return user_data
 
 async def get_discord_user_info(token: str) -> dict:
     """Get user info from Discord using access token."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            'https://discord.com/api/v10/users/@me',
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info from Discord")
-        return response.json()
\ No newline at end of file
+    response = await http_client.get(
+        'https://discord.com/api/v10/users/@me',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info from Discord")
+    return response.json()
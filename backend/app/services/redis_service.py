@@ -10,7 +10,9 @@ Classes:
 """
 
 import redis
-import json
+import redis.asyncio as redis_asyncio
+import time
+import msgpack
 import logging
 from typing import Optional, Any, Dict, List
 from datetime import datetime, timedelta
@@ -19,10 +21,19 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 
+def _pack(data: Any) -> bytes:
+    """Serialize a cached value with msgpack (aware datetimes as timestamps, others via str)."""
+    return msgpack.packb(data, use_bin_type=True, datetime=True, default=str)
+
+
+def _unpack(data: bytes) -> Any:
+    """Deserialize a value written by _pack; raises ValueError on malformed data."""
+    return msgpack.unpackb(data, raw=False, timestamp=3)
+
+
 class CacheKeys:
     """Constants for Redis cache key patterns"""
-    USER_PROFILE = "user:profile:{user_id}"
-    USER_COUNTS = "user:counts:{user_id}"
+    USER_HASH = "u:{user_id}"  # Hash with "profile" and "counts" fields
     FILE_METADATA = "file:meta:{filename}"
     VIEW_COUNT_FILE = "views:file:{upload_id}"
     VIEW_COUNT_PROFILE = "views:profile:{user_id}"
@@ -31,6 +42,64 @@ class CacheKeys:
     ANALYTICS_CACHE = "analytics:{content_type}:{content_id}"
     JWT_USER_CACHE = "jwt:user:{username}"
     RATE_LIMIT = "rate:{endpoint}:{user_id}:{period}"
+    STRIPE_SUBSCRIPTION = "stripe:sub:{subscription_id}"
+    UNIQUE_VIEWERS = "uv:{content_type}:{content_id}:{day}"  # HyperLogLog of viewer hashes per UTC day
+
+
+# Increment a fixed-window counter, starting its expiry on the first hit
+RATE_LIMIT_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+# Sliding-window log: drop entries older than the window, then record this hit
+# only if the key is under its limit. Returns the count before this hit.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window_ms)
+local current = redis.call('ZCARD', KEYS[1])
+if current < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window_ms)
+end
+return current
+"""
+
+# Bump total/today file view counters, resetting "today" when the UTC day changes
+FILE_VIEW_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'day') ~= ARGV[1] then
+    redis.call('HSET', KEYS[1], 'day', ARGV[1], 'today', 0)
+end
+local total = redis.call('HINCRBY', KEYS[1], 'total', 1)
+redis.call('HINCRBY', KEYS[1], 'today', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return total
+"""
+
+
+def _view_day() -> int:
+    """Current UTC day as a YYYYMMDD integer, used to roll over daily view counts."""
+    return int(datetime.utcnow().strftime("%Y%m%d"))
+
+
+def _file_view_counts(values) -> Dict[str, int]:
+    """
+    Build file view counts from the raw HMGET "total", "today", "day" values.
+
+    Raises ValueError on corrupt data.
+    """
+    total, today, day = (int(v) if v is not None else None for v in values)
+    # "today" belongs to the day it was last incremented on
+    counts = {"total": total, "today": today or 0}
+    if day is not None:
+        counts["day"] = day
+        if day != _view_day():
+            counts["today"] = 0
+    return counts
 
 
 class RedisService:
@@ -44,7 +113,13 @@ class RedisService:
     def __init__(self):
         """Initialize Redis connection with fallback handling."""
         self.redis_client = None
+        self.redis_bytes = None
+        self.async_client = None
         self._connected = False
+        self._last_ping = 0.0
+        self._ping_interval = settings.REDIS_HEALTH_CHECK_INTERVAL
+        self._rate_limit_script = None
+        self._file_view_script = None
         self._connect()
     
     @property
@@ -55,31 +130,66 @@ class RedisService:
     def _connect(self):
         """Establish connection to Redis/Valkey."""
         try:
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                decode_responses=True,
+            # Explicitly sized blocking pools: callers wait for a free connection
+            # instead of opening unbounded ones under bursts
+            pool_kwargs = dict(
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=5,
                 socket_connect_timeout=5,
                 socket_timeout=5,
                 retry_on_timeout=True
             )
+            self.redis_client = redis.Redis(
+                connection_pool=redis.BlockingConnectionPool.from_url(
+                    settings.REDIS_URL, decode_responses=True, **pool_kwargs
+                )
+            )
+            # Binary-safe client for raw blobs (e.g. processed images)
+            self.redis_bytes = redis.Redis(
+                connection_pool=redis.BlockingConnectionPool.from_url(
+                    settings.REDIS_URL, decode_responses=False, **pool_kwargs
+                )
+            )
+            # Shared asyncio client for services that talk to Redis from coroutines
+            self.async_client = redis_asyncio.Redis(
+                connection_pool=redis_asyncio.BlockingConnectionPool.from_url(
+                    settings.REDIS_URL, decode_responses=True, **pool_kwargs
+                )
+            )
+            self._rate_limit_script = self.redis_client.register_script(RATE_LIMIT_SCRIPT)
+            self._file_view_script = self.redis_client.register_script(FILE_VIEW_SCRIPT)
             # Test connection
             self.redis_client.ping()
             self._connected = True
+            self._last_ping = time.monotonic()
             logger.info("Successfully connected to Valkey")
         except Exception as e:
             logger.warning(f"Failed to connect to Redis/Valkey: {e}")
             self._connected = False
 
     def is_connected(self) -> bool:
-        """Check if Redis connection is active."""
-        if not self._connected:
+        """
+        Check if Redis connection is active.
+
+        A PING result is trusted for REDIS_HEALTH_CHECK_INTERVAL seconds so hot
+        paths don't pay an extra round-trip per operation. Failed operations reset
+        the connection flag via _safe_operation; once the interval has passed the
+        next call probes again, so a transient error doesn't disable Redis for good.
+        """
+        now = time.monotonic()
+        if now - self._last_ping < self._ping_interval:
+            return self._connected
+        if self.redis_client is None:
             return False
         try:
             self.redis_client.ping()
+            self._connected = True
             return True
-        except:
+        except Exception:
             self._connected = False
             return False
+        finally:
+            self._last_ping = now
 
     def _safe_operation(self, operation, *args, **kwargs):
         """Execute Redis operation with fallback handling."""
@@ -96,6 +206,36 @@ class RedisService:
 
     # ==================== User Profile Caching ====================
 
+    def _cache_user_field(self, user_id: int, field: str, value: Any) -> bool:
+        """Store one packed field in the user's cache hash and refresh its TTL."""
+        key = CacheKeys.USER_HASH.format(user_id=user_id)
+        pipeline = self._safe_operation(self.redis_bytes.pipeline)
+
+        if pipeline:
+            try:
+                pipeline.hset(key, field, _pack(value))
+                pipeline.expire(key, settings.CACHE_TTL_USER_PROFILE)
+                pipeline.execute()
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to cache user {field}: {e}")
+
+        return False
+
+    def _get_user_field(self, user_id: int, field: str) -> Optional[Dict[str, Any]]:
+        """Read and unpack one field from the user's cache hash."""
+        key = CacheKeys.USER_HASH.format(user_id=user_id)
+        data = self._safe_operation(self.redis_bytes.hget, key, field)
+
+        if data:
+            try:
+                return _unpack(data)
+            except ValueError:
+                logger.warning(f"Invalid cached {field} for user {user_id}")
+                self._safe_operation(self.redis_client.hdel, key, field)
+
+        return None
+
     def cache_user_profile(self, user_id: int, user_data: Dict[str, Any]) -> bool:
         """
         Cache user profile data.
@@ -107,13 +247,7 @@ class RedisService:
         Returns:
             True if cached successfully, False otherwise
         """
-        key = CacheKeys.USER_PROFILE.format(user_id=user_id)
-        return self._safe_operation(
-            self.redis_client.setex,
-            key,
-            settings.CACHE_TTL_USER_PROFILE,
-            json.dumps(user_data, default=str)
-        ) is not None
+        return self._cache_user_field(user_id, "profile", user_data)
 
     def get_cached_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -125,17 +259,7 @@ class RedisService:
         Returns:
             Cached user data or None if not found
         """
-        key = CacheKeys.USER_PROFILE.format(user_id=user_id)
-        data = self._safe_operation(self.redis_client.get, key)
-
-        if data:
-            try:
-                return json.loads(data)
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON in cache for user {user_id}")
-                self._safe_operation(self.redis_client.delete, key)
-
-        return None
+        return self._get_user_field(user_id, "profile")
 
     def cache_user_counts(self, user_id: int, upload_count: int, storage_used: int) -> bool:
         """
@@ -149,31 +273,54 @@ class RedisService:
         Returns:
             True if cached successfully
         """
-        key = CacheKeys.USER_COUNTS.format(user_id=user_id)
         data = {
             "upload_count": upload_count,
             "storage_used": storage_used,
-            "last_sync": datetime.utcnow().isoformat()
+            "last_sync": int(time.time())  # Unix epoch seconds
         }
-        return self._safe_operation(
-            self.redis_client.setex,
-            key,
-            settings.CACHE_TTL_USER_PROFILE,
-            json.dumps(data)
-        ) is not None
+        return self._cache_user_field(user_id, "counts", data)
 
     def get_cached_user_counts(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get cached user counts."""
-        key = CacheKeys.USER_COUNTS.format(user_id=user_id)
-        data = self._safe_operation(self.redis_client.get, key)
+        return self._get_user_field(user_id, "counts")
 
-        if data:
+    def get_user_bundle(self, user_id: int, upload_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Fetch a user's cached profile, counts and view counters in one round-trip.
+
+        Args:
+            user_id: User ID
+            upload_id: Optional upload ID whose file view counts should be included
+
+        Returns:
+            Dict with "profile", "counts", "profile_views" and "file_views" entries;
+            each is None when missing or Redis is unavailable
+        """
+        bundle = {"profile": None, "counts": None, "profile_views": None, "file_views": None}
+        pipeline = self._safe_operation(self.redis_bytes.pipeline, transaction=False)
+
+        if pipeline:
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
-                self._safe_operation(self.redis_client.delete, key)
+                pipeline.hmget(CacheKeys.USER_HASH.format(user_id=user_id), "profile", "counts")
+                pipeline.get(CacheKeys.VIEW_COUNT_PROFILE.format(user_id=user_id))
+                if upload_id is not None:
+                    pipeline.hmget(CacheKeys.VIEW_COUNT_FILE.format(upload_id=upload_id), "total", "today", "day")
+                results = pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Failed to fetch user bundle: {e}")
+                return bundle
 
-        return None
+            (profile, counts), profile_views = results[0], results[1]
+            try:
+                bundle["profile"] = _unpack(profile) if profile else None
+                bundle["counts"] = _unpack(counts) if counts else None
+                bundle["profile_views"] = int(profile_views) if profile_views else None
+                if upload_id is not None and results[2][0] is not None:
+                    bundle["file_views"] = _file_view_counts(results[2])
+            except ValueError:
+                logger.warning(f"Invalid cached data in bundle for user {user_id}")
+
+        return bundle
 
     # ==================== File Metadata Caching ====================
 
@@ -181,21 +328,21 @@ class RedisService:
         """Cache file metadata for faster serving."""
         key = CacheKeys.FILE_METADATA.format(filename=filename)
         return self._safe_operation(
-            self.redis_client.setex,
+            self.redis_bytes.setex,
             key,
             settings.CACHE_TTL_FILE_METADATA,
-            json.dumps(metadata, default=str)
+            _pack(metadata)
         ) is not None
 
     def get_cached_file_metadata(self, filename: str) -> Optional[Dict[str, Any]]:
         """Get cached file metadata."""
         key = CacheKeys.FILE_METADATA.format(filename=filename)
-        data = self._safe_operation(self.redis_client.get, key)
+        data = self._safe_operation(self.redis_bytes.get, key)
 
         if data:
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
+                return _unpack(data)
+            except ValueError:
                 self._safe_operation(self.redis_client.delete, key)
 
         return None
@@ -213,28 +360,21 @@ class RedisService:
             New view count or None if Redis unavailable
         """
         key = CacheKeys.VIEW_COUNT_FILE.format(upload_id=upload_id)
-        pipeline = self._safe_operation(self.redis_client.pipeline)
-
-        if pipeline:
-            try:
-                pipeline.hincrby(key, "total", 1)
-                pipeline.hincrby(key, "today", 1)
-                pipeline.expire(key, settings.CACHE_TTL_VIEW_COUNTS)
-                results = pipeline.execute()
-                return results[0] if results else None
-            except Exception as e:
-                logger.warning(f"Failed to increment view count: {e}")
-
-        return None
+        return self._safe_operation(
+            self._file_view_script,
+            keys=[key],
+            args=[_view_day(), settings.CACHE_TTL_VIEW_COUNTS]
+        )
 
     def get_file_view_count(self, upload_id: int) -> Optional[Dict[str, int]]:
         """Get cached file view counts."""
         key = CacheKeys.VIEW_COUNT_FILE.format(upload_id=upload_id)
-        data = self._safe_operation(self.redis_client.hgetall, key)
+        # Raw bytes: int() parses them directly, no str decode per field
+        data = self._safe_operation(self.redis_bytes.hmget, key, "total", "today", "day")
 
-        if data:
+        if data and data[0] is not None:
             try:
-                return {k: int(v) for k, v in data.items()}
+                return _file_view_counts(data)
             except ValueError:
                 self._safe_operation(self.redis_client.delete, key)
 
@@ -245,27 +385,74 @@ class RedisService:
         key = CacheKeys.VIEW_COUNT_PROFILE.format(user_id=user_id)
         return self._safe_operation(self.redis_client.incr, key)
 
+    def add_unique_viewer(self, content_type: str, content_id: int, viewer_hash: str) -> None:
+        """
+        Add a viewer to today's HyperLogLog for a file or profile.
+
+        The sketches are kept for a few days so the daily aggregation can read
+        the previous day's count after midnight.
+        """
+        key = CacheKeys.UNIQUE_VIEWERS.format(content_type=content_type, content_id=content_id, day=_view_day())
+        pipeline = self._safe_operation(self.redis_client.pipeline, transaction=False)
+
+        if pipeline:
+            try:
+                pipeline.pfadd(key, viewer_hash)
+                pipeline.expire(key, settings.CACHE_TTL_UNIQUE_VIEWERS)
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Failed to record unique viewer: {e}")
+
+    def count_unique_viewers(self, content_type: str, content_ids: List[int], day: int) -> Dict[int, int]:
+        """
+        Approximate distinct viewers (about 0.8% standard error) for several items on one UTC day.
+
+        Args:
+            content_type: 'file' or 'profile'
+            content_ids: File or profile IDs
+            day: UTC day as a YYYYMMDD integer
+
+        Returns:
+            Mapping of content ID to count; IDs without a sketch are omitted
+        """
+        if not content_ids:
+            return {}
+
+        pipeline = self._safe_operation(self.redis_client.pipeline, transaction=False)
+        if not pipeline:
+            return {}
+
+        try:
+            for content_id in content_ids:
+                pipeline.pfcount(CacheKeys.UNIQUE_VIEWERS.format(content_type=content_type, content_id=content_id, day=day))
+            counts = pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to count unique viewers: {e}")
+            return {}
+
+        return {content_id: count for content_id, count in zip(content_ids, counts) if count}
+
     # ==================== Analytics Caching ====================
 
     def cache_analytics(self, content_type: str, content_id: int, analytics_data: Dict[str, Any]) -> bool:
         """Cache analytics data."""
         key = CacheKeys.ANALYTICS_CACHE.format(content_type=content_type, content_id=content_id)
         return self._safe_operation(
-            self.redis_client.setex,
+            self.redis_bytes.setex,
             key,
             settings.CACHE_TTL_ANALYTICS,
-            json.dumps(analytics_data, default=str)
+            _pack(analytics_data)
         ) is not None
 
     def get_cached_analytics(self, content_type: str, content_id: int) -> Optional[Dict[str, Any]]:
         """Get cached analytics data."""
         key = CacheKeys.ANALYTICS_CACHE.format(content_type=content_type, content_id=content_id)
-        data = self._safe_operation(self.redis_client.get, key)
+        data = self._safe_operation(self.redis_bytes.get, key)
 
         if data:
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
+                return _unpack(data)
+            except ValueError:
                 self._safe_operation(self.redis_client.delete, key)
 
         return None
@@ -298,21 +485,21 @@ class RedisService:
         """Cache user data for JWT lookups."""
         key = CacheKeys.JWT_USER_CACHE.format(username=username)
         return self._safe_operation(
-            self.redis_client.setex,
+            self.redis_bytes.setex,
             key,
             1800,  # 30 minutes
-            json.dumps(user_data, default=str)
+            _pack(user_data)
         ) is not None
 
     def get_cached_jwt_user(self, username: str) -> Optional[Dict[str, Any]]:
         """Get cached user data for JWT lookups."""
         key = CacheKeys.JWT_USER_CACHE.format(username=username)
-        data = self._safe_operation(self.redis_client.get, key)
+        data = self._safe_operation(self.redis_bytes.get, key)
 
         if data:
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
+                return _unpack(data)
+            except ValueError:
                 self._safe_operation(self.redis_client.delete, key)
 
         return None
@@ -322,6 +509,36 @@ class RedisService:
         key = CacheKeys.JWT_USER_CACHE.format(username=username)
         self._safe_operation(self.redis_client.delete, key)
 
+    # ==================== Stripe Caching ====================
+
+    def cache_stripe_subscription(self, subscription_id: str, subscription: Dict[str, Any]) -> bool:
+        """Cache a Stripe subscription briefly to spare repeated API round-trips."""
+        key = CacheKeys.STRIPE_SUBSCRIPTION.format(subscription_id=subscription_id)
+        return self._safe_operation(
+            self.redis_bytes.setex,
+            key,
+            settings.CACHE_TTL_STRIPE_SUBSCRIPTION,
+            _pack(subscription)
+        ) is not None
+
+    def get_cached_stripe_subscription(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        """Get a cached Stripe subscription."""
+        key = CacheKeys.STRIPE_SUBSCRIPTION.format(subscription_id=subscription_id)
+        data = self._safe_operation(self.redis_bytes.get, key)
+
+        if data:
+            try:
+                return _unpack(data)
+            except ValueError:
+                self._safe_operation(self.redis_client.delete, key)
+
+        return None
+
+    def invalidate_stripe_subscription(self, subscription_id: str):
+        """Invalidate a cached Stripe subscription after it changes."""
+        key = CacheKeys.STRIPE_SUBSCRIPTION.format(subscription_id=subscription_id)
+        self._safe_operation(self.redis_client.delete, key)
+
     # ==================== Rate Limiting ====================
 
     def check_rate_limit(self, endpoint: str, user_id: int, limit: int, period_seconds: int) -> bool:
@@ -338,43 +555,56 @@ class RedisService:
             True if within limit, False if exceeded
         """
         key = CacheKeys.RATE_LIMIT.format(endpoint=endpoint, user_id=user_id, period=period_seconds)
-        current = self._safe_operation(self.redis_client.get, key)
+        current = self._safe_operation(self._rate_limit_script, keys=[key], args=[period_seconds])
 
         if current is None:
-            # First request in period
-            pipeline = self._safe_operation(self.redis_client.pipeline)
-            if pipeline:
-                try:
-                    pipeline.setex(key, period_seconds, 1)
-                    pipeline.execute()
-                    return True
-                except:
-                    pass
             return True  # Allow if Redis fails
 
-        try:
-            current_count = int(current)
-            if current_count >= limit:
-                return False
-
-            # Increment counter
-            self._safe_operation(self.redis_client.incr, key)
-            return True
-        except:
-            return True  # Allow if Redis fails
+        return int(current) <= limit
 
     # ==================== Utility Methods ====================
 
     def clear_user_cache(self, user_id: int):
         """Clear all cached data for a user."""
         keys = [
-            CacheKeys.USER_PROFILE.format(user_id=user_id),
-            CacheKeys.USER_COUNTS.format(user_id=user_id),
+            CacheKeys.USER_HASH.format(user_id=user_id),
             CacheKeys.VIEW_COUNT_PROFILE.format(user_id=user_id)
         ]
 
-        for key in keys:
-            self._safe_operation(self.redis_client.delete, key)
+        # Single UNLINK: one round-trip, memory reclaimed off the main Redis thread
+        self._safe_operation(self.redis_client.unlink, *keys)
+
+    def delete_matching(self, pattern: str, batch_size: int = 500) -> int:
+        """
+        Delete all keys matching a glob pattern without blocking Redis.
+
+        Iterates with SCAN instead of KEYS and removes keys with batched UNLINK calls.
+
+        Args:
+            pattern: Glob-style key pattern
+            batch_size: SCAN count hint and maximum keys per UNLINK
+
+        Returns:
+            Number of keys removed
+        """
+        if not self.is_connected():
+            return 0
+
+        removed = 0
+        batch = []
+        try:
+            for key in self.redis_client.scan_iter(match=pattern, count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    removed += self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                removed += self.redis_client.unlink(*batch)
+        except Exception as e:
+            logger.warning(f"Failed to delete keys matching {pattern}: {e}")
+            self._connected = False
+
+        return removed
 
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get Redis/cache statistics."""
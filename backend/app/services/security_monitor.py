@@ -14,13 +14,15 @@ Features:
 - Real-time alerts and notifications
 """
 
-import json
+import asyncio
 import logging
+import orjson
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from enum import Enum
 from dataclasses import dataclass
 from fastapi import Request
+from redis.exceptions import ConnectionError as RedisConnectionError
 
 from app.services.redis_service import redis_service
 from app.core.config import settings
@@ -44,6 +46,10 @@ class SecurityEventType(Enum):
     ACCOUNT_LOCKOUT = "account_lockout"
 
 
+# Event type values in declaration order, computed once for the dashboard counters
+_EVENT_TYPE_VALUES = tuple(event_type.value for event_type in SecurityEventType)
+
+
 @dataclass
 class SecurityEvent:
     """Represents a security event."""
@@ -59,85 +65,208 @@ class SecurityEvent:
     request_method: Optional[str] = None
 
 
+# Remove recent events matching a type (ARGV[1]) or older than an ISO timestamp (ARGV[2]).
+# The list holds event ids; bodies live in security_event:<id> keys. Ids whose body
+# has already expired are pruned without being counted.
+# Naive ISO-8601 timestamps from datetime.isoformat() sort lexicographically by time.
+CLEAR_EVENTS_SCRIPT = """
+local ids = redis.call('LRANGE', KEYS[1], 0, -1)
+local keep = {}
+local cleared = 0
+local pruned = 0
+for _, id in ipairs(ids) do
+    local body = redis.call('GET', 'security_event:' .. id)
+    local drop = false
+    if not body then
+        pruned = pruned + 1
+    else
+        local ok, event = pcall(cjson.decode, body)
+        if ok and type(event) == 'table' then
+            if ARGV[1] ~= '' and event.event_type == ARGV[1] then
+                drop = true
+            elseif ARGV[2] ~= '' and type(event.timestamp) == 'string' and event.timestamp < ARGV[2] then
+                drop = true
+            end
+        end
+        if drop then
+            cleared = cleared + 1
+            redis.call('DEL', 'security_event:' .. id)
+        else
+            keep[#keep + 1] = id
+        end
+    end
+end
+if cleared + pruned > 0 then
+    redis.call('DEL', KEYS[1])
+    for i = 1, #keep, 1000 do
+        redis.call('RPUSH', KEYS[1], unpack(keep, i, math.min(i + 999, #keep)))
+    end
+end
+return cleared
+"""
+
+
 class SecurityMonitor:
     """Main security monitoring service."""
 
+    # Maximum number of queued events written per Redis pipeline
+    DRAIN_BATCH_SIZE = 100
+
     def __init__(self):
         self.redis = redis_service
         self.logger = logging.getLogger(f"{__name__}.SecurityMonitor")
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=10000)
+        self._drainer: Optional[asyncio.Task] = None
+        self._clear_events_script = None
+        # Severity -> logger method, resolved once instead of an if/elif chain per event
+        self._severity_log = {
+            "critical": self.logger.critical,
+            "high": self.logger.error,
+            "medium": self.logger.warning,
+            "low": self.logger.info,
+        }
+        # Last hour bucket formatted for counter keys, keyed by ordinal hour
+        self._cached_hour_ts = 0
+        self._cached_hour_str = ""
 
     async def log_security_event(self, event: SecurityEvent):
         """
-        Log a security event to both local logs and Redis for real-time monitoring.
+        Log a security event to local logs and queue it for Redis monitoring.
+
+        Redis storage and pattern analysis run in a background drainer, so the
+        request path never waits on Redis round-trips.
 
         Args:
             event: SecurityEvent to log
         """
+        etype = event.event_type.value
+        ts = event.timestamp
+        username = event.username
+        severity = event.severity
+
+        ts_unix = ts.timestamp()
+
         # Create event record
         event_data = {
-            "event_type": event.event_type.value,
-            "timestamp": event.timestamp.isoformat(),
+            "id": str(ts_unix),
+            "event_type": etype,
+            "timestamp": ts.isoformat(),
+            "ts_unix": ts_unix,
             "ip_address": event.ip_address,
             "user_id": event.user_id,
-            "username": event.username,
+            "username": username,
             "details": event.details or {},
-            "severity": event.severity,
+            "severity": severity,
             "user_agent": event.user_agent,
             "endpoint": event.endpoint,
             "request_method": event.request_method
         }
 
         # Log to application logger
-        log_message = f"Security Event: {event.event_type.value} from {event.ip_address}"
-        if event.username:
-            log_message += f" (user: {event.username})"
+        log_message = f"Security Event: {etype} from {event.ip_address}"
+        if username:
+            log_message += f" (user: {username})"
         log_message += f" - {event.details}"
+        self._severity_log.get(severity, self.logger.info)(log_message)
 
-        if event.severity == "critical":
-            self.logger.critical(log_message)
-        elif event.severity == "high":
-            self.logger.error(log_message)
-        elif event.severity == "medium":
-            self.logger.warning(log_message)
-        else:
-            self.logger.info(log_message)
-
-        # Store in Redis for real-time monitoring
-        if self.redis.is_connected():
-            try:
-                # Store individual event
-                event_key = f"security_event:{event.timestamp.timestamp()}"
-                self.redis.redis_client.setex(
-                    event_key,
-                    86400,  # Keep for 24 hours
-                    json.dumps(event_data, default=str)
-                )
+        # Hand off Redis storage and pattern analysis to the background drainer
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain_events())
+        try:
+            self._queue.put_nowait((event, event_data))
+        except asyncio.QueueFull:
+            self.logger.warning(f"Security event queue full, dropping {etype} event")
 
-                # Add to recent events list
-                self.redis.redis_client.lpush("security_events:recent", json.dumps(event_data, default=str))
-                self.redis.redis_client.ltrim("security_events:recent", 0, 999)  # Keep last 1000 events
+    async def _drain_events(self):
+        """Background task: store queued events in batches, then analyze them for patterns."""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.DRAIN_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
 
-                # Track by IP for pattern analysis
-                ip_key = f"security_events:ip:{event.ip_address}"
-                self.redis.redis_client.lpush(ip_key, json.dumps(event_data, default=str))
-                self.redis.redis_client.expire(ip_key, 86400)  # Keep for 24 hours
+            try:
+                await self._store_events(batch)
+                for event, _ in batch:
+                    await self._analyze_suspicious_patterns(event)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _store_events(self, batch: List[tuple]):
+        """Write a batch of (event, event_data) pairs to Redis in a single pipeline."""
+        try:
+            pipe = self.redis.async_client.pipeline(transaction=False)
 
-                # Track by user if available
-                if event.user_id:
-                    user_key = f"security_events:user:{event.user_id}"
-                    self.redis.redis_client.lpush(user_key, json.dumps(event_data, default=str))
-                    self.redis.redis_client.expire(user_key, 86400)
+            # Group the batch by target key so list, set and hash writes are one variadic command per key
+            recent_ids = []
+            by_ip: Dict[str, Dict[bytes, float]] = {}
+            by_user: Dict[str, List[bytes]] = {}
+            by_counter: Dict[str, Dict[str, int]] = {}
 
-                # Increment counters for dashboard
-                counter_key = f"security_counters:{event.event_type.value}:{datetime.now().strftime('%Y-%m-%d-%H')}"
-                self.redis.redis_client.incr(counter_key)
-                self.redis.redis_client.expire(counter_key, 86400)
+            for event, event_data in batch:
+                # Serialize once per event; orjson emits bytes and handles datetimes natively
+                payload = orjson.dumps(event_data, default=str)
 
-            except Exception as e:
-                self.logger.error(f"Failed to store security event in Redis: {e}")
+                # Store individual event
+                event_id = event_data["id"]
+                pipe.setex(f"security_event:{event_id}", 86400, payload)  # Keep for 24 hours
+                recent_ids.append(event_id)
+
+                # Track by IP in a sorted set scored by event time
+                by_ip.setdefault(f"security_events:by_ip:{event.ip_address}", {})[payload] = event_data["ts_unix"]
 
-        # Check for suspicious patterns
-        await self._analyze_suspicious_patterns(event)
+                # Track by user if available
+                if event.user_id:
+                    by_user.setdefault(f"security_events:user:{event.user_id}", []).append(payload)
+
+                # Count the event type in this hour's counter hash for the dashboard
+                counters = by_counter.setdefault(f"security_counters:{self._hour_bucket(event.timestamp)}", {})
+                counters[event_data["event_type"]] = counters.get(event_data["event_type"], 0) + 1
+
+            # Add event ids to the recent events list; bodies are fetched by id
+            pipe.lpush("security_events:recent", *recent_ids)
+            pipe.ltrim("security_events:recent", 0, 999)  # Keep last 1000 events
+
+            # Prune each IP's sorted set to 24 hours; its TTL slides so live history is never dropped
+            for ip_key, members in by_ip.items():
+                pipe.zadd(ip_key, members)
+                pipe.zremrangebyscore(ip_key, 0, max(members.values()) - 86400)
+                pipe.expire(ip_key, 86400)
+
+            # User lists keep a fixed 24 hour lifetime from their first event (EXPIRE NX),
+            # so an active user's list cannot grow without bound
+            for user_key, payloads in by_user.items():
+                pipe.lpush(user_key, *payloads)
+                pipe.expire(user_key, 86400, nx=True)
+
+            for counter_key, counts in by_counter.items():
+                for event_type, count in counts.items():
+                    pipe.hincrby(counter_key, event_type, count)
+                pipe.expire(counter_key, 86400, nx=True)
+                # Track counter key names so clearing never has to scan the keyspace
+                pipe.sadd("security_counters:index", counter_key)
+
+            # Send the whole batch in a single round-trip
+            await pipe.execute()
+
+        except RedisConnectionError as e:
+            self.logger.warning(f"Redis unavailable, dropping {len(batch)} security event(s): {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to store security events in Redis: {e}")
+
+    def _hour_bucket(self, ts: datetime) -> str:
+        """Format ts as a '%Y-%m-%d-%H' bucket, only calling strftime when the hour changes."""
+        hour_ts = ts.toordinal() * 24 + ts.hour
+        if hour_ts != self._cached_hour_ts:
+            self._cached_hour_str = ts.strftime('%Y-%m-%d-%H')
+            self._cached_hour_ts = hour_ts
+        return self._cached_hour_str
+
+    async def shutdown(self):
+        """Flush queued security events and stop the background drainer."""
+        if self._drainer is not None and not self._drainer.done():
+            await self._queue.join()
+            self._drainer.cancel()
 
     async def log_failed_login(self, ip_address: str, username: str, user_agent: str = None):
         """Log a failed login attempt."""
@@ -212,49 +341,48 @@ class SecurityMonitor:
 
     async def get_recent_events(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get recent security events for monitoring dashboard."""
-        if not self.redis.is_connected():
-            return []
-
         try:
-            events = self.redis.redis_client.lrange("security_events:recent", 0, limit - 1)
-            return [json.loads(event) for event in events]
+            event_ids = await self.redis.async_client.lrange("security_events:recent", 0, limit - 1)
+            if not event_ids:
+                return []
+            events = await self.redis.async_client.mget([f"security_event:{event_id}" for event_id in event_ids])
+            # Skip ids whose event body has already expired
+            return [orjson.loads(event) for event in events if event]
+        except RedisConnectionError:
+            return []
         except Exception as e:
             self.logger.error(f"Failed to retrieve recent security events: {e}")
             return []
 
     async def get_security_stats(self) -> Dict[str, Any]:
         """Get security statistics for dashboard."""
-        if not self.redis.is_connected():
-            return {}
-
         try:
-            current_hour = datetime.now().strftime('%Y-%m-%d-%H')
-            stats = {}
+            current_hour = self._hour_bucket(datetime.now())
 
-            # Get current hour statistics
-            for event_type in SecurityEventType:
-                counter_key = f"security_counters:{event_type.value}:{current_hour}"
-                count = self.redis.redis_client.get(counter_key)
-                stats[event_type.value] = int(count) if count else 0
+            # Fetch the current hour's counter hash and the recent events count in one round-trip
+            pipe = self.redis.async_client.pipeline(transaction=False)
+            pipe.hgetall(f"security_counters:{current_hour}")
+            pipe.llen("security_events:recent")
+            counts, recent_count = await pipe.execute()
 
-            # Get recent events count
-            recent_count = self.redis.redis_client.llen("security_events:recent")
+            stats = {value: int(counts.get(value, 0)) for value in _EVENT_TYPE_VALUES}
             stats["total_recent_events"] = recent_count
 
             return stats
+        except RedisConnectionError:
+            return {}
         except Exception as e:
             self.logger.error(f"Failed to retrieve security stats: {e}")
             return {}
 
     async def get_ip_events(self, ip_address: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get security events for a specific IP address."""
-        if not self.redis.is_connected():
-            return []
-
         try:
-            ip_key = f"security_events:ip:{ip_address}"
-            events = self.redis.redis_client.lrange(ip_key, 0, limit - 1)
-            return [json.loads(event) for event in events]
+            ip_key = f"security_events:by_ip:{ip_address}"
+            events = await self.redis.async_client.zrevrange(ip_key, 0, limit - 1)
+            return [orjson.loads(event) for event in events]
+        except RedisConnectionError:
+            return []
         except Exception as e:
             self.logger.error(f"Failed to retrieve events for IP {ip_address}: {e}")
             return []
@@ -266,31 +394,39 @@ class SecurityMonitor:
                 await self._check_brute_force_pattern(event.ip_address, event.username)
             elif event.event_type == SecurityEventType.RATE_LIMIT_EXCEEDED:
                 await self._check_rate_limit_pattern(event.ip_address)
+        except RedisConnectionError:
+            # Pattern counters live in Redis; nothing to analyze while it is down
+            return
         except Exception as e:
             self.logger.error(f"Failed to analyze suspicious patterns: {e}")
 
-    async def _check_brute_force_pattern(self, ip_address: str, username: str):
-        """Check for brute force attack patterns."""
-        if not self.redis.is_connected():
-            return
+    async def _increment_window_counter(self, key: str, window_seconds: int) -> int:
+        """
+        Increment a per-IP event counter and return the count within its window.
 
-        # Count failed logins from this IP in the last 10 minutes
-        window_start = datetime.now() - timedelta(minutes=10)
-        ip_events = await self.get_ip_events(ip_address, 100)
+        The window starts at the first event (EXPIRE NX), so counting is O(1)
+        instead of scanning and parsing the IP's event list.
+        """
+        pipe = self.redis.async_client.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, window_seconds, nx=True)
+        count, _ = await pipe.execute()
+        return count
 
-        recent_failed_logins = [
-            event for event in ip_events
-            if (event.get("event_type") == SecurityEventType.FAILED_LOGIN.value and
-                datetime.fromisoformat(event.get("timestamp", "")) > window_start)
-        ]
+    async def _check_brute_force_pattern(self, ip_address: str, username: str):
+        """Check for brute force attack patterns."""
+        # Count failed logins from this IP in a 10 minute window
+        failed_attempts = await self._increment_window_counter(
+            f"security_window:{SecurityEventType.FAILED_LOGIN.value}:{ip_address}", 600
+        )
 
-        if len(recent_failed_logins) >= 5:  # 5 failed logins in 10 minutes
+        if failed_attempts >= 5:  # 5 failed logins in 10 minutes
             await self.log_security_event(SecurityEvent(
                 event_type=SecurityEventType.BRUTE_FORCE_ATTEMPT,
                 timestamp=datetime.now(),
                 ip_address=ip_address,
                 details={
-                    "failed_attempts": len(recent_failed_logins),
+                    "failed_attempts": failed_attempts,
                     "time_window": "10_minutes",
                     "target_username": username
                 },
@@ -299,26 +435,18 @@ class SecurityMonitor:
 
     async def _check_rate_limit_pattern(self, ip_address: str):
         """Check for excessive rate limit violations."""
-        if not self.redis.is_connected():
-            return
-
-        # Count rate limit violations from this IP in the last hour
-        window_start = datetime.now() - timedelta(hours=1)
-        ip_events = await self.get_ip_events(ip_address, 200)
-
-        recent_violations = [
-            event for event in ip_events
-            if (event.get("event_type") == SecurityEventType.RATE_LIMIT_EXCEEDED.value and
-                datetime.fromisoformat(event.get("timestamp", "")) > window_start)
-        ]
+        # Count rate limit violations from this IP in a 1 hour window
+        violations = await self._increment_window_counter(
+            f"security_window:{SecurityEventType.RATE_LIMIT_EXCEEDED.value}:{ip_address}", 3600
+        )
 
-        if len(recent_violations) >= 10:  # 10 rate limit violations in 1 hour
+        if violations >= 10:  # 10 rate limit violations in 1 hour
             await self.log_security_event(SecurityEvent(
                 event_type=SecurityEventType.SUSPICIOUS_REQUEST,
                 timestamp=datetime.now(),
                 ip_address=ip_address,
                 details={
-                    "rate_limit_violations": len(recent_violations),
+                    "rate_limit_violations": violations,
                     "time_window": "1_hour",
                     "reason": "excessive_rate_limit_violations"
                 },
@@ -348,57 +476,40 @@ class SecurityMonitor:
         Returns:
             Number of events cleared
         """
-        if not self.redis.is_connected():
-            return 0
-
         try:
             cleared_count = 0
 
-            # Clear from recent events list
+            # Clear from recent events list, filtering server-side in one atomic script
             if event_type or older_than_hours:
-                events = self.redis.redis_client.lrange("security_events:recent", 0, -1)
-                events_to_keep = []
-
-                for event_json in events:
-                    event = json.loads(event_json)
-                    should_keep = True
-
-                    # Check event type filter
-                    if event_type and event.get("event_type") == event_type:
-                        should_keep = False
-
-                    # Check time filter
-                    if older_than_hours and should_keep:
-                        event_time = datetime.fromisoformat(event.get("timestamp", ""))
-                        cutoff_time = datetime.now() - timedelta(hours=older_than_hours)
-                        if event_time < cutoff_time:
-                            should_keep = False
-
-                    if should_keep:
-                        events_to_keep.append(event_json)
-                    else:
-                        cleared_count += 1
-
-                # Replace the list with filtered events
-                if cleared_count > 0:
-                    self.redis.redis_client.delete("security_events:recent")
-                    if events_to_keep:
-                        self.redis.redis_client.lpush("security_events:recent", *events_to_keep)
-
+                cutoff = ""
+                if older_than_hours:
+                    cutoff = (datetime.now() - timedelta(hours=older_than_hours)).isoformat()
+                if self._clear_events_script is None:
+                    self._clear_events_script = self.redis.async_client.register_script(CLEAR_EVENTS_SCRIPT)
+                cleared_count = await self._clear_events_script(
+                    keys=["security_events:recent"],
+                    args=[event_type or "", cutoff]
+                )
             else:
-                # Clear all recent events
-                cleared_count = self.redis.redis_client.llen("security_events:recent")
-                self.redis.redis_client.delete("security_events:recent")
+                # Clear all recent events along with their bodies
+                event_ids = await self.redis.async_client.lrange("security_events:recent", 0, -1)
+                cleared_count = len(event_ids)
+                await self.redis.async_client.delete(
+                    "security_events:recent",
+                    *(f"security_event:{event_id}" for event_id in event_ids)
+                )
 
             # Clear counters if clearing all events
             if not event_type and not older_than_hours:
-                # Get all counter keys and delete them
-                counter_keys = self.redis.redis_client.keys("security_counters:*")
-                if counter_keys:
-                    self.redis.redis_client.delete(*counter_keys)
+                # Delete every tracked counter key together with the index itself
+                counter_keys = await self.redis.async_client.smembers("security_counters:index")
+                await self.redis.async_client.delete("security_counters:index", *counter_keys)
 
             return cleared_count
 
+        except RedisConnectionError as e:
+            self.logger.error(f"Redis unavailable, cannot clear security events: {e}")
+            return 0
         except Exception as e:
             self.logger.error(f"Failed to clear security events: {e}")
             return 0
@@ -408,29 +519,23 @@ class SecurityMonitor:
         Delete a specific security event by ID.
 
         Args:
-            event_id: The event ID (timestamp) to delete
+            event_id: The event ID (the "id" field of the event record) to delete
 
         Returns:
             True if event was found and deleted, False otherwise
         """
-        if not self.redis.is_connected():
-            return False
-
         try:
-            # Try to delete the individual event key
-            deleted = self.redis.redis_client.delete(f"security_event:{event_id}")
-
-            # Also remove from recent events list if present
-            events = self.redis.redis_client.lrange("security_events:recent", 0, -1)
-            for i, event_json in enumerate(events):
-                event = json.loads(event_json)
-                if str(event.get("timestamp", "")).replace(":", "").replace("-", "").replace(".", "") == event_id:
-                    self.redis.redis_client.lrem("security_events:recent", 1, event_json)
-                    deleted = 1
-                    break
+            # Delete the event body and its id in the recent list in one round-trip
+            pipe = self.redis.async_client.pipeline(transaction=False)
+            pipe.delete(f"security_event:{event_id}")
+            pipe.lrem("security_events:recent", 1, event_id)
+            deleted, removed = await pipe.execute()
 
-            return deleted > 0
+            return deleted > 0 or removed > 0
 
+        except RedisConnectionError as e:
+            self.logger.error(f"Redis unavailable, cannot delete security event {event_id}: {e}")
+            return False
         except Exception as e:
             self.logger.error(f"Failed to delete security event {event_id}: {e}")
             return False
@@ -1,27 +1,87 @@
 import stripe
-from datetime import datetime, timedelta
+import os
+import hmac
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from functools import partial
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.models.user import User
-from typing import Optional, Dict, Any, Tuple
+from app.services.redis_service import redis_service
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
+# One pooled keep-alive client for all SDK calls (sessions are per executor thread),
+# so each call reuses a TLS connection instead of handshaking again
+stripe.default_http_client = stripe.RequestsClient(verify_ssl_certs=True)
+
+# Dedicated pool for blocking Stripe SDK calls, so webhook bursts don't starve the default executor
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stripe")
+
+
+async def _run(func, *args, **kwargs):
+    """Run a blocking Stripe SDK call off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+# Per-worker caches for read-only lookups; only touched from the event loop thread,
+# so no lock is needed. Subscriptions are cached in Redis instead, since webhooks
+# on any worker must be able to invalidate them.
+_customer_cache = TTLCache(maxsize=1024, ttl=30)
+_checkout_session_cache = TTLCache(maxsize=1024, ttl=30)
+
+
+@functools.lru_cache(maxsize=1)
+def _webhook_secrets() -> Tuple[str, ...]:
+    """
+    Webhook signing secrets to try, parsed once per process.
+
+    Supports multiple secrets (comma-separated) to ease live/test transitions,
+    and also looks at common alternative env vars to avoid deployment
+    mismatches. Configured secrets come first, then extras, deduplicated in
+    order. Call _webhook_secrets.cache_clear() after rotating secrets.
+    """
+    configured = [s.strip() for s in (settings.STRIPE_WEBHOOK_SECRET or "").split(",") if s.strip()]
+    extras = []
+    for key in ("STRIPE_LIVE_WEBHOOK_SECRET", "STRIPE_TEST_WEBHOOK_SECRET", "STRIPE_WEBHOOK_SECRETS"):
+        val = os.environ.get(key, "")
+        if val:
+            extras.extend([s.strip() for s in val.split(",") if s.strip()])
+    return tuple(dict.fromkeys(configured + extras))
+
 
 class StripeService:
     @staticmethod
-    def get_customer(customer_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve a Stripe customer by ID."""
+    async def get_customer(customer_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a Stripe customer by ID, reusing a lookup from the last 30 seconds."""
+        cached = _customer_cache.get(customer_id)
+        if cached is not None:
+            return cached
+
         try:
-            return stripe.Customer.retrieve(customer_id)
-        except Exception as e:
-            print(f"Error retrieving Stripe customer: {e}")
+            customer = (await _run(stripe.Customer.retrieve, customer_id)).to_dict()
+            _customer_cache[customer_id] = customer
+            return customer
+        except Exception:
+            logger.exception("Error retrieving Stripe customer", extra={"op": "get_customer", "customer_id": customer_id})
             return None
     @staticmethod
-    def create_customer(user: User) -> Optional[Dict[str, Any]]:
+    async def create_customer(user: User) -> Optional[Dict[str, Any]]:
         """Create a Stripe customer for the user"""
         try:
-            customer = stripe.Customer.create(
+            customer = await _run(
+                stripe.Customer.create,
                 email=user.email,
                 metadata={
                     "user_id": str(user.id),
@@ -29,109 +89,147 @@ class StripeService:
                 }
             )
             return customer
-        except Exception as e:
-            print(f"Error creating Stripe customer: {e}")
+        except Exception:
+            logger.exception("Error creating Stripe customer", extra={"op": "create_customer", "user_id": user.id})
             return None
     
     @staticmethod
-    def create_subscription(customer_id: str, price_id: str) -> Optional[Dict[str, Any]]:
+    async def create_subscription(customer_id: str, price_id: str) -> Optional[Dict[str, Any]]:
         """Create a subscription for a customer"""
         try:
-            subscription = stripe.Subscription.create(
+            subscription = await _run(
+                stripe.Subscription.create,
                 customer=customer_id,
                 items=[{"price": price_id}],
                 payment_behavior="default_incomplete",
-                payment_settings={"save_default_payment_method": "on_subscription"},
-                expand=["latest_invoice.payment_intent"]
+                payment_settings={"save_default_payment_method": "on_subscription"}
             )
             return subscription
-        except Exception as e:
-            print(f"Error creating subscription: {e}")
+        except Exception:
+            logger.exception("Error creating subscription", extra={"op": "create_subscription", "customer_id": customer_id})
             return None
     
     @staticmethod
-    def get_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
-        """Get subscription details"""
+    async def get_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
+        """Get subscription details, served from a short-lived Redis cache when possible"""
+        cached = redis_service.get_cached_stripe_subscription(subscription_id)
+        if cached is not None:
+            return cached
+
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = (await _run(stripe.Subscription.retrieve, subscription_id)).to_dict()
+            redis_service.cache_stripe_subscription(subscription_id, subscription)
             return subscription
-        except Exception as e:
-            print(f"Error retrieving subscription: {e}")
+        except Exception:
+            logger.exception("Error retrieving subscription", extra={"op": "get_subscription", "subscription_id": subscription_id})
             return None
     
     @staticmethod
-    def cancel_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
+    def invalidate_subscription_cache(subscription_id: Optional[str]):
+        """Forget the cached copy of a subscription, e.g. when a webhook reports a change"""
+        if subscription_id:
+            redis_service.invalidate_stripe_subscription(subscription_id)
+
+    @staticmethod
+    async def cancel_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
         """Cancel a subscription"""
         try:
-            subscription = stripe.Subscription.modify(
+            subscription = await _run(
+                stripe.Subscription.modify,
                 subscription_id,
                 cancel_at_period_end=True
             )
+            redis_service.invalidate_stripe_subscription(subscription_id)
             return subscription
-        except Exception as e:
-            print(f"Error canceling subscription: {e}")
+        except Exception:
+            logger.exception("Error canceling subscription", extra={"op": "cancel_subscription", "subscription_id": subscription_id})
             return None
 
     @staticmethod
-    def cancel_subscription_immediately(subscription_id: str) -> Optional[Dict[str, Any]]:
+    async def cancel_subscription_immediately(subscription_id: str) -> Optional[Dict[str, Any]]:
         """Cancel a subscription immediately (no grace period)."""
         try:
             # In Stripe's Python SDK, deleting a subscription cancels it immediately
-            subscription = stripe.Subscription.delete(subscription_id)
+            subscription = await _run(stripe.Subscription.delete, subscription_id)
+            redis_service.invalidate_stripe_subscription(subscription_id)
             return subscription
-        except Exception as e:
-            print(f"Error immediately canceling subscription: {e}")
+        except Exception:
+            logger.exception("Error immediately canceling subscription", extra={"op": "cancel_subscription_immediately", "subscription_id": subscription_id})
             return None
 
     @staticmethod
-    def cancel_subscription_safe(subscription_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    async def cancel_subscription_safe(subscription_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
         """Like cancel_subscription but returns (result, error_message)."""
         try:
-            subscription = stripe.Subscription.modify(
+            subscription = await _run(
+                stripe.Subscription.modify,
                 subscription_id,
                 cancel_at_period_end=True
             )
+            redis_service.invalidate_stripe_subscription(subscription_id)
             return subscription, None
         except Exception as e:
             return None, str(e)
 
     @staticmethod
-    def cancel_subscription_immediately_safe(subscription_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    async def cancel_subscription_immediately_safe(subscription_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
         """Like cancel_subscription_immediately but returns (result, error_message)."""
         try:
-            subscription = stripe.Subscription.delete(subscription_id)
+            subscription = await _run(stripe.Subscription.delete, subscription_id)
+            redis_service.invalidate_stripe_subscription(subscription_id)
             return subscription, None
         except Exception as e:
             return None, str(e)
 
     @staticmethod
-    def find_active_subscription_for_customer(customer_id: str) -> Optional[Dict[str, Any]]:
+    async def cancel_many(
+        subscription_ids: List[str], concurrency: int = 8
+    ) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Cancel several subscriptions immediately, running up to `concurrency` at once.
+
+        Returns one (result, error_message) pair per id, in input order. The default
+        matches the Stripe executor size; keep it modest to stay within rate limits.
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(subscription_id: str):
+            async with sem:
+                return await StripeService.cancel_subscription_immediately_safe(subscription_id)
+
+        return await asyncio.gather(*(one(sid) for sid in subscription_ids))
+
+    @staticmethod
+    async def find_active_subscription_for_customer(customer_id: str) -> Optional[Dict[str, Any]]:
         """Find an active or trialing subscription for a given customer"""
         try:
-            subs = stripe.Subscription.list(customer=customer_id, status="all", limit=10)
-            for s in subs.get("data", []):
-                if s.get("status") in ("active", "trialing"):
-                    return s
+            # Filter server-side and fetch a single subscription per status, active first
+            for status in ("active", "trialing"):
+                subs = await _run(stripe.Subscription.list, customer=customer_id, status=status, limit=1)
+                if subs["data"]:
+                    return subs["data"][0].to_dict()
             return None
-        except Exception as e:
-            print(f"Error listing subscriptions: {e}")
+        except Exception:
+            logger.exception("Error listing subscriptions", extra={"op": "find_active_subscription_for_customer", "customer_id": customer_id})
             return None
     
     @staticmethod
-    def reactivate_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
+    async def reactivate_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
         """Reactivate a canceled subscription"""
         try:
-            subscription = stripe.Subscription.modify(
+            subscription = await _run(
+                stripe.Subscription.modify,
                 subscription_id,
                 cancel_at_period_end=False
             )
+            redis_service.invalidate_stripe_subscription(subscription_id)
             return subscription
-        except Exception as e:
-            print(f"Error reactivating subscription: {e}")
+        except Exception:
+            logger.exception("Error reactivating subscription", extra={"op": "reactivate_subscription", "subscription_id": subscription_id})
             return None
     
     @staticmethod
-    def create_checkout_session(
+    async def create_checkout_session(
         customer_id: str,
         price_id: str,
         success_url: str,
@@ -141,7 +239,8 @@ class StripeService:
     ) -> Optional[Dict[str, Any]]:
         """Create a Stripe checkout session"""
         try:
-            session = stripe.checkout.Session.create(
+            session = await _run(
+                stripe.checkout.Session.create,
                 customer=customer_id,
                 payment_method_types=["card"],
                 line_items=[{
@@ -155,86 +254,140 @@ class StripeService:
                 cancel_url=cancel_url
             )
             return session
-        except Exception as e:
-            print(f"Error creating checkout session: {e}")
+        except Exception:
+            logger.exception("Error creating checkout session", extra={"op": "create_checkout_session", "customer_id": customer_id})
             return None
 
     @staticmethod
-    def get_checkout_session(session_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve a checkout session."""
+    async def create_checkout_for_new_user(
+        user: User,
+        price_id: str,
+        success_url: str,
+        cancel_url: str,
+    ) -> Optional[Dict[str, Any]]:
+        """Create a checkout session for a user without a Stripe customer.
+
+        Stripe creates the customer from customer_email when the session
+        completes, so new subscribers need a single API call instead of
+        create_customer followed by create_checkout_session. The customer id
+        is linked to the user via client_reference_id once checkout completes.
+        """
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            metadata = {"user_id": str(user.id), "username": user.username}
+            session = await _run(
+                stripe.checkout.Session.create,
+                customer_email=user.email,
+                payment_method_types=["card"],
+                line_items=[{
+                    "price": price_id,
+                    "quantity": 1,
+                }],
+                mode="subscription",
+                client_reference_id=str(user.id),
+                metadata=metadata,
+                subscription_data={"metadata": metadata},
+                success_url=success_url,
+                cancel_url=cancel_url
+            )
             return session
-        except Exception as e:
-            print(f"Error retrieving checkout session: {e}")
+        except Exception:
+            logger.exception("Error creating checkout session for new customer", extra={"op": "create_checkout_for_new_user", "user_id": user.id})
+            return None
+
+    @staticmethod
+    async def get_checkout_session(session_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a checkout session; completed sessions are final and get cached briefly."""
+        cached = _checkout_session_cache.get(session_id)
+        if cached is not None:
+            return cached
+
+        try:
+            session = (await _run(stripe.checkout.Session.retrieve, session_id)).to_dict()
+            # Open sessions can still change while the customer is paying
+            if session.get("status") == "complete":
+                _checkout_session_cache[session_id] = session
+            return session
+        except Exception:
+            logger.exception("Error retrieving checkout session", extra={"op": "get_checkout_session", "session_id": session_id})
             return None
     
     @staticmethod
-    def get_customer_portal_url(customer_id: str, return_url: str) -> Optional[str]:
+    async def get_customer_portal_url(customer_id: str, return_url: str) -> Optional[str]:
         """Create a customer portal session"""
         try:
-            session = stripe.billing_portal.Session.create(
+            session = await _run(
+                stripe.billing_portal.Session.create,
                 customer=customer_id,
                 return_url=return_url
             )
             return session.url
         except Exception as e:
-            try:
-                # Stripe provides rich error info; surface the helpful parts
-                msg = getattr(e, "user_message", None) or str(e)
-                body = getattr(e, "json_body", None)
-                code = getattr(e, "code", None)
-                param = getattr(e, "param", None)
-                print(f"Error creating portal session: message={msg}, code={code}, param={param}, return_url={return_url}, customer={customer_id}")
-                if body:
-                    print(f"Stripe error body: {body}")
-            except Exception:
-                print(f"Error creating portal session: {e}")
+            # Stripe provides rich error info; surface the helpful parts (formatted lazily)
+            logger.exception(
+                "Error creating portal session: msg=%s code=%s param=%s customer=%s",
+                getattr(e, "user_message", None) or e,
+                getattr(e, "code", None),
+                getattr(e, "param", None),
+                customer_id,
+                extra={
+                    "op": "get_customer_portal_url",
+                    "customer_id": customer_id,
+                    "return_url": return_url,
+                    "stripe_code": getattr(e, "code", None),
+                    "stripe_param": getattr(e, "param", None),
+                    "stripe_body": getattr(e, "json_body", None),
+                }
+            )
             return None
     
     @staticmethod
     def process_webhook_event(payload: bytes, sig_header: str) -> Optional[Dict[str, Any]]:
-        """Process and verify webhook events"""
+        """Process and verify webhook events
+
+        The Stripe-Signature header is parsed once and each configured secret
+        costs a single HMAC over the payload; the JSON body is only decoded
+        after a signature matches. The event is returned as a plain dict.
+        """
         try:
-            # Support multiple secrets (comma-separated) to ease live/test transitions
-            # Also look for common alternative env vars to avoid deployment mismatches
-            import os
-            configured = [s.strip() for s in (settings.STRIPE_WEBHOOK_SECRET or "").split(",") if s.strip()]
-            extras = []
-            for key in ("STRIPE_LIVE_WEBHOOK_SECRET", "STRIPE_TEST_WEBHOOK_SECRET", "STRIPE_WEBHOOK_SECRETS"):
-                val = os.environ.get(key, "")
-                if val:
-                    extras.extend([s.strip() for s in val.split(",") if s.strip()])
-            # Merge and dedupe, preserve order: configured first, then extras
-            seen = set()
-            secrets = []
-            for s in configured + extras:
-                if s and s not in seen:
-                    secrets.append(s)
-                    seen.add(s)
-            try:
-                print(f"Webhook verification: attempting {len(secrets)} secret(s)")
-            except Exception:
-                pass
-            last_err = None
-            for secret in secrets or [""]:
-                try:
-                    if not secret:
-                        continue
-                    event = stripe.Webhook.construct_event(payload, sig_header, secret)
-                    return event
-                except Exception as inner_e:
-                    last_err = inner_e
-                    continue
-            if last_err:
-                raise last_err
-            # If we got here, no valid secret configured
-            raise ValueError("No Stripe webhook secret configured (set STRIPE_WEBHOOK_SECRET or *_WEBHOOK_SECRET env vars)")
+            secrets = _webhook_secrets()
+            if not secrets:
+                raise ValueError("No Stripe webhook secret configured (set STRIPE_WEBHOOK_SECRET or *_WEBHOOK_SECRET env vars)")
+            logger.debug("Webhook verification: attempting %d secret(s)", len(secrets))
+
+            timestamp = None
+            signatures = []
+            for item in sig_header.split(","):
+                key, _, value = item.strip().partition("=")
+                if key == "t":
+                    timestamp = value
+                elif key == "v1":
+                    signatures.append(value)
+            if not timestamp or not timestamp.isdigit() or not signatures:
+                raise stripe.error.SignatureVerificationError(
+                    "Unable to extract timestamp and signatures from header", sig_header
+                )
+
+            signed_payload = timestamp.encode() + b"." + payload
+            for secret in secrets:
+                expected = hmac.new(secret.encode(), signed_payload, hashlib.sha256).hexdigest()
+                if any(hmac.compare_digest(expected, signature) for signature in signatures):
+                    break
+            else:
+                raise stripe.error.SignatureVerificationError(
+                    "No signatures found matching the expected signature for payload", sig_header
+                )
+
+            if abs(time.time() - int(timestamp)) > stripe.Webhook.DEFAULT_TOLERANCE:
+                raise stripe.error.SignatureVerificationError(
+                    "Timestamp outside the tolerance zone", sig_header
+                )
+
+            return json.loads(payload)
         except ValueError as e:
-            print(f"Invalid payload: {e}")
+            logger.warning("Invalid webhook payload: %s", e, extra={"op": "process_webhook_event"})
             return None
         except stripe.error.SignatureVerificationError as e:
-            print(f"Invalid signature: {e}")
+            logger.warning("Invalid webhook signature: %s", e, extra={"op": "process_webhook_event"})
             return None
     
     @staticmethod
@@ -242,21 +395,38 @@ class StripeService:
         """Update user premium status based on subscription data"""
         try:
             # Check if subscription is active
-            status = subscription_data.get("status")
+            is_premium = subscription_data.get("status") in ("active", "trialing")
             current_period_end = subscription_data.get("current_period_end")
-            
-            if status in ["active", "trialing"]:
-                user.is_premium = True
-                if current_period_end:
-                    user.premium_expires_at = datetime.fromtimestamp(current_period_end)
-                user.stripe_subscription_id = subscription_data.get("id")
+
+            if is_premium:
+                subscription_id = subscription_data.get("id")
+                # premium_expires_at is a naive UTC column (compared against utcnow())
+                expires_at = (
+                    datetime.fromtimestamp(current_period_end, tz=timezone.utc).replace(tzinfo=None)
+                    if current_period_end else user.premium_expires_at
+                )
+                changed = (
+                    not user.is_premium
+                    or user.premium_expires_at != expires_at
+                    or user.stripe_subscription_id != subscription_id
+                )
+                if changed:
+                    user.is_premium = True
+                    user.premium_expires_at = expires_at
+                    user.stripe_subscription_id = subscription_id
             else:
-                user.is_premium = False
-                user.premium_expires_at = None
-            
-            db.commit()
+                changed = user.is_premium or user.premium_expires_at is not None
+                if changed:
+                    user.is_premium = False
+                    user.premium_expires_at = None
+
+            # Stripe retries and fans out events; skip the write when nothing moved.
+            # Callers may have set customer/subscription ids before calling, so
+            # any pending change on the user still needs committing.
+            if changed or db.is_modified(user):
+                db.commit()
             return True
-        except Exception as e:
-            print(f"Error updating user premium status: {e}")
+        except Exception:
+            logger.exception("Error updating user premium status", extra={"op": "update_user_premium_status", "user_id": user.id})
             db.rollback()
             return False
\ No newline at end of file
@@ -1,11 +1,15 @@
 import os
-import uuid
+import asyncio
+import secrets
 import hashlib
-import aiofiles
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from fastapi import UploadFile, HTTPException, status
+from sqlalchemy import func, insert, text
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from PIL import Image
 import magic
 
@@ -15,6 +19,76 @@ from app.models.upload import Upload
 from app.models.domain import Domain
 from app.services.image_effects_service import ImageEffectsService
 
+logger = logging.getLogger(__name__)
+
+# Allowed extensions as a set for O(1) membership checks on every upload
+_ALLOWED_EXTENSIONS = frozenset(ext.lower() for ext in settings.ALLOWED_EXTENSIONS)
+_ALLOWED_EXTENSIONS_TEXT = ', '.join(settings.ALLOWED_EXTENSIONS)
+
+# Global upload size cap, used when a domain sets no limit of its own
+_DEFAULT_MAX_FILE_SIZE = settings.MAX_FILE_SIZE
+
+# Leading bytes handed to libmagic; the rest of the body is streamed straight to disk
+_SNIFF_BYTES = 2048
+
+# Allowed MIME types per storage category, built once at import
+_ALLOWED_MIMES = {
+    'images': frozenset({'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/svg+xml'}),
+    'videos': frozenset({'video/mp4', 'video/mpeg', 'video/quicktime', 'video/x-msvideo', 'video/webm'}),
+    'documents': frozenset({'application/pdf', 'text/plain', 'text/markdown',
+                            'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'}),
+}
+
+
+# Dedicated pool for upload disk I/O, so large uploads neither queue behind nor
+# starve the default executor used for image processing
+_io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upload-io")
+
+
+# Magic numbers for the most common upload types, checked before falling back to libmagic
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+)
+
+
+def _sniff_signature(head: bytes) -> Optional[str]:
+    """MIME type from a well-known leading signature, or None to defer to libmagic"""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _copy_and_hash(src, dest_path: Path) -> str:
+    """Copy a file object to dest_path in 1 MiB chunks, returning the SHA-256 hex digest"""
+    hasher = hashlib.sha256()
+    with open(dest_path, 'wb') as out:
+        while chunk := src.read(1 << 20):
+            hasher.update(chunk)
+            out.write(chunk)
+    return hasher.hexdigest()
+
+
+def _write_bytes(dest_path: Path, data: bytes) -> None:
+    """Write a complete in-memory file to dest_path"""
+    with open(dest_path, 'wb') as out:
+        out.write(data)
+
+
+def _file_extension(filename: str) -> str:
+    """Lower-cased extension including the dot, or '' (same result as Path(filename).suffix for plain names)"""
+    idx = filename.rfind('.')
+    if idx <= 0 or idx == len(filename) - 1 or filename.rfind('/', idx) != -1:
+        return ''
+    return filename[idx:].lower()
+
+
 class UploadService:
     def __init__(self):
         self.upload_dir = Path(settings.UPLOAD_DIR)
@@ -25,14 +99,15 @@ class UploadService:
         (self.upload_dir / "documents").mkdir(exist_ok=True)
         (self.upload_dir / "other").mkdir(exist_ok=True)
 
+        # Loading the libmagic database is expensive; load it once and reuse it
+        # (python-magic serializes calls on an instance with its own lock)
+        self._mime = magic.Magic(mime=True)
+
     def validate_file(self, file: UploadFile, user: User, domain: Optional[Domain] = None) -> dict:
         """Validate uploaded file"""
         # Determine max file size (domain-specific or global)
-        if domain and domain.max_file_size:
-            max_file_size = domain.max_file_size
-        else:
-            max_file_size = settings.MAX_FILE_SIZE
-        
+        max_file_size = (domain.max_file_size if domain else None) or _DEFAULT_MAX_FILE_SIZE
+
         # Check file size
         if file.size and file.size > max_file_size:
             domain_name = domain.display_name or domain.domain_name if domain else "default"
@@ -42,66 +117,85 @@ class UploadService:
                 detail=f"File too large for {domain_name}. Maximum size: {max_mb:.1f} MB"
             )
 
-        # Check user storage quota
-        if user.storage_used + (file.size or 0) > user.storage_limit:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="Storage quota exceeded"
-            )
+        # The storage quota is enforced atomically by reserve_storage()
 
         # Validate file extension
+        file_ext = _file_extension(file.filename) if file.filename else ''
         if file.filename:
-            file_ext = Path(file.filename).suffix.lower()
-            if file_ext not in settings.ALLOWED_EXTENSIONS:
+            if file_ext not in _ALLOWED_EXTENSIONS:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"File type not allowed. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+                    detail=f"File type not allowed. Allowed types: {_ALLOWED_EXTENSIONS_TEXT}"
                 )
 
         return {
             "original_filename": file.filename or "unknown",
             "file_size": file.size or 0,
-            "file_extension": Path(file.filename or "").suffix.lower()
+            "file_extension": file_ext
         }
 
-    def validate_mime_type(self, content: bytes, expected_category: str) -> bool:
-        """Validate MIME type matches expected category to prevent file masquerading"""
-        try:
-            mime_type = magic.from_buffer(content[:1024], mime=True)
-
-            # Define allowed MIME types per category
-            allowed_mimes = {
-                'images': ['image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/svg+xml'],
-                'videos': ['video/mp4', 'video/mpeg', 'video/quicktime', 'video/x-msvideo', 'video/webm'],
-                'documents': ['application/pdf', 'text/plain', 'text/markdown',
-                             'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'],
-                'other': []  # Other category is permissive
-            }
-
-            if expected_category == 'other':
-                return True
-
-            category_mimes = allowed_mimes.get(expected_category, [])
-            is_valid = mime_type in category_mimes
-
-            if not is_valid:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"MIME type mismatch: expected {expected_category}, got {mime_type}")
+    def validate_mime_type(self, mime_type: str, expected_category: str) -> bool:
+        """Validate an already-detected MIME type matches the expected category to prevent file masquerading"""
+        # Other category is permissive
+        if expected_category == 'other':
+            return True
+
+        is_valid = mime_type in _ALLOWED_MIMES.get(expected_category, frozenset())
+        if not is_valid:
+            logger.warning("MIME type mismatch: expected %s, got %s", expected_category, mime_type)
+
+        return is_valid
+
+    def reserve_storage(self, db: Session, user: User, file_size: int) -> None:
+        """
+        Atomically check the storage quota and reserve space for one upload.
+
+        A single conditional UPDATE both checks and increments storage_used and
+        upload_count, so concurrent uploads cannot overshoot the quota. The
+        reservation is committed immediately; undo it with release_storage().
+        """
+        row = db.execute(
+            text(
+                "UPDATE users SET storage_used = storage_used + :file_size, upload_count = upload_count + 1 "
+                "WHERE id = :user_id AND storage_used + :file_size <= storage_limit "
+                "RETURNING storage_used, upload_count"
+            ),
+            {"file_size": file_size, "user_id": user.id}
+        ).first()
 
-            return is_valid
+        if row is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Storage quota exceeded"
+            )
 
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"MIME validation error: {str(e)}")
-            return False  # Fail closed - reject if validation fails
+        db.commit()
+        # Use the returned counters instead of reloading the user
+        set_committed_value(user, "storage_used", row.storage_used)
+        set_committed_value(user, "upload_count", row.upload_count)
+
+    def release_storage(self, db: Session, user: User, file_size: int) -> None:
+        """Undo a reserve_storage() reservation after a failed upload."""
+        db.rollback()
+        row = db.execute(
+            text(
+                "UPDATE users SET storage_used = storage_used - :file_size, upload_count = upload_count - 1 "
+                "WHERE id = :user_id RETURNING storage_used, upload_count"
+            ),
+            {"file_size": file_size, "user_id": user.id}
+        ).first()
+        db.commit()
+        if row is not None:
+            set_committed_value(user, "storage_used", row.storage_used)
+            set_committed_value(user, "upload_count", row.upload_count)
 
-    def generate_unique_filename(self, original_filename: str) -> str:
-        """Generate unique filename while preserving extension"""
-        file_ext = Path(original_filename).suffix.lower()
-        unique_id = str(uuid.uuid4())
-        return f"{unique_id}{file_ext}"
+    def generate_unique_filename(self, original_filename: str, file_ext: Optional[str] = None) -> str:
+        """Generate unique filename while preserving extension (pass file_ext if already parsed)"""
+        if file_ext is None:
+            file_ext = _file_extension(original_filename)
+        # 128 random bits hex-encoded straight from os.urandom, without building a UUID object
+        return f"{secrets.token_hex(16)}{file_ext}"
 
     def get_file_category(self, mime_type: str) -> str:
         """Determine file category for storage organization"""
@@ -112,16 +206,17 @@ class UploadService:
         else:
             return 'other'
 
-    async def save_file(self, file: UploadFile, filename: str, category: str) -> str:
-        """Save file to disk and return relative path"""
+    async def save_file(self, file: UploadFile, filename: str, category: str) -> Tuple[str, str]:
+        """Save file to disk, hashing it on the way, and return (relative path, SHA-256 hex digest)"""
         file_path = self.upload_dir / category / filename
 
         try:
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+            # Copy and hash in one pass on a single worker thread: 1 MiB chunks keep
+            # memory flat, and the loop avoids two thread hops (read + write) per chunk
+            loop = asyncio.get_running_loop()
+            file_hash = await loop.run_in_executor(_io_executor, _copy_and_hash, file.file, file_path)
 
-            return str(Path(category) / filename)
+            return str(Path(category) / filename), file_hash
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -130,17 +225,36 @@ class UploadService:
 
     def calculate_file_hash(self, file_path: Path) -> str:
         """Calculate SHA-256 hash of file for deduplication"""
-        hash_sha256 = hashlib.sha256()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
+            if hasattr(hashlib, "file_digest"):
+                # Python 3.11+: large readinto buffer, hashing with the GIL released
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            # Older Pythons: same loop as file_digest, reusing one buffer instead of
+            # allocating a bytes object (via a lambda trampoline) per chunk
+            hash_sha256 = hashlib.sha256()
+            buf = bytearray(1 << 20)
+            view = memoryview(buf)
+            while size := f.readinto(buf):
+                hash_sha256.update(view[:size])
         return hash_sha256.hexdigest()
 
+    def check_duplicate(self, db: Session, user: User, file_hash: str) -> None:
+        """Raise 409 if the user already has an upload with this content hash"""
+        existing_upload = db.query(Upload.id).filter(
+            Upload.user_id == user.id,
+            Upload.file_hash == file_hash
+        ).first()
+
+        if existing_upload:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="File already exists"
+            )
+
     def detect_mime_type(self, file_path: Path) -> str:
         """Detect MIME type using python-magic"""
         try:
-            mime = magic.Magic(mime=True)
-            return mime.from_file(str(file_path))
+            return self._mime.from_file(str(file_path))
         except:
             # Fallback to basic detection
             ext = file_path.suffix.lower()
@@ -182,25 +296,25 @@ class UploadService:
         custom_name: Optional[str] = None,
         domain: Optional[Domain] = None,
         is_public: bool = True,
-        request_host: Optional[str] = None
+        request_host: Optional[str] = None,
+        *,
+        file_hash: str,
+        mime_type: str,
+        reserved_size: Optional[int] = None,
+        duplicate_checked: bool = False
     ) -> Upload:
-        """Create upload record in database"""
+        """Create upload record in database
 
-        full_file_path = self.upload_dir / file_path
-        file_hash = self.calculate_file_hash(full_file_path)
-        mime_type = self.detect_mime_type(full_file_path)
+        file_hash and mime_type come from the streaming save, so the stored
+        file is never read back here. Callers that reserved quota with
+        reserve_storage() pass the reserved size so only the difference to
+        the final size is applied. Pass duplicate_checked=True when
+        check_duplicate() already ran for this exact file_hash.
+        """
 
         # Check for duplicate files
-        existing_upload = db.query(Upload).filter(
-            Upload.user_id == user.id,
-            Upload.file_hash == file_hash
-        ).first()
-
-        if existing_upload:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="File already exists"
-            )
+        if not duplicate_checked:
+            self.check_duplicate(db, user, file_hash)
 
         # Generate unique filename for URL
         upload_url = self.generate_upload_url(file_path, domain, request_host)
@@ -221,23 +335,77 @@ class UploadService:
 
         db.add(upload)
 
-        # Update user storage and upload count atomically
-        from sqlalchemy import text
-        
-        # Atomic increment of upload_count and storage_used
-        db.execute(
-            text("UPDATE users SET upload_count = upload_count + 1, storage_used = storage_used + :file_size WHERE id = :user_id"),
-            {"file_size": file_info["file_size"], "user_id": user.id}
-        )
+        if reserved_size is None:
+            # Atomic increment of upload_count and storage_used
+            row = db.execute(
+                text(
+                    "UPDATE users SET upload_count = upload_count + 1, storage_used = storage_used + :file_size "
+                    "WHERE id = :user_id RETURNING storage_used, upload_count"
+                ),
+                {"file_size": file_info["file_size"], "user_id": user.id}
+            ).first()
+        elif file_info["file_size"] != reserved_size:
+            # Settle the reservation against the final size (e.g. after image processing)
+            row = db.execute(
+                text(
+                    "UPDATE users SET storage_used = storage_used + :delta "
+                    "WHERE id = :user_id RETURNING storage_used, upload_count"
+                ),
+                {"delta": file_info["file_size"] - reserved_size, "user_id": user.id}
+            ).first()
+        else:
+            row = None
 
-        db.commit()
-        db.refresh(upload)
-        
-        # Refresh user to get updated counts
-        db.refresh(user)
+        # Every Upload column is client-side or returned by the INSERT, so keep the
+        # flushed state instead of expiring it and re-selecting the row after commit
+        expire_on_commit = db.expire_on_commit
+        db.expire_on_commit = False
+        try:
+            db.commit()
+        finally:
+            db.expire_on_commit = expire_on_commit
+
+        # The RETURNING clause supplies the updated counts; no need to reload the user
+        if row is not None:
+            set_committed_value(user, "storage_used", row.storage_used)
+            set_committed_value(user, "upload_count", row.upload_count)
 
         return upload
 
+    def create_upload_records_bulk(self, db: Session, user: User, records: List[dict]) -> List[Tuple[int, str]]:
+        """Insert many upload rows for one user in a single statement (imports, migrations)
+
+        Each record is a dict of Upload column values for files already on
+        disk; user_id is filled in. Quota is not enforced here, only the
+        user's counters are bumped once by the batch totals. Skips the ORM
+        unit of work, so the returned value is (id, filename) pairs rather
+        than Upload instances.
+        """
+        if not records:
+            return []
+
+        rows = [{**record, "user_id": user.id} for record in records]
+        inserted = db.execute(
+            insert(Upload).values(rows).returning(Upload.id, Upload.filename)
+        ).all()
+
+        counters = db.execute(
+            text(
+                "UPDATE users SET upload_count = upload_count + :count, storage_used = storage_used + :total_size "
+                "WHERE id = :user_id RETURNING storage_used, upload_count"
+            ),
+            {
+                "count": len(rows),
+                "total_size": sum(row["file_size"] for row in rows),
+                "user_id": user.id,
+            }
+        ).first()
+        db.commit()
+
+        set_committed_value(user, "storage_used", counters.storage_used)
+        set_committed_value(user, "upload_count", counters.upload_count)
+        return [(row.id, row.filename) for row in inserted]
+
     async def upload_file(
         self,
         db: Session,
@@ -251,6 +419,8 @@ class UploadService:
         """Complete file upload process with transaction safety"""
         saved_file_path = None
         processed_file_path = None
+        reserved_size = None
+        upload = None
 
         try:
             # Get domain if specified
@@ -266,26 +436,39 @@ class UploadService:
             # Validate file (including domain-specific limits)
             file_info = self.validate_file(file, user, domain)
 
+            # Check and reserve storage quota in one atomic UPDATE
+            self.reserve_storage(db, user, file_info["file_size"])
+            reserved_size = file_info["file_size"]
+
             # Generate unique filename
-            unique_filename = self.generate_unique_filename(file_info["original_filename"])
+            unique_filename = self.generate_unique_filename(file_info["original_filename"], file_info["file_extension"])
 
-            # Detect MIME type for categorization and validation
-            content = await file.read()
+            # Detect MIME type for categorization and validation from the leading bytes only
+            head = await file.read(_SNIFF_BYTES)
             await file.seek(0)  # Reset file pointer
 
-            mime_type = magic.from_buffer(content[:1024], mime=True)
+            mime_type = _sniff_signature(head) or self._mime.from_buffer(head)
             category = self.get_file_category(mime_type)
 
             # Validate MIME type matches file extension category
-            if not self.validate_mime_type(content, category):
+            if not self.validate_mime_type(mime_type, category):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"File content does not match extension. Detected type: {mime_type}"
                 )
 
-            # Save file
-            file_path = await self.save_file(file, unique_filename, category)
-            saved_file_path = self.upload_dir / file_path
+            # Stream to a temporary file, hashing in the same pass, so duplicates are
+            # rejected before any image processing runs. Files stay under their
+            # temporary names until the record is committed, so readers never see
+            # partial or orphaned files at the public path.
+            temp_path, file_hash = await self.save_file(file, f".{unique_filename}.part", category)
+            saved_file_path = self.upload_dir / temp_path
+            # file_hash always identifies the uploaded source bytes, even when an
+            # effect replaces the stored image, so this catches every repeat upload
+            self.check_duplicate(db, user, file_hash)
+
+            file_path = str(Path(category) / unique_filename)
+            publish = [(saved_file_path, self.upload_dir / file_path)]
 
             # Apply default image effect for premium/admin users on image uploads
             if category == 'images' and user.default_image_effect in ("rgb",):
@@ -293,36 +476,56 @@ class UploadService:
                 if user.is_admin or user.has_active_premium():
                     try:
                         # Generate processed image bytes
-                        original_abs_path = self.upload_dir / file_path
-                        processed_bytes = await ImageEffectsService.apply_effect(str(original_abs_path), user.default_image_effect)
+                        original_abs_path = saved_file_path
+                        # The effect always produces opaque RGB, which encodes much
+                        # faster (and smaller) as WebP than PNG
+                        effect_format = "WEBP"
+                        processed_bytes = await ImageEffectsService.apply_effect(
+                            str(original_abs_path), user.default_image_effect, fmt=effect_format
+                        )
                         if processed_bytes:
-                            # Save processed image as PNG with same base name
+                            # Save processed image with same base name
                             base = Path(unique_filename).stem
-                            processed_filename = f"{base}.png"
+                            processed_filename = f"{base}{ImageEffectsService.OUTPUT_EXTENSIONS[effect_format]}"
                             processed_rel_path = Path('images') / processed_filename
-                            processed_abs_path = self.upload_dir / processed_rel_path
-                            with open(processed_abs_path, 'wb') as out:
-                                out.write(processed_bytes)
-
-                            processed_file_path = processed_abs_path
-                            # Replace file_path and unique_filename to reference processed PNG
+                            processed_file_path = self.upload_dir / 'images' / f".{processed_filename}.part"
+                            # Write off the event loop; an encoded image can be several MB
+                            await asyncio.get_running_loop().run_in_executor(
+                                _io_executor, _write_bytes, processed_file_path, processed_bytes
+                            )
+                            publish.append((processed_file_path, self.upload_dir / processed_rel_path))
+
+                            # Replace file_path and unique_filename to reference processed image
                             file_path = str(processed_rel_path)
                             unique_filename = processed_filename
                             # Update file_info size to processed size for accurate accounting
                             file_info["file_size"] = len(processed_bytes)
+                            mime_type = f"image/{effect_format.lower()}"
                     except Exception:
                         # Fail silently; keep original if processing fails
                         pass
 
             # Create database record - if this fails, clean up files
             upload = await self.create_upload_record(
-                db, user, file_info, file_path, unique_filename, custom_name, domain, is_public, request_host
+                db, user, file_info, file_path, unique_filename, custom_name, domain, is_public, request_host,
+                file_hash=file_hash, mime_type=mime_type, reserved_size=reserved_size,
+                duplicate_checked=True
             )
 
+            # Record committed: publish the files with atomic same-filesystem renames
+            for temp_file, final_file in publish:
+                os.replace(temp_file, final_file)
+
             return upload
 
         except Exception as e:
-            # Rollback: delete files if database operation failed
+            # Give back reserved quota if the upload record was never committed
+            if reserved_size is not None and upload is None:
+                try:
+                    self.release_storage(db, user, reserved_size)
+                except Exception:
+                    pass
+            # Rollback: delete any files that were not published
             if saved_file_path and saved_file_path.exists():
                 try:
                     saved_file_path.unlink()
@@ -345,10 +548,23 @@ class UploadService:
         """Get paginated list of user uploads"""
         offset = (page - 1) * per_page
 
-        query = db.query(Upload).filter(Upload.user_id == user.id)
-        total = query.count()
-
-        uploads = query.order_by(Upload.created_at.desc()).offset(offset).limit(per_page).all()
+        # Fetch the page and the total in one round-trip with a COUNT(*) OVER () window
+        rows = (
+            db.query(Upload, func.count().over().label("total"))
+            .filter(Upload.user_id == user.id)
+            .order_by(Upload.created_at.desc(), Upload.id.desc())
+            .offset(offset)
+            .limit(per_page)
+            .all()
+        )
+        uploads = [row[0] for row in rows]
+        if rows:
+            total = rows[0].total
+        elif offset:
+            # Past the last page the window returns no rows, so count separately
+            total = db.query(func.count(Upload.id)).filter(Upload.user_id == user.id).scalar()
+        else:
+            total = 0
 
         return {
             "uploads": uploads,
@@ -360,52 +576,59 @@ class UploadService:
         }
 
     def delete_upload(self, db: Session, user: User, upload_id: int) -> bool:
-        """Delete user upload with proper error handling"""
-        upload = db.query(Upload).filter(
-            Upload.id == upload_id,
-            Upload.user_id == user.id
+        """Delete user upload with proper error handling
+
+        The row, its analytics and the owner's counters are updated in one
+        statement; the file is removed from disk after the commit.
+        """
+        # upload_analytics has no ON DELETE CASCADE, so clear it in the same statement;
+        # FK checks run at the end of the statement, after both deletes
+        row = db.execute(
+            text(
+                "WITH deleted AS ("
+                "  DELETE FROM uploads WHERE id = :upload_id AND user_id = :user_id"
+                "  RETURNING filename, file_size, mime_type"
+                "), analytics AS ("
+                "  DELETE FROM upload_analytics WHERE upload_id = :upload_id AND EXISTS (SELECT 1 FROM deleted)"
+                "), counters AS ("
+                "  UPDATE users SET storage_used = users.storage_used - deleted.file_size,"
+                "    upload_count = users.upload_count - 1"
+                "  FROM deleted WHERE users.id = :user_id"
+                "  RETURNING users.storage_used, users.upload_count"
+                ") "
+                "SELECT deleted.filename, deleted.mime_type, counters.storage_used, counters.upload_count "
+                "FROM deleted, counters"
+            ),
+            {"upload_id": upload_id, "user_id": user.id}
         ).first()
 
-        if not upload:
+        if row is None:
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Upload not found"
             )
 
-        # Delete file from disk first
-        file_deleted = False
-        file_path = self.upload_dir / upload.filename
-        try:
-            if file_path.exists():
-                file_path.unlink()
-                file_deleted = True
-            else:
-                # File doesn't exist on disk, log warning but continue with DB cleanup
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"File not found on disk during deletion: {file_path}")
-                file_deleted = True  # Allow DB cleanup even if file missing
-        except Exception as e:
-            # Log the error but allow database cleanup to proceed
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Failed to delete file {file_path}: {str(e)}")
-            # Only proceed with DB deletion if we can confirm file is gone or missing
-            file_deleted = not file_path.exists()
-
-        if not file_deleted and file_path.exists():
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete file from disk"
-            )
-
-        # Update user storage
-        user.storage_used -= upload.file_size
-        user.upload_count -= 1
-
-        # Delete database record
-        db.delete(upload)
         db.commit()
+        set_committed_value(user, "storage_used", row.storage_used)
+        set_committed_value(user, "upload_count", row.upload_count)
+
+        # Best-effort file removal; files live under their category directory
+        # (older deletions looked in the upload root, so check there too)
+        for file_path in (
+            self.upload_dir / self.get_file_category(row.mime_type) / row.filename,
+            self.upload_dir / row.filename,
+        ):
+            try:
+                file_path.unlink()
+                break
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error("Failed to delete file %s: %s", file_path, e)
+                break
+        else:
+            logger.warning("File not found on disk during deletion: %s", row.filename)
 
         return True
 
@@ -18,7 +18,9 @@ import json
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, desc
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, and_, or_, desc, text
 
 from app.models.user import User
 from app.models.upload import Upload
@@ -26,6 +28,12 @@ from app.services.redis_service import redis_service
 
 logger = logging.getLogger(__name__)
 
+# Attempts at a fresh random referral code before giving up on a collision streak
+REFERRAL_CODE_ATTEMPTS = 5
+
+# Redis hash holding the cached platform growth counters
+PLATFORM_GROWTH_KEY = "platform:growth:counters"
+
 
 class UserAcquisitionService:
     """Service for user acquisition and growth features."""
@@ -40,19 +48,33 @@ class UserAcquisitionService:
 
     @staticmethod
     def create_referral_link(db: Session, user: User) -> str:
-        """Create a referral link for a user."""
+        """Create a referral link for a user (a newly assigned code is committed by the caller)."""
         if not user.referral_code:
-            # Generate referral code if user doesn't have one
-            referral_code = UserAcquisitionService.generate_referral_code(user.username)
-
-            # Ensure uniqueness
-            existing = db.query(User).filter(User.referral_code == referral_code).first()
-            while existing:
+            # Generate referral code if user doesn't have one; the unique index on
+            # referral_code enforces uniqueness, so just retry on a collision. Each
+            # attempt runs in a savepoint so a conflict doesn't abort the caller's transaction.
+            for _ in range(REFERRAL_CODE_ATTEMPTS):
                 referral_code = UserAcquisitionService.generate_referral_code(user.username)
-                existing = db.query(User).filter(User.referral_code == referral_code).first()
-
-            user.referral_code = referral_code
-            db.commit()
+                try:
+                    with db.begin_nested():
+                        row = db.execute(
+                            text(
+                                "UPDATE users SET referral_code = :code "
+                                "WHERE id = :user_id AND referral_code IS NULL RETURNING referral_code"
+                            ),
+                            {"code": referral_code, "user_id": user.id}
+                        ).first()
+                except IntegrityError:
+                    continue
+
+                if row is None:
+                    # A concurrent request assigned a code first; use that one
+                    db.refresh(user, ["referral_code"])
+                else:
+                    set_committed_value(user, "referral_code", row.referral_code)
+                break
+            else:
+                raise RuntimeError("Could not generate a unique referral code")
 
         # Cache referral data for analytics
         referral_data = {
@@ -65,14 +87,18 @@ class UserAcquisitionService:
             redis_service.redis_client.setex,
             f"referral:code:{user.referral_code}",
             86400,  # 24 hours
-            str(referral_data)
+            json.dumps(referral_data)
         )
 
         return f"https://mitchus.me/signup?ref={user.referral_code}"
 
     @staticmethod
     def track_referral_signup(db: Session, referral_code: str, new_user: User) -> bool:
-        """Track a new user signup from a referral."""
+        """Track a new user signup from a referral.
+
+        Runs inside the caller's signup transaction: new_user must be flushed
+        (so it has an id) and the caller commits.
+        """
         if not referral_code:
             return False
 
@@ -85,38 +111,28 @@ class UserAcquisitionService:
         # Update new user with referral info
         new_user.referred_by = referring_user.id
 
-        # Track referral in Redis for real-time analytics
-        redis_service._safe_operation(
-            redis_service.redis_client.hincrby,
-            f"referrals:user:{referring_user.id}",
-            "total_referrals",
-            1
-        )
-
-        # Track successful referral
-        redis_service._safe_operation(
-            redis_service.redis_client.lpush,
-            f"referrals:user:{referring_user.id}:recent",
-            f"{new_user.id}:{new_user.username}:{datetime.utcnow().isoformat()}"
-        )
+        # Track referral in Redis for real-time analytics, batched into one round trip
+        pipeline = redis_service._safe_operation(redis_service.redis_client.pipeline, transaction=False)
+        if pipeline:
+            pipeline.hincrby(f"referrals:user:{referring_user.id}", "total_referrals", 1)
 
-        # Limit recent referrals list to 50 items
-        redis_service._safe_operation(
-            redis_service.redis_client.ltrim,
-            f"referrals:user:{referring_user.id}:recent",
-            0, 49
-        )
+            # Track successful referral, limiting the recent list to 50 items
+            recent_key = f"referrals:user:{referring_user.id}:recent"
+            pipeline.lpush(recent_key, f"{new_user.id}:{new_user.username}:{datetime.utcnow().isoformat()}")
+            pipeline.ltrim(recent_key, 0, 49)
 
         # Award referral bonus (if applicable)
-        UserAcquisitionService.award_referral_bonus(db, referring_user, new_user)
+        UserAcquisitionService.award_referral_bonus(db, referring_user, new_user, pipeline)
+
+        if pipeline:
+            redis_service._safe_operation(pipeline.execute)
 
-        db.commit()
         logger.info(f"Successful referral: {new_user.username} referred by {referring_user.username}")
         return True
 
     @staticmethod
-    def award_referral_bonus(db: Session, referring_user: User, new_user: User):
-        """Award bonus for successful referral."""
+    def award_referral_bonus(db: Session, referring_user: User, new_user: User, pipeline=None):
+        """Award bonus for successful referral (queueing the Redis update on pipeline if given)."""
         # Award storage bonus to referring user (100MB bonus)
         storage_bonus = 100 * 1024 * 1024  # 100MB in bytes
         referring_user.storage_limit = (referring_user.storage_limit or 0) + storage_bonus
@@ -126,12 +142,15 @@ class UserAcquisitionService:
         new_user.storage_limit = (new_user.storage_limit or 0) + welcome_bonus
 
         # Track bonus in Redis for analytics
-        redis_service._safe_operation(
-            redis_service.redis_client.hincrby,
-            f"referrals:user:{referring_user.id}",
-            "total_bonus_mb",
-            100
-        )
+        if pipeline is not None:
+            pipeline.hincrby(f"referrals:user:{referring_user.id}", "total_bonus_mb", 100)
+        else:
+            redis_service._safe_operation(
+                redis_service.redis_client.hincrby,
+                f"referrals:user:{referring_user.id}",
+                "total_bonus_mb",
+                100
+            )
 
         logger.info(f"Awarded referral bonus: {referring_user.username} (+100MB), {new_user.username} (+50MB)")
 
@@ -168,17 +187,16 @@ class UserAcquisitionService:
             "cached": False
         }
 
-        # Cache for future requests
-        redis_service._safe_operation(
-            redis_service.redis_client.hmset,
-            f"referrals:user:{user_id}",
-            analytics
-        )
-        redis_service._safe_operation(
-            redis_service.redis_client.expire,
-            f"referrals:user:{user_id}",
-            3600  # 1 hour
-        )
+        # Cache for future requests (1 hour), in one round trip
+        pipeline = redis_service._safe_operation(redis_service.redis_client.pipeline, transaction=False)
+        if pipeline:
+            # Only the counters; redis-py rejects the boolean "cached" flag
+            pipeline.hset(
+                f"referrals:user:{user_id}",
+                mapping={"total_referrals": total_referrals, "total_bonus_mb": total_bonus}
+            )
+            pipeline.expire(f"referrals:user:{user_id}", 3600)
+            redis_service._safe_operation(pipeline.execute)
 
         return analytics
 
@@ -214,41 +232,62 @@ class UserAcquisitionService:
         return config
 
     @staticmethod
-    def get_platform_growth_stats() -> Dict[str, Any]:
+    def get_platform_growth_stats(db: Session) -> Dict[str, Any]:
         """Get overall platform growth statistics."""
-        # Try Redis cache first
+        # Counters live as numeric fields of one Redis hash, so a single HGETALL
+        # rehydrates them all
         cached_stats = redis_service._safe_operation(
-            redis_service.redis_client.get,
-            "platform:growth:stats"
+            redis_service.redis_client.hgetall,
+            PLATFORM_GROWTH_KEY
         )
 
         if cached_stats:
-            return json.loads(cached_stats)
-
-        # This would typically come from database aggregations
-        # For now, we'll return sample data that could be computed
-        stats = {
-            "total_users": 0,
-            "users_this_week": 0,
-            "users_this_month": 0,
-            "total_uploads": 0,
-            "uploads_this_week": 0,
-            "referral_signups": 0,
-            "oauth_signups": 0,
-            "direct_signups": 0,
-            "top_referrers": [],
-            "growth_rate": 0.0
+            stats = {field: int(value) for field, value in cached_stats.items() if field != "growth_rate"}
+            stats["growth_rate"] = float(cached_stats.get("growth_rate", 0.0))
+            stats["top_referrers"] = []
+            return stats
+
+        # One aggregate pass over each table, using FILTER for the windowed counts
+        now = datetime.utcnow()
+        week_ago = now - timedelta(days=7)
+        has_oauth = or_(User.discord_id.isnot(None), User.google_id.isnot(None), User.github_id.isnot(None))
+        users = db.query(
+            func.count(User.id).label("total"),
+            func.count(User.id).filter(User.created_at >= week_ago).label("week"),
+            func.count(User.id).filter(
+                User.created_at >= now - timedelta(days=14), User.created_at < week_ago
+            ).label("last_week"),
+            func.count(User.id).filter(User.created_at >= now - timedelta(days=30)).label("month"),
+            func.count(User.referred_by).label("referred"),
+            func.count(User.id).filter(has_oauth).label("oauth"),
+            func.count(User.id).filter(User.referred_by.is_(None), ~has_oauth).label("direct"),
+        ).one()
+        uploads = db.query(
+            func.count(Upload.id).label("total"),
+            func.count(Upload.id).filter(Upload.created_at >= week_ago).label("week"),
+        ).one()
+
+        counters = {
+            "total_users": users.total,
+            "users_this_week": users.week,
+            "users_this_month": users.month,
+            "total_uploads": uploads.total,
+            "uploads_this_week": uploads.week,
+            "referral_signups": users.referred,
+            "oauth_signups": users.oauth,
+            "direct_signups": users.direct,
+            # Week-over-week change in signups, as a percentage
+            "growth_rate": round((users.week - users.last_week) / users.last_week * 100, 1) if users.last_week else 0.0,
         }
 
         # Cache for 30 minutes
-        redis_service._safe_operation(
-            redis_service.redis_client.setex,
-            "platform:growth:stats",
-            1800,
-            json.dumps(stats)
-        )
+        pipeline = redis_service._safe_operation(redis_service.redis_client.pipeline, transaction=False)
+        if pipeline:
+            pipeline.hset(PLATFORM_GROWTH_KEY, mapping=counters)
+            pipeline.expire(PLATFORM_GROWTH_KEY, 1800)
+            redis_service._safe_operation(pipeline.execute)
 
-        return stats
+        return {**counters, "top_referrers": []}
 
     @staticmethod
     def create_onboarding_checklist(user: User) -> Dict[str, Any]:
@@ -9,13 +9,17 @@ For production deployment, configure a cron job or use a task scheduler like Cel
 
 Usage:
     python -m app.services.view_aggregation_service --date YYYY-MM-DD
+    python -m app.services.view_aggregation_service --incremental
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import DateTime, String, and_, bindparam, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from app.core.database import SessionLocal
-from app.models.views import FileView, ProfileView, ViewSummary
+from app.models.views import FileView, ProfileView, ViewSummary, PARTITION_MONTHS_AHEAD
+from app.services.redis_service import redis_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +28,111 @@ logger = logging.getLogger(__name__)
 class ViewAggregationService:
     """Service for aggregating view data into summary tables."""
 
+    @staticmethod
+    def _rollup(db: Session, content_type: str, content_column, view_model, start_of_day: datetime) -> int:
+        """
+        Aggregate one day of views into view_summaries with a single INSERT ... SELECT.
+
+        The GROUP BY runs in the database and the result is upserted on the
+        unique (content_type, content_id, date) index, so no rows travel to
+        Python and a re-run for the same day replaces the earlier figures.
+
+        Returns:
+            Number of summary rows written
+        """
+        # Rolling up a day still in progress stops at now, so the watermark
+        # never runs ahead and later incremental runs pick up from there
+        until = min(start_of_day + timedelta(days=1), datetime.utcnow())
+        rollup = select(
+            literal(content_type, String),
+            content_column,
+            literal(start_of_day, DateTime),
+            func.count(),
+            func.count(func.distinct(view_model.viewer_ip)),
+            literal(until, DateTime)
+        ).where(
+            view_model.viewed_at >= start_of_day,
+            view_model.viewed_at < until
+        ).group_by(content_column)
+
+        stmt = pg_insert(ViewSummary).from_select(
+            ['content_type', 'content_id', 'date', 'view_count', 'unique_viewers', 'last_aggregated_at'], rollup
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['content_type', 'content_id', 'date'],
+            set_={
+                'view_count': stmt.excluded.view_count,
+                'unique_viewers': stmt.excluded.unique_viewers,
+                'last_aggregated_at': stmt.excluded.last_aggregated_at,
+            }
+        )
+        return db.execute(stmt).rowcount
+
+    @staticmethod
+    def _rollup_incremental(db: Session, content_type: str, content_column, view_model, until: datetime) -> int:
+        """
+        Add views recorded since each summary's watermark into today's summaries.
+
+        Only views in [last_aggregated_at, until) are scanned and their count is
+        added to the stored view_count. Distinct viewers cannot be merged
+        across SQL batches, so unique_viewers is raised to the day's Redis
+        HyperLogLog estimate where one exists (otherwise the batch's count is
+        kept as a lower bound) and made exact by the full-day rollup once the
+        day is over.
+
+        Returns:
+            Number of summary rows written
+        """
+        start_of_day = until.replace(hour=0, minute=0, second=0, microsecond=0)
+        rollup = select(
+            literal(content_type, String),
+            content_column,
+            literal(start_of_day, DateTime),
+            func.count(),
+            func.count(func.distinct(view_model.viewer_ip)),
+            literal(until, DateTime)
+        ).select_from(view_model).outerjoin(
+            ViewSummary,
+            and_(
+                ViewSummary.content_type == content_type,
+                ViewSummary.content_id == content_column,
+                ViewSummary.date == start_of_day
+            )
+        ).where(
+            view_model.viewed_at >= start_of_day,
+            view_model.viewed_at >= func.coalesce(ViewSummary.last_aggregated_at, start_of_day),
+            view_model.viewed_at < until
+        ).group_by(content_column)
+
+        stmt = pg_insert(ViewSummary).from_select(
+            ['content_type', 'content_id', 'date', 'view_count', 'unique_viewers', 'last_aggregated_at'], rollup
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['content_type', 'content_id', 'date'],
+            set_={
+                'view_count': ViewSummary.view_count + stmt.excluded.view_count,
+                'unique_viewers': func.greatest(ViewSummary.unique_viewers, stmt.excluded.unique_viewers),
+                'last_aggregated_at': stmt.excluded.last_aggregated_at,
+            }
+        ).returning(ViewSummary.content_id)
+        content_ids = db.execute(stmt).scalars().all()
+
+        estimates = redis_service.count_unique_viewers(
+            content_type, content_ids, int(start_of_day.strftime("%Y%m%d"))
+        )
+        if estimates:
+            summaries = ViewSummary.__table__
+            db.execute(
+                update(summaries).where(
+                    summaries.c.content_type == content_type,
+                    summaries.c.content_id == bindparam('summary_content_id'),
+                    summaries.c.date == start_of_day
+                ).values(unique_viewers=func.greatest(summaries.c.unique_viewers, bindparam('estimate'))),
+                [{"summary_content_id": cid, "estimate": n} for cid, n in estimates.items()]
+            )
+
+        return len(content_ids)
+
     @staticmethod
     def aggregate_file_views(db: Session, target_date: datetime) -> int:
         """
@@ -38,44 +147,8 @@ class ViewAggregationService:
         """
         # Truncate to start of day
         start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = start_of_day + timedelta(days=1)
-
-        # Query aggregated data
-        results = db.query(
-            FileView.upload_id,
-            func.count(FileView.id).label('view_count'),
-            func.count(func.distinct(FileView.viewer_ip)).label('unique_viewers')
-        ).filter(
-            FileView.viewed_at >= start_of_day,
-            FileView.viewed_at < end_of_day
-        ).group_by(
-            FileView.upload_id
-        ).all()
-
-        count = 0
-        for result in results:
-            # Check if summary already exists
-            existing = db.query(ViewSummary).filter(
-                ViewSummary.content_type == 'file',
-                ViewSummary.content_id == result.upload_id,
-                ViewSummary.date == start_of_day
-            ).first()
-
-            if existing:
-                # Update existing summary
-                existing.view_count = result.view_count
-                existing.unique_viewers = result.unique_viewers
-            else:
-                # Create new summary
-                summary = ViewSummary(
-                    content_type='file',
-                    content_id=result.upload_id,
-                    date=start_of_day,
-                    view_count=result.view_count,
-                    unique_viewers=result.unique_viewers
-                )
-                db.add(summary)
-            count += 1
+
+        count = ViewAggregationService._rollup(db, 'file', FileView.upload_id, FileView, start_of_day)
 
         db.commit()
         logger.info(f"Aggregated {count} file view summaries for {start_of_day.date()}")
@@ -95,49 +168,65 @@ class ViewAggregationService:
         """
         # Truncate to start of day
         start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = start_of_day + timedelta(days=1)
-
-        # Query aggregated data
-        results = db.query(
-            ProfileView.profile_user_id,
-            func.count(ProfileView.id).label('view_count'),
-            func.count(func.distinct(ProfileView.viewer_ip)).label('unique_viewers')
-        ).filter(
-            ProfileView.viewed_at >= start_of_day,
-            ProfileView.viewed_at < end_of_day
-        ).group_by(
-            ProfileView.profile_user_id
-        ).all()
-
-        count = 0
-        for result in results:
-            # Check if summary already exists
-            existing = db.query(ViewSummary).filter(
-                ViewSummary.content_type == 'profile',
-                ViewSummary.content_id == result.profile_user_id,
-                ViewSummary.date == start_of_day
-            ).first()
-
-            if existing:
-                # Update existing summary
-                existing.view_count = result.view_count
-                existing.unique_viewers = result.unique_viewers
-            else:
-                # Create new summary
-                summary = ViewSummary(
-                    content_type='profile',
-                    content_id=result.profile_user_id,
-                    date=start_of_day,
-                    view_count=result.view_count,
-                    unique_viewers=result.unique_viewers
-                )
-                db.add(summary)
-            count += 1
+
+        count = ViewAggregationService._rollup(db, 'profile', ProfileView.profile_user_id, ProfileView, start_of_day)
 
         db.commit()
         logger.info(f"Aggregated {count} profile view summaries for {start_of_day.date()}")
         return count
 
+    @staticmethod
+    def run_incremental_aggregation(until: datetime = None):
+        """
+        Fold today's new views into the summaries, scanning only the delta.
+
+        Cheap enough for an hourly (or more frequent) schedule; the daily run
+        for the previous day still finalizes exact unique viewer counts.
+
+        Args:
+            until: Aggregate views recorded before this time. Defaults to now.
+        """
+        if until is None:
+            until = datetime.utcnow()
+
+        db = SessionLocal()
+        try:
+            file_count = ViewAggregationService._rollup_incremental(db, 'file', FileView.upload_id, FileView, until)
+            profile_count = ViewAggregationService._rollup_incremental(
+                db, 'profile', ProfileView.profile_user_id, ProfileView, until
+            )
+            db.commit()
+
+            logger.info(
+                f"Incremental aggregation up to {until.isoformat()}: "
+                f"{file_count} file summaries, {profile_count} profile summaries"
+            )
+        except Exception as e:
+            logger.error(f"Error during incremental view aggregation: {str(e)}")
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def ensure_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD):
+        """
+        Make sure the monthly view partitions exist for the coming months.
+
+        Views outside every monthly partition land in the default partition,
+        which is never pruned, so new months are created well ahead of time.
+
+        Args:
+            db: Database session
+            months_ahead: Number of months past the current one to create
+        """
+        for table in (FileView.__tablename__, ProfileView.__tablename__):
+            db.execute(
+                text("SELECT ensure_monthly_partitions(:parent, CAST(now() AS date), :months_ahead)"),
+                {"parent": table, "months_ahead": months_ahead},
+            )
+        db.commit()
+
     @staticmethod
     def run_daily_aggregation(target_date: datetime = None):
         """
@@ -154,20 +243,44 @@ class ViewAggregationService:
 
         db = SessionLocal()
         try:
-            file_count = ViewAggregationService.aggregate_file_views(db, target_date)
-            profile_count = ViewAggregationService.aggregate_profile_views(db, target_date)
-
-            logger.info(
-                f"Aggregation complete: {file_count} file summaries, "
-                f"{profile_count} profile summaries"
-            )
+            ViewAggregationService.ensure_partitions(db)
         except Exception as e:
-            logger.error(f"Error during view aggregation: {str(e)}")
+            # Missing partitions only push new views into the default partition;
+            # don't let that stop the rollup itself
+            logger.error(f"Error ensuring view partitions: {str(e)}")
             db.rollback()
-            raise
         finally:
             db.close()
 
+        # The two rollups touch disjoint tables; run them side by side on separate connections
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(_run_in_session, ViewAggregationService.aggregate_file_views, target_date),
+                executor.submit(_run_in_session, ViewAggregationService.aggregate_profile_views, target_date),
+            ]
+            try:
+                file_count, profile_count = [future.result() for future in futures]
+            except Exception as e:
+                logger.error(f"Error during view aggregation: {str(e)}")
+                raise
+
+        logger.info(
+            f"Aggregation complete: {file_count} file summaries, "
+            f"{profile_count} profile summaries"
+        )
+
+
+def _run_in_session(aggregate, target_date: datetime) -> int:
+    """Run one aggregation on its own session so it can execute in a worker thread."""
+    db = SessionLocal()
+    try:
+        return aggregate(db, target_date)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 
 # CLI interface for running as a cron job
 if __name__ == "__main__":
@@ -185,6 +298,11 @@ if __name__ == "__main__":
         type=str,
         help='Date to aggregate (YYYY-MM-DD format). Defaults to yesterday.'
     )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="Fold today's new views into the summaries instead of recomputing a full day."
+    )
 
     args = parser.parse_args()
 
@@ -197,7 +315,10 @@ if __name__ == "__main__":
             sys.exit(1)
 
     try:
-        ViewAggregationService.run_daily_aggregation(target_date)
+        if args.incremental:
+            ViewAggregationService.run_incremental_aggregation()
+        else:
+            ViewAggregationService.run_daily_aggregation(target_date)
         print(f"✅ View aggregation completed successfully")
     except Exception as e:
         print(f"❌ View aggregation failed: {str(e)}", file=sys.stderr)
@@ -5,11 +5,31 @@ This module provides security-related utility functions for input sanitization,
 validation, and security checks.
 """
 
-import html
+import functools
+import os
 import re
+import secrets
+from ipaddress import ip_address
 from typing import Optional, List
 from urllib.parse import urlparse
 
+from markupsafe import escape
+
+# Compiled once at import; these run on every sanitized request field
+_DANGEROUS_RE = re.compile(
+    r'javascript:|data:|vbscript:|onload=|onerror=|onclick=|onmouseover=',
+    re.IGNORECASE
+)
+# Path separators and characters unsafe in filenames, all mapped to '_'
+_FILENAME_TABLE = str.maketrans({c: '_' for c in '/\\<>:"|?*' + ''.join(map(chr, range(32)))})
+# str.translate table deleting control characters except tab and newline
+_CTRL_TABLE = {c: None for c in range(32) if c not in (0x09, 0x0A)}
+_CTRL_TABLE[0x7F] = None
+_BAD_EXTENSIONS = frozenset({
+    '.exe', '.bat', '.cmd', '.com', '.pif', '.scr', '.vbs', '.js',
+    '.jar', '.php', '.asp', '.aspx', '.jsp', '.py', '.rb', '.pl'
+})
+
 
 def sanitize_html_input(text: str) -> str:
     """
@@ -25,21 +45,17 @@ def sanitize_html_input(text: str) -> str:
         return ""
 
     # HTML escape the input
-    sanitized = html.escape(text, quote=True)
-
-    # Remove any remaining potentially dangerous patterns
-    dangerous_patterns = [
-        r'javascript:',
-        r'data:',
-        r'vbscript:',
-        r'onload=',
-        r'onerror=',
-        r'onclick=',
-        r'onmouseover=',
-    ]
-
-    for pattern in dangerous_patterns:
-        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
+    sanitized = str(escape(text))
+
+    # Every dangerous pattern ends in ':' or '='; plain text skips the regex entirely
+    if ':' not in sanitized and '=' not in sanitized:
+        return sanitized
+
+    # Remove any remaining potentially dangerous patterns; repeat until none are
+    # left so that removing one cannot splice together another
+    removed = 1
+    while removed:
+        sanitized, removed = _DANGEROUS_RE.subn('', sanitized)
 
     return sanitized
 
@@ -57,12 +73,9 @@ def sanitize_filename(filename: str) -> str:
     if not filename:
         return "unnamed_file"
 
-    # Remove any directory traversal attempts
-    filename = filename.replace('/', '_').replace('\\', '_')
-    filename = filename.replace('..', '_')
-
-    # Remove dangerous characters
-    filename = re.sub(r'[<>:"|?*\x00-\x1f]', '_', filename)
+    # Replace path separators and dangerous characters in one pass, then
+    # remove any directory traversal attempts
+    filename = filename.translate(_FILENAME_TABLE).replace('..', '_')
 
     # Limit length
     if len(filename) > 255:
@@ -86,17 +99,29 @@ def validate_url(url: str, allowed_schemes: List[str] = None) -> bool:
     if not url:
         return False
 
-    if allowed_schemes is None:
-        allowed_schemes = ['http', 'https']
+    schemes = ('http', 'https') if allowed_schemes is None else tuple(allowed_schemes)
+    return _validate_url_cached(url, schemes)
+
 
+@functools.lru_cache(maxsize=4096)
+def _validate_url_cached(url: str, allowed_schemes: tuple) -> bool:
+    """Memoized body of validate_url; the result depends only on its arguments."""
     try:
         parsed = urlparse(url)
-        return (
-            parsed.scheme in allowed_schemes and
-            parsed.netloc and
-            not parsed.netloc.startswith('localhost') and
-            not re.match(r'^(127\.|10\.|192\.168\.|172\.(1[6-9]|2[0-9]|3[0-1])\.)', parsed.netloc)
-        )
+        host = parsed.hostname or ''
+        if (
+            parsed.scheme not in allowed_schemes or
+            not parsed.netloc or
+            host.startswith('localhost')
+        ):
+            return False
+
+        try:
+            # Rejects private, loopback, link-local, CGNAT and reserved ranges, v4 and v6
+            return ip_address(host).is_global
+        except ValueError:
+            # Not an IP literal; a regular hostname
+            return True
     except Exception:
         return False
 
@@ -123,10 +148,10 @@ def sanitize_user_input(text: str, max_length: int = 1000) -> str:
         text = text[:max_length]
 
     # HTML escape
-    text = html.escape(text, quote=True)
+    text = str(escape(text))
 
-    # Remove control characters except newlines and tabs
-    text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\t')
+    # Remove control characters (and DEL) except newlines and tabs
+    text = text.translate(_CTRL_TABLE)
 
     return text
 
@@ -148,15 +173,9 @@ def validate_upload_filename(filename: str) -> tuple[bool, Optional[str]]:
         return False, "Filename too long (max 255 characters)"
 
     # Check for dangerous extensions
-    dangerous_extensions = [
-        '.exe', '.bat', '.cmd', '.com', '.pif', '.scr', '.vbs', '.js',
-        '.jar', '.php', '.asp', '.aspx', '.jsp', '.py', '.rb', '.pl'
-    ]
-
-    filename_lower = filename.lower()
-    for ext in dangerous_extensions:
-        if filename_lower.endswith(ext):
-            return False, f"File type {ext} not allowed"
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in _BAD_EXTENSIONS:
+        return False, f"File type {ext} not allowed"
 
     # Check for hidden files or relative paths
     if filename.startswith('.') or '/' in filename or '\\' in filename:
@@ -170,13 +189,12 @@ def generate_secure_token(length: int = 32) -> str:
     Generate a cryptographically secure random token.
 
     Args:
-        length: Token length in bytes
+        length: Number of random bytes
 
     Returns:
-        Hex-encoded random token
+        URL-safe base64 random token
     """
-    import secrets
-    return secrets.token_hex(length)
+    return secrets.token_urlsafe(length)
 
 
 def is_safe_redirect_url(url: str, allowed_hosts: List[str]) -> bool:
@@ -6,6 +6,8 @@ This script compares performance between direct database queries
 and Redis-cached responses to demonstrate the improvements.
 """
 
+import os
+import statistics
 import time
 import sys
 from datetime import datetime, timedelta
@@ -16,14 +18,28 @@ from app.services.redis_service import redis_service
 from app.core.database import get_db
 from app.models.upload import Upload
 from app.models.user import User
-from sqlalchemy import func
+from sqlalchemy import func, text
 
-def time_operation(func, *args, **kwargs):
-    """Time a function execution."""
-    start = time.time()
-    result = func(*args, **kwargs)
-    end = time.time()
-    return result, (end - start) * 1000  # Return result and time in ms
+def time_operation(fn, *args, iters=100, warmup=10, **kwargs):
+    """
+    Time a function over repeated runs after a warm-up.
+
+    Returns the result plus the median and p95 latency in ms, so a single cold
+    call (connection setup, empty caches) does not dominate the numbers.
+    """
+    for _ in range(warmup):
+        fn(*args, **kwargs)
+
+    samples = []
+    for _ in range(iters):
+        start = time.perf_counter_ns()
+        fn(*args, **kwargs)
+        samples.append(time.perf_counter_ns() - start)
+
+    samples.sort()
+    median_ms = statistics.median(samples) / 1e6
+    p95_ms = samples[min(len(samples) - 1, int(len(samples) * 0.95))] / 1e6
+    return fn(*args, **kwargs), median_ms, p95_ms
 
 def benchmark_user_counts():
     """Benchmark user count queries: DB vs Redis."""
@@ -44,16 +60,16 @@ def benchmark_user_counts():
         return redis_service.get_cached_user_counts(user_id)
 
     # Run database query
-    db_result, db_time = time_operation(db_query)
-    print(f"📊 Database Query: {db_time:.2f}ms")
+    db_result, db_time, db_p95 = time_operation(db_query)
+    print(f"📊 Database Query: {db_time:.2f}ms (p95 {db_p95:.2f}ms)")
 
     # Cache the data first
     if db_result:
         redis_service.cache_user_counts(user_id, db_result["upload_count"], db_result["storage_used"])
 
     # Run Redis query
-    redis_result, redis_time = time_operation(redis_query)
-    print(f"⚡ Redis Query: {redis_time:.2f}ms")
+    redis_result, redis_time, redis_p95 = time_operation(redis_query)
+    print(f"⚡ Redis Query: {redis_time:.2f}ms (p95 {redis_p95:.2f}ms)")
 
     if db_time > 0 and redis_time > 0:
         speedup = db_time / redis_time
@@ -68,30 +84,38 @@ def benchmark_view_counts():
     print("\n🔥 Benchmarking View Count Queries")
     print("-" * 40)
 
+    db = next(get_db())
     upload_id = 63  # Use existing upload
 
     # Redis query timing (direct counter access)
     def redis_query():
         return redis_service.get_file_view_count(upload_id)
 
-    # Simulate database aggregation timing
-    def simulate_db_query():
-        # Simulate time for complex aggregation
-        time.sleep(0.01)  # 10ms simulation
-        return {"total": 5, "today": 5}
+    # Database aggregation over the raw view rows
+    def db_query():
+        row = db.execute(
+            text(
+                "SELECT COUNT(*) AS total, "
+                "COUNT(*) FILTER (WHERE viewed_at >= CURRENT_DATE) AS today "
+                "FROM file_views WHERE upload_id = :upload_id"
+            ),
+            {"upload_id": upload_id}
+        ).one()
+        return {"total": row.total, "today": row.today}
 
     # Run queries
-    redis_result, redis_time = time_operation(redis_query)
-    db_result, db_time = time_operation(simulate_db_query)
+    redis_result, redis_time, redis_p95 = time_operation(redis_query)
+    db_result, db_time, db_p95 = time_operation(db_query)
 
-    print(f"📊 Database Aggregation: {db_time:.2f}ms")
-    print(f"⚡ Redis Counter: {redis_time:.2f}ms")
+    print(f"📊 Database Aggregation: {db_time:.2f}ms (p95 {db_p95:.2f}ms)")
+    print(f"⚡ Redis Counter: {redis_time:.2f}ms (p95 {redis_p95:.2f}ms)")
 
     if db_time > 0 and redis_time > 0:
         speedup = db_time / redis_time
         print(f"🚀 Speedup: {speedup:.1f}x faster")
         print(f"💾 Time Saved: {db_time - redis_time:.2f}ms")
 
+    db.close()
     return db_time, redis_time
 
 def benchmark_analytics_caching():
@@ -99,38 +123,44 @@ def benchmark_analytics_caching():
     print("\n🔥 Benchmarking Analytics Queries")
     print("-" * 40)
 
+    db = next(get_db())
     content_id = 123
 
-    # Simulate expensive analytics computation
-    def simulate_analytics_computation():
-        time.sleep(0.02)  # 20ms simulation for complex aggregations
-        return {
-            "total_views": 100,
-            "unique_viewers": 50,
-            "views_today": 10,
-            "views_this_week": 75,
-            "views_this_month": 95
-        }
+    # The per-file analytics aggregation, run against the raw view rows
+    def analytics_computation():
+        row = db.execute(
+            text(
+                "SELECT COUNT(*) AS total_views, "
+                "COUNT(DISTINCT viewer_ip) AS unique_viewers, "
+                "COUNT(*) FILTER (WHERE viewed_at >= CURRENT_DATE) AS views_today, "
+                "COUNT(*) FILTER (WHERE viewed_at >= CURRENT_DATE - INTERVAL '7 days') AS views_this_week, "
+                "COUNT(*) FILTER (WHERE viewed_at >= CURRENT_DATE - INTERVAL '30 days') AS views_this_month "
+                "FROM file_views WHERE upload_id = :upload_id"
+            ),
+            {"upload_id": content_id}
+        ).one()
+        return dict(row._mapping)
 
     # Redis cache lookup
     def redis_analytics():
         return redis_service.get_cached_analytics("file", content_id)
 
     # Run computation and cache it
-    computed_data, computation_time = time_operation(simulate_analytics_computation)
+    computed_data, computation_time, computation_p95 = time_operation(analytics_computation)
     redis_service.cache_analytics("file", content_id, computed_data)
 
     # Run Redis lookup
-    cached_data, cache_time = time_operation(redis_analytics)
+    cached_data, cache_time, cache_p95 = time_operation(redis_analytics)
 
-    print(f"📊 Analytics Computation: {computation_time:.2f}ms")
-    print(f"⚡ Redis Cache Lookup: {cache_time:.2f}ms")
+    print(f"📊 Analytics Computation: {computation_time:.2f}ms (p95 {computation_p95:.2f}ms)")
+    print(f"⚡ Redis Cache Lookup: {cache_time:.2f}ms (p95 {cache_p95:.2f}ms)")
 
     if computation_time > 0 and cache_time > 0:
         speedup = computation_time / cache_time
         print(f"🚀 Speedup: {speedup:.1f}x faster")
         print(f"💾 Time Saved: {computation_time - cache_time:.2f}ms")
 
+    db.close()
     return computation_time, cache_time
 
 def run_comprehensive_benchmark():
@@ -140,6 +170,10 @@ def run_comprehensive_benchmark():
     print(f"📅 Test Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 60)
 
+    # Pin to one CPU so scheduler migrations don't add noise (Linux only)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+
     # Check Redis connectivity
     if not redis_service.is_connected():
         print("❌ Redis not connected! Cannot run benchmarks.")
@@ -169,6 +203,7 @@ def run_comprehensive_benchmark():
     print("📊 BENCHMARK SUMMARY")
     print("=" * 60)
 
+    # Per-benchmark figures are medians; averaged here across benchmarks
     avg_db_time = sum(db_times) / len(db_times)
     avg_redis_time = sum(redis_times) / len(redis_times)
     overall_speedup = avg_db_time / avg_redis_time if avg_redis_time > 0 else 0
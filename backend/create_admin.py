@@ -7,6 +7,7 @@ Run this script to create the first admin user for the application.
 import asyncio
 import sys
 from getpass import getpass
+from sqlalchemy import exists, insert, or_, select
 from sqlalchemy.orm import Session
 
 from app.core.database import SessionLocal
@@ -46,28 +47,28 @@ def create_admin_user():
     
     try:
         # Check if user already exists
-        existing_user = db.query(User).filter(
-            (User.username == username) | (User.email == email)
-        ).first()
+        taken = db.query(
+            exists().where(or_(User.username == username, User.email == email))
+        ).scalar()
         
-        if existing_user:
+        if taken:
             print(f"User with username '{username}' or email '{email}' already exists!")
             return False
         
         # Create admin user
         hashed_password = get_password_hash(password)
-        admin_user = User(
-            username=username,
-            email=email,
-            hashed_password=hashed_password,
-            is_admin=True,
-            is_active=True,
-            is_verified=True
-        )
-        
-        db.add(admin_user)
+        # INSERT ... RETURNING hands back the generated id without a refresh SELECT
+        admin_user = db.execute(
+            insert(User).values(
+                username=username,
+                email=email,
+                hashed_password=hashed_password,
+                is_admin=True,
+                is_active=True,
+                is_verified=True
+            ).returning(User.id, User.email, User.is_admin)
+        ).one()
         db.commit()
-        db.refresh(admin_user)
         
         print(f"✅ Admin user '{username}' created successfully!")
         print(f"User ID: {admin_user.id}")
@@ -133,7 +134,13 @@ def list_admin_users():
     db: Session = SessionLocal()
     
     try:
-        admins = db.query(User).filter(User.is_admin == True).all()
+        # Only the displayed columns; skips password hashes, bios etc. and ORM hydration
+        admins = db.execute(
+            select(
+                User.id, User.username, User.email,
+                User.is_active, User.is_verified, User.created_at
+            ).where(User.is_admin.is_(True))
+        ).all()
         
         if not admins:
             print("No admin users found!")
@@ -36,15 +36,14 @@ def initialize_rate_limiting():
         client = redis_service.client
         whitelist_key = "rate_limit:whitelist"
         
-        # Get current whitelist
-        current_whitelist = set(client.smembers(whitelist_key))
-        
-        # Add missing IPs to whitelist
-        added_ips = []
+        # One round trip: SADD reports 1 only for IPs that were newly added,
+        # and the final SMEMBERS rides along in the same pipeline
+        pipe = client.pipeline(transaction=False)
         for ip in default_whitelist:
-            if ip not in current_whitelist:
-                client.sadd(whitelist_key, ip)
-                added_ips.append(ip)
+            pipe.sadd(whitelist_key, ip)
+        pipe.smembers(whitelist_key)
+        *added_flags, final_whitelist = pipe.execute()
+        added_ips = [ip for ip, added in zip(default_whitelist, added_flags) if added]
         
         if added_ips:
             print(f"✅ Added {len(added_ips)} IPs to whitelist: {', '.join(added_ips)}")
@@ -52,7 +51,6 @@ def initialize_rate_limiting():
             print("ℹ️  All default IPs already whitelisted")
             
         # Show current whitelist
-        final_whitelist = list(client.smembers(whitelist_key))
         print(f"📋 Current whitelist ({len(final_whitelist)} IPs):")
         for ip in sorted(final_whitelist):
             print(f"   {ip}")
@@ -0,0 +1,132 @@
+"""partition_view_tables
+
+Revision ID: 2c8e5a71f0b9
+Revises: 6f0c93b7a2e4
+Create Date: 2026-10-16 15:12:08.604517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c8e5a71f0b9'
+down_revision: Union[str, Sequence[str], None] = '6f0c93b7a2e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Creates one partition per month from from_month through the current month + months_ahead.
+# Also called by the daily aggregation job so upcoming months always exist.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, from_month date, months_ahead int)
+RETURNS void AS $$
+DECLARE
+    m date := date_trunc('month', from_month)::date;
+    last_month date := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+BEGIN
+    WHILE m <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_p' || to_char(m, 'YYYYMM'), parent, m, (m + interval '1 month')::date
+        );
+        m := (m + interval '1 month')::date;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# Foreign keys per table, re-added after the table is rebuilt
+VIEW_TABLES = {
+    'file_views': [
+        'FOREIGN KEY (upload_id) REFERENCES uploads (id) ON DELETE CASCADE',
+    ],
+    'profile_views': [
+        'FOREIGN KEY (profile_user_id) REFERENCES users (id) ON DELETE CASCADE',
+        'FOREIGN KEY (viewer_user_id) REFERENCES users (id) ON DELETE SET NULL',
+    ],
+}
+
+
+def _rebuild(table: str, partitioned: bool) -> None:
+    """Swap a view table for a copy that is (or is no longer) range-partitioned."""
+    op.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+    op.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+    op.execute(f'ALTER INDEX {table}_pkey RENAME TO {table}_old_pkey')
+
+    partition_clause = ' PARTITION BY RANGE (viewed_at)' if partitioned else ''
+    op.execute(
+        f'CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        f'{partition_clause}'
+    )
+    # A partitioned table's primary key must include the partition column
+    pk_columns = 'id, viewed_at' if partitioned else 'id'
+    op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pk_columns})')
+    for foreign_key in VIEW_TABLES[table]:
+        op.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+
+    if partitioned:
+        op.execute(
+            f"SELECT ensure_monthly_partitions('{table}', "
+            f"COALESCE((SELECT min(viewed_at) FROM {table}_old), now())::date, 3)"
+        )
+        # Catches anything outside the pre-created months instead of failing the insert
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    op.execute(f'INSERT INTO {table} SELECT * FROM {table}_old')
+    # The id sequence is owned by the old table; move it before that table is dropped
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'DROP TABLE {table}_old')
+
+
+def _create_view_indexes() -> None:
+    """Recreate the view table indexes on the rebuilt tables."""
+    op.create_index('ix_file_views_id', 'file_views', ['id'])
+    op.create_index(
+        'idx_file_views_upload_time_ip', 'file_views', ['upload_id', 'viewed_at'],
+        postgresql_include=['viewer_ip']
+    )
+    op.create_index('idx_file_views_ip_time', 'file_views', ['viewer_ip', 'viewed_at'])
+    op.create_index(
+        'ix_file_views_viewed_upload', 'file_views', ['viewed_at', 'upload_id'],
+        postgresql_include=['viewer_ip']
+    )
+    op.create_index(
+        'idx_file_views_viewed_at_brin', 'file_views', ['viewed_at'],
+        postgresql_using='brin', postgresql_with={'pages_per_range': 32}
+    )
+
+    op.create_index('ix_profile_views_id', 'profile_views', ['id'])
+    op.create_index(
+        'idx_profile_views_user_time_ip', 'profile_views', ['profile_user_id', 'viewed_at'],
+        postgresql_include=['viewer_ip']
+    )
+    op.create_index('idx_profile_views_ip_time', 'profile_views', ['viewer_ip', 'viewed_at'])
+    op.create_index(
+        'ix_profile_views_viewed_profile', 'profile_views', ['viewed_at', 'profile_user_id'],
+        postgresql_include=['viewer_ip']
+    )
+    op.create_index(
+        'idx_profile_views_viewed_at_brin', 'profile_views', ['viewed_at'],
+        postgresql_using='brin', postgresql_with={'pages_per_range': 32}
+    )
+
+
+def upgrade() -> None:
+    """Convert file_views and profile_views to monthly range partitions on viewed_at."""
+    # Rewrites both tables under an EXCLUSIVE lock (reads allowed, writes blocked);
+    # run during a maintenance window on large installs
+    op.execute(ENSURE_PARTITIONS_FUNCTION)
+    for table in VIEW_TABLES:
+        _rebuild(table, partitioned=True)
+    _create_view_indexes()
+
+
+def downgrade() -> None:
+    """Fold the partitions back into plain file_views and profile_views tables."""
+    for table in VIEW_TABLES:
+        _rebuild(table, partitioned=False)
+    _create_view_indexes()
+    op.execute('DROP FUNCTION IF EXISTS ensure_monthly_partitions(text, date, int)')
@@ -0,0 +1,28 @@
+"""add_view_summary_watermark
+
+Revision ID: 5e2b8d1c7f43
+Revises: c41f7e2a9d85
+Create Date: 2026-10-16 09:41:03.226915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b8d1c7f43'
+down_revision: Union[str, Sequence[str], None] = 'c41f7e2a9d85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the incremental aggregation watermark to view summaries."""
+    op.add_column('view_summaries', sa.Column('last_aggregated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove the incremental aggregation watermark."""
+    op.drop_column('view_summaries', 'last_aggregated_at')
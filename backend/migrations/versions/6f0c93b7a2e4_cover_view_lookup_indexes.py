@@ -0,0 +1,52 @@
+"""cover_view_lookup_indexes
+
+Revision ID: 6f0c93b7a2e4
+Revises: d3a85c6e1f29
+Create Date: 2026-10-16 17:31:52.207716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f0c93b7a2e4'
+down_revision: Union[str, Sequence[str], None] = 'd3a85c6e1f29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Replace the per-content view indexes with versions covering viewer_ip."""
+    # CONCURRENTLY cannot run inside a transaction; build the new index before dropping the old
+    with op.get_context().autocommit_block():
+        # Per-upload analytics: WHERE upload_id = ? [AND viewed_at >= ?], count(DISTINCT viewer_ip)
+        op.create_index(
+            'idx_file_views_upload_time_ip', 'file_views', ['upload_id', 'viewed_at'],
+            postgresql_include=['viewer_ip'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('idx_file_views_upload_time', 'file_views', postgresql_concurrently=True)
+        op.create_index(
+            'idx_profile_views_user_time_ip', 'profile_views', ['profile_user_id', 'viewed_at'],
+            postgresql_include=['viewer_ip'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('idx_profile_views_user_time', 'profile_views', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Restore the plain per-content view indexes."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_profile_views_user_time', 'profile_views', ['profile_user_id', 'viewed_at'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('idx_profile_views_user_time_ip', 'profile_views', postgresql_concurrently=True)
+        op.create_index(
+            'idx_file_views_upload_time', 'file_views', ['upload_id', 'viewed_at'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('idx_file_views_upload_time_ip', 'file_views', postgresql_concurrently=True)
@@ -15,18 +15,11 @@ branch_labels = None
 depends_on = None
 
 def upgrade() -> None:
-    # Add column only if it doesn't exist to be safe across diverged heads
-    conn = op.get_bind()
-    inspector = sa.inspect(conn)
-    columns = [c['name'] for c in inspector.get_columns('users')]
-    if 'default_image_effect' not in columns:
-        op.add_column('users', sa.Column('default_image_effect', sa.String(length=20), nullable=True))
+    # Add column only if it doesn't exist to be safe across diverged heads;
+    # IF NOT EXISTS checks server-side instead of fetching every column's metadata
+    op.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS default_image_effect VARCHAR(20)')
 
 
 def downgrade() -> None:
     # Drop column only if it exists
-    conn = op.get_bind()
-    inspector = sa.inspect(conn)
-    columns = [c['name'] for c in inspector.get_columns('users')]
-    if 'default_image_effect' in columns:
-        op.drop_column('users', 'default_image_effect')
+    op.execute('ALTER TABLE users DROP COLUMN IF EXISTS default_image_effect')
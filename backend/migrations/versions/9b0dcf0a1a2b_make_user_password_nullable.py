@@ -5,8 +5,11 @@ Revision ID: 9b0dcf0a1a2b
 Revises: 8f2c1f471b3a
 Create Date: 2025-09-21
 """
+import time
+
 from alembic import op
 import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
 
 # revision identifiers, used by Alembic.
 revision = '9b0dcf0a1a2b'
@@ -14,9 +17,49 @@ down_revision = '8f2c1f471b3a'
 branch_labels = None
 depends_on = None
 
+LOCK_RETRIES = 5
+LOCK_RETRY_DELAY = 1.0  # seconds
+LOCK_NOT_AVAILABLE = '55P03'  # SQLSTATE raised when lock_timeout expires
+
+
+def _with_lock_timeout(statement: str) -> None:
+    """
+    Run a DDL statement that needs a brief lock, retrying if the lock is contended.
+
+    A short lock_timeout keeps the ALTER from queueing behind a long-running
+    query and stalling every request that touches users in the meantime.
+    Must be called inside an autocommit block so each attempt is its own transaction.
+    """
+    conn = op.get_bind()
+    conn.execute(sa.text("SET lock_timeout = '2s'"))
+    try:
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                conn.execute(sa.text(statement))
+                return
+            except OperationalError as e:
+                # Only lock contention is worth waiting out; surface anything else now
+                if getattr(e.orig, 'pgcode', None) != LOCK_NOT_AVAILABLE or attempt == LOCK_RETRIES:
+                    raise
+                time.sleep(LOCK_RETRY_DELAY * attempt)
+    finally:
+        conn.execute(sa.text('RESET lock_timeout'))
+
+
 def upgrade() -> None:
-    op.alter_column('users', 'hashed_password', existing_type=sa.String(length=255), nullable=True)
+    # Dropping NOT NULL is metadata-only, but still needs ACCESS EXCLUSIVE for a moment
+    with op.get_context().autocommit_block():
+        _with_lock_timeout('ALTER TABLE users ALTER COLUMN hashed_password DROP NOT NULL')
 
 
 def downgrade() -> None:
-    op.alter_column('users', 'hashed_password', existing_type=sa.String(length=255), nullable=False)
+    # Each step commits on its own: NOT VALID skips the scan, VALIDATE checks rows
+    # without blocking writes, and SET NOT NULL reuses the validated check (PG 12+)
+    with op.get_context().autocommit_block():
+        _with_lock_timeout(
+            'ALTER TABLE users ADD CONSTRAINT users_hashed_password_not_null '
+            'CHECK (hashed_password IS NOT NULL) NOT VALID'
+        )
+        op.execute('ALTER TABLE users VALIDATE CONSTRAINT users_hashed_password_not_null')
+        _with_lock_timeout('ALTER TABLE users ALTER COLUMN hashed_password SET NOT NULL')
+        _with_lock_timeout('ALTER TABLE users DROP CONSTRAINT users_hashed_password_not_null')
@@ -0,0 +1,42 @@
+"""add_view_rollup_covering_indexes
+
+Revision ID: 9b6e4f0a2c17
+Revises: 5e2b8d1c7f43
+Create Date: 2026-10-16 14:22:09.604117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b6e4f0a2c17'
+down_revision: Union[str, Sequence[str], None] = '5e2b8d1c7f43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add covering indexes for the daily view rollups."""
+    # CONCURRENTLY cannot run inside a transaction; build without locking writes on Postgres
+    with op.get_context().autocommit_block():
+        # Rollup: WHERE viewed_at BETWEEN ? AND ? GROUP BY upload_id, count(DISTINCT viewer_ip)
+        op.create_index(
+            'ix_file_views_viewed_upload', 'file_views', ['viewed_at', 'upload_id'],
+            postgresql_include=['viewer_ip'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_profile_views_viewed_profile', 'profile_views', ['viewed_at', 'profile_user_id'],
+            postgresql_include=['viewer_ip'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Remove view rollup covering indexes."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_profile_views_viewed_profile', 'profile_views', postgresql_concurrently=True)
+        op.drop_index('ix_file_views_viewed_upload', 'file_views', postgresql_concurrently=True)
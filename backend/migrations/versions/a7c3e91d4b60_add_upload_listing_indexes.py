@@ -0,0 +1,42 @@
+"""add_upload_listing_indexes
+
+Revision ID: a7c3e91d4b60
+Revises: ef4d1a2bfa74
+Create Date: 2026-10-16 08:05:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e91d4b60'
+down_revision: Union[str, Sequence[str], None] = 'ef4d1a2bfa74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add composite indexes for upload dedup checks and per-user listings."""
+    # CONCURRENTLY cannot run inside a transaction; build without locking writes on Postgres
+    with op.get_context().autocommit_block():
+        # Dedup lookup: WHERE user_id = ? AND file_hash = ?
+        op.create_index(
+            'ix_uploads_user_hash', 'uploads', ['user_id', 'file_hash'],
+            postgresql_concurrently=True
+        )
+        # Listing: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        op.create_index(
+            'ix_uploads_user_created', 'uploads',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Remove upload listing indexes."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_uploads_user_created', 'uploads', postgresql_concurrently=True)
+        op.drop_index('ix_uploads_user_hash', 'uploads', postgresql_concurrently=True)
@@ -0,0 +1,38 @@
+"""unique_view_summary_lookup
+
+Revision ID: c41f7e2a9d85
+Revises: a7c3e91d4b60
+Create Date: 2026-10-16 09:12:27.510392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f7e2a9d85'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e91d4b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Make the view summary lookup index unique so aggregation can upsert."""
+    # Keep the newest row for any (content_type, content_id, date) duplicates
+    op.execute(
+        "DELETE FROM view_summaries a USING view_summaries b "
+        "WHERE a.content_type = b.content_type AND a.content_id = b.content_id "
+        "AND a.date = b.date AND a.id < b.id"
+    )
+    op.drop_index('idx_view_summary_lookup', 'view_summaries')
+    op.create_index(
+        'idx_view_summary_lookup', 'view_summaries', ['content_type', 'content_id', 'date'], unique=True
+    )
+
+
+def downgrade() -> None:
+    """Restore the non-unique view summary lookup index."""
+    op.drop_index('idx_view_summary_lookup', 'view_summaries')
+    op.create_index('idx_view_summary_lookup', 'view_summaries', ['content_type', 'content_id', 'date'])
@@ -0,0 +1,44 @@
+"""add_view_time_brin_indexes
+
+Revision ID: d3a85c6e1f29
+Revises: 9b6e4f0a2c17
+Create Date: 2026-10-16 16:48:27.913540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a85c6e1f29'
+down_revision: Union[str, Sequence[str], None] = '9b6e4f0a2c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add BRIN indexes on view timestamps."""
+    # CONCURRENTLY cannot run inside a transaction; build without locking writes on Postgres
+    with op.get_context().autocommit_block():
+        # Views are appended in viewed_at order, so block ranges map tightly to time ranges
+        op.create_index(
+            'idx_file_views_viewed_at_brin', 'file_views', ['viewed_at'],
+            postgresql_using='brin',
+            postgresql_with={'pages_per_range': 32},
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_profile_views_viewed_at_brin', 'profile_views', ['viewed_at'],
+            postgresql_using='brin',
+            postgresql_with={'pages_per_range': 32},
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Remove view timestamp BRIN indexes."""
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_profile_views_viewed_at_brin', 'profile_views', postgresql_concurrently=True)
+        op.drop_index('idx_file_views_viewed_at_brin', 'file_views', postgresql_concurrently=True)
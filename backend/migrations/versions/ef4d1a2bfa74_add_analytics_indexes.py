@@ -18,31 +18,55 @@ branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
-def upgrade() -> None:
-    """Add composite indexes for analytics tables to improve query performance."""
+# (name, table, columns)
+INDEXES = [
     # FileView indexes
-    op.create_index('idx_file_views_upload_time', 'file_views', ['upload_id', 'viewed_at'])
-    op.create_index('idx_file_views_ip_time', 'file_views', ['viewer_ip', 'viewed_at'])
-
+    ('idx_file_views_upload_time', 'file_views', ['upload_id', 'viewed_at']),
+    ('idx_file_views_ip_time', 'file_views', ['viewer_ip', 'viewed_at']),
     # ProfileView indexes
-    op.create_index('idx_profile_views_user_time', 'profile_views', ['profile_user_id', 'viewed_at'])
-    op.create_index('idx_profile_views_ip_time', 'profile_views', ['viewer_ip', 'viewed_at'])
-
+    ('idx_profile_views_user_time', 'profile_views', ['profile_user_id', 'viewed_at']),
+    ('idx_profile_views_ip_time', 'profile_views', ['viewer_ip', 'viewed_at']),
     # ViewSummary indexes
-    op.create_index('idx_view_summary_lookup', 'view_summaries', ['content_type', 'content_id', 'date'])
-    op.create_index('idx_view_summary_date', 'view_summaries', ['date', 'view_count'])
+    ('idx_view_summary_lookup', 'view_summaries', ['content_type', 'content_id', 'date']),
+    ('idx_view_summary_date', 'view_summaries', ['date', 'view_count']),
+]
+
+
+def _drop_if_invalid(name: str, table: str) -> None:
+    """Drop an index left INVALID by an interrupted concurrent build."""
+    invalid = op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).scalar()
+    if invalid:
+        op.drop_index(name, table, postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    """Add composite indexes for analytics tables to improve query performance."""
+    # CONCURRENTLY cannot run inside a transaction; build without locking writes on the
+    # live view tables. A failed concurrent build leaves an INVALID index behind that
+    # IF NOT EXISTS would keep, so drop those first; valid indexes are left alone.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            _drop_if_invalid(name, table)
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
 
 
 def downgrade() -> None:
     """Remove analytics indexes."""
-    # ViewSummary indexes
-    op.drop_index('idx_view_summary_date', 'view_summaries')
-    op.drop_index('idx_view_summary_lookup', 'view_summaries')
+    with op.get_context().autocommit_block():
+        # ViewSummary indexes
+        op.drop_index('idx_view_summary_date', 'view_summaries', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_view_summary_lookup', 'view_summaries', postgresql_concurrently=True, if_exists=True)
 
-    # ProfileView indexes
-    op.drop_index('idx_profile_views_ip_time', 'profile_views')
-    op.drop_index('idx_profile_views_user_time', 'profile_views')
+        # ProfileView indexes
+        op.drop_index('idx_profile_views_ip_time', 'profile_views', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_profile_views_user_time', 'profile_views', postgresql_concurrently=True, if_exists=True)
 
-    # FileView indexes
-    op.drop_index('idx_file_views_ip_time', 'file_views')
-    op.drop_index('idx_file_views_upload_time', 'file_views')
+        # FileView indexes
+        op.drop_index('idx_file_views_ip_time', 'file_views', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_file_views_upload_time', 'file_views', postgresql_concurrently=True, if_exists=True)
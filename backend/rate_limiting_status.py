@@ -7,11 +7,17 @@ Shows the current status of the rate limiting system.
 
 import sys
 import os
+from itertools import chain
 sys.path.append('/home/bulletdrop/bulletdrop/backend')
 
 from app.services.redis_service import redis_service
 from app.core.config import settings
 
+# Counter key shapes written by RateLimitMiddleware, matched server-side by SCAN
+RATE_LIMIT_PATTERNS = (
+    'auth:ip:*', 'api:ip:*', 'upload:ip:*', 'admin:ip:*', 'analytics:ip:*', 'user:*:1[mh]',
+)
+
 def show_rate_limiting_status():
     """Show comprehensive rate limiting status."""
     print("🛡️  BulletDrop Rate Limiting Status")
@@ -38,11 +44,15 @@ def show_rate_limiting_status():
     
     # Blocked IPs
     print("\\n🚫 Blocked IPs:")
-    blocked_keys = client.keys('rate_limit:blocked:*')
+    # Block keys as written by RateLimiter.block_ip
+    blocked_keys = list(client.scan_iter(match='blocked:ip:*', count=500))
     if blocked_keys:
+        # One pipelined round trip for all TTLs
+        pipe = client.pipeline(transaction=False)
         for key in blocked_keys:
-            ip = key.replace('rate_limit:blocked:', '')
-            ttl = client.ttl(key)
+            pipe.ttl(key)
+        for key, ttl in zip(blocked_keys, pipe.execute()):
+            ip = key.removeprefix('blocked:ip:')
             print(f"   {ip} (expires in {ttl}s)")
     else:
         print("   None")
@@ -58,16 +68,32 @@ def show_rate_limiting_status():
     
     # Active rate limits
     print("\\n📊 Active Rate Limit Counters:")
-    rate_keys = client.keys('rate_limit:*')
-    rate_keys = [k for k in rate_keys if not k.startswith('rate_limit:whitelist') and not k.startswith('rate_limit:blocked')]
+    # SCAN instead of KEYS so the shared limiter Redis is never blocked, with
+    # MATCH doing the filtering; only the first 10 are shown, so stop once an
+    # 11th proves there are more
+    rate_keys = []
+    for key in chain.from_iterable(
+        client.scan_iter(match=pattern, count=500) for pattern in RATE_LIMIT_PATTERNS
+    ):
+        rate_keys.append(key)
+        if len(rate_keys) > 10:
+            break
     
     if rate_keys:
-        for key in rate_keys[:10]:  # Show first 10
-            count = client.zcard(key)
-            ttl = client.ttl(key)
-            print(f"   {key}: {count} requests (TTL: {ttl}s)")
+        shown = rate_keys[:10]  # Show first 10
+        pipe = client.pipeline(transaction=False)
+        for key in shown:
+            # Auth counters are sliding-window sorted sets
+            if key.startswith('auth:'):
+                pipe.zcard(key)
+            else:
+                pipe.get(key)
+            pipe.ttl(key)
+        results = pipe.execute()
+        for key, count, ttl in zip(shown, results[::2], results[1::2]):
+            print(f"   {key}: {count or 0} requests (TTL: {ttl}s)")
         if len(rate_keys) > 10:
-            print(f"   ... and {len(rate_keys) - 10} more")
+            print("   ... and more")
     else:
         print("   None")
     
@@ -14,6 +14,7 @@ sys.path.append('/home/bulletdrop/bulletdrop/backend')
 
 from app.services.redis_service import redis_service
 from app.core.config import settings
+from app.middleware.rate_limit import BLOCKED_INDEX_KEY
 
 def get_blocked_ips():
     """Get all currently blocked IPs"""
@@ -23,13 +24,19 @@ def get_blocked_ips():
             print("❌ Redis not available")
             return []
         
-        blocked_keys = client.keys('rate_limit:blocked:*')
+        # Block keys as written by RateLimiter.block_ip
+        blocked_keys = list(client.scan_iter(match='blocked:ip:*', count=500))
         blocked_ips = []
         
-        print("🚫 Currently blocked IPs:")
+        # One pipelined round trip for all TTLs
+        pipe = client.pipeline(transaction=False)
         for key in blocked_keys:
-            ip = key.replace('rate_limit:blocked:', '')
-            ttl = client.ttl(key)
+            pipe.ttl(key)
+        ttls = pipe.execute() if blocked_keys else []
+        
+        print("🚫 Currently blocked IPs:")
+        for key, ttl in zip(blocked_keys, ttls):
+            ip = key.removeprefix('blocked:ip:')
             blocked_ips.append(ip)
             print(f"   {ip} (expires in {ttl} seconds)")
         
@@ -49,14 +56,23 @@ def unblock_ip(ip):
             print("❌ Redis not available")
             return False
         
-        # Remove from blocked list
-        key = f'rate_limit:blocked:{ip}'
-        removed = client.delete(key)
+        # Remove the block and drop it from the index the middleware's
+        # blocked-IP cache reloads from
+        pipe = client.pipeline(transaction=False)
+        pipe.delete(f'blocked:ip:{ip}')
+        pipe.zrem(BLOCKED_INDEX_KEY, ip)
+        removed, _ = pipe.execute()
         
-        # Clear rate limit counters for this IP
-        rate_keys = client.keys(f'rate_limit:*:{ip}:*')
-        if rate_keys:
-            client.delete(*rate_keys)
+        # Clear the IP's per-category counters (e.g. api:ip:<ip>:1m), deleting
+        # in SCAN-sized batches
+        batch = []
+        for rate_key in client.scan_iter(match=f'*:ip:{ip}:1[mh]', count=500):
+            batch.append(rate_key)
+            if len(batch) >= 500:
+                client.delete(*batch)
+                batch.clear()
+        if batch:
+            client.delete(*batch)
         
         if removed:
             print(f"✅ Unblocked IP: {ip}")
@@ -84,6 +100,21 @@ def add_to_whitelist(ip):
         print(f"❌ Error adding IP to whitelist: {e}")
         return False
 
+def add_many_to_whitelist(ips):
+    """Add several IPs to the whitelist with one variadic SADD"""
+    try:
+        client = redis_service.client
+        if not client:
+            print("❌ Redis not available")
+            return False
+        
+        added = client.sadd('rate_limit:whitelist', *ips)
+        print(f"✅ Added {added} new IP(s) to whitelist ({len(ips) - added} already present)")
+        return True
+    except Exception as e:
+        print(f"❌ Error adding IPs to whitelist: {e}")
+        return False
+
 def get_whitelist():
     """Get all whitelisted IPs"""
     try:
@@ -92,30 +123,52 @@ def get_whitelist():
             print("❌ Redis not available")
             return []
         
-        whitelist = client.smembers('rate_limit:whitelist')
+        # SSCAN streams the set in chunks instead of one large SMEMBERS reply
+        whitelist = []
         print("✅ Whitelisted IPs:")
-        for ip in whitelist:
+        for ip in client.sscan_iter('rate_limit:whitelist', count=500):
+            whitelist.append(ip)
             print(f"   {ip}")
         
         if not whitelist:
             print("   No IPs in whitelist")
             
-        return list(whitelist)
+        return whitelist
     except Exception as e:
         print(f"❌ Error getting whitelist: {e}")
         return []
 
+IP_CACHE_PATH = os.path.expanduser('~/.cache/bulletdrop/external_ip')
+IP_CACHE_TTL = 300  # seconds
+
 def get_current_ip():
-    """Try to detect current IP"""
+    """Try to detect current IP (external lookups are cached on disk for IP_CACHE_TTL)"""
     import socket
-    import requests
+    import time
+    from urllib.request import urlopen
+    
+    try:
+        if time.time() - os.path.getmtime(IP_CACHE_PATH) < IP_CACHE_TTL:
+            with open(IP_CACHE_PATH) as f:
+                cached = f.read().strip()
+            if cached:
+                return cached
+    except OSError:
+        pass
     
     try:
         # Try to get external IP
-        response = requests.get('https://ipinfo.io/ip', timeout=5)
-        if response.status_code == 200:
-            return response.text.strip()
-    except:
+        with urlopen('https://ipinfo.io/ip', timeout=5) as response:
+            if response.status == 200:
+                ip = response.read().decode().strip()
+                try:
+                    os.makedirs(os.path.dirname(IP_CACHE_PATH), exist_ok=True)
+                    with open(IP_CACHE_PATH, 'w') as f:
+                        f.write(ip)
+                except OSError:
+                    pass
+                return ip
+    except Exception:
         pass
     
     try:
@@ -142,7 +195,7 @@ def main():
         
         print("\\n📋 Commands:")
         print(f"  python3 {sys.argv[0]} unblock <ip>     - Unblock an IP")
-        print(f"  python3 {sys.argv[0]} whitelist <ip>   - Add IP to whitelist")
+        print(f"  python3 {sys.argv[0]} whitelist <ip>...  - Add IP(s) to whitelist")
         print(f"  python3 {sys.argv[0]} unblock-me      - Unblock your current IP")
         print(f"  python3 {sys.argv[0]} whitelist-me    - Whitelist your current IP")
         
@@ -153,6 +206,8 @@ def main():
             unblock_ip(sys.argv[2])
         elif command == "whitelist" and len(sys.argv) == 3:
             add_to_whitelist(sys.argv[2])
+        elif command == "whitelist" and len(sys.argv) > 3:
+            add_many_to_whitelist(sys.argv[2:])
         elif command == "unblock-me":
             current_ip = get_current_ip()
             print(f"🌐 Detected IP: {current_ip}")